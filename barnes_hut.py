@@ -0,0 +1,206 @@
+import numpy as np
+import forces
+
+THETA = 0.5  # default opening angle
+MAX_DEPTH = 16  # 3 bits per level of the morton code, 48 bits in total
+
+
+def morton_codes(cells):
+    """
+        Interleaves the bits of integer cell coordinates
+
+        Returns:
+        array with one morton code per row of cells
+    """
+
+    codes = np.zeros(len(cells), dtype=np.int64)
+    for bit in range(MAX_DEPTH):
+        for axis in range(3):
+            codes |= ((cells[:, axis] >> bit) & 1) << (3 * bit + axis)
+    return codes
+
+
+class Octree:
+    """
+        Octree over the bodies built from their morton codes.
+        Every node stores the range of bodies it contains
+        in the sorted order, its total mass, centre of mass and width
+    """
+
+    def __init__(self, pos, mass):
+        n = len(mass)
+        lower = pos.min(axis=0)
+        size = (pos.max(axis=0) - lower).max()
+        if size == 0:
+            size = 1.0
+        # small margin so the furthest body stays inside the root cube
+        size *= 1 + 1e-9
+        ncells = 2 ** MAX_DEPTH
+        cells = np.minimum(((pos - lower) / size * ncells).astype(np.int64),
+                           ncells - 1)
+        codes = morton_codes(cells)
+        self.order = np.argsort(codes, kind='stable')
+        # rank of every body in the sorted order
+        self.rank = np.empty(n, dtype=np.int64)
+        self.rank[self.order] = np.arange(n)
+        codes = codes[self.order]
+        sorted_mass = mass[self.order]
+        sorted_moment = sorted_mass[:, np.newaxis] * pos[self.order]
+        sorted_pos = pos[self.order]
+
+        first, count, width, level_start = [], [], [], []
+        # bodies that share a node with another body at the current level
+        active = np.arange(n)
+        nnodes = 0
+        for level in range(MAX_DEPTH + 1):
+            if len(active) == 0:
+                break
+            keys = codes[active] >> (3 * (MAX_DEPTH - level))
+            starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+            counts = np.diff(np.r_[starts, len(active)])
+            level_start.append(nnodes)
+            nnodes += len(starts)
+            first.append(active[starts])
+            count.append(counts)
+            width.append(np.full(len(starts), size / 2 ** level))
+            # only nodes with more than one body are split further
+            active = active[np.repeat(counts > 1, counts)]
+        level_start.append(nnodes)
+
+        self.first = np.concatenate(first)
+        self.count = np.concatenate(count)
+        self.width = np.concatenate(width)
+        self.mass = self._range_sum(sorted_mass)
+        moment = self._range_sum(sorted_moment)
+        centre = self._range_sum(sorted_pos) / self.count[:, np.newaxis]
+        # nodes without mass fall back to their geometric centre
+        massive = self.mass > 0
+        self.com = centre
+        self.com[massive] = moment[massive] / self.mass[massive, np.newaxis]
+
+        # children of a node are the nodes of the next level
+        # whose first body lies inside its range
+        self.child_start = np.zeros(nnodes, dtype=np.int64)
+        self.child_count = np.zeros(nnodes, dtype=np.int64)
+        for level in range(len(level_start) - 2):
+            parents = slice(level_start[level], level_start[level + 1])
+            children = self.first[level_start[level + 1]:
+                                  level_start[level + 2]]
+            lo = np.searchsorted(children, self.first[parents])
+            hi = np.searchsorted(children,
+                                 self.first[parents] + self.count[parents])
+            self.child_start[parents] = lo + level_start[level + 1]
+            self.child_count[parents] = hi - lo
+
+    def _range_sum(self, values):
+        """Sums the sorted values over the body range of every node"""
+
+        cumulative = np.concatenate([np.zeros((1,) + values.shape[1:]),
+                                     np.cumsum(values, axis=0)])
+        return cumulative[self.first + self.count] - cumulative[self.first]
+
+    def accelerations(self, pos, mass, G, theta, targets, softening=0.0):
+        """
+            Walks the tree for all the targets at once, one level of
+            (target, node) pairs at a time. A node is used as a point mass
+            if its width over its distance is below theta
+
+            Returns:
+            (len(targets), 3) array with the acceleration of each target
+        """
+
+        acc = np.zeros((len(targets), 3))
+        # pairs of (index into targets, node), starting at the root
+        pair_target = np.arange(len(targets))
+        pair_node = np.zeros(len(targets), dtype=np.int64)
+        while len(pair_node):
+            bodies = targets[pair_target]
+            r_vec = self.com[pair_node] - pos[bodies]
+            r_sq = np.einsum('ij,ij->i', r_vec, r_vec)
+            rank = self.rank[bodies]
+            contains = (self.first[pair_node] <= rank) & \
+                       (rank < self.first[pair_node] + self.count[pair_node])
+            leaf = self.child_count[pair_node] == 0
+            far = self.width[pair_node] ** 2 < theta ** 2 * r_sq
+            accept = ~contains & (leaf | far)
+
+            node_mass = self.mass[pair_node]
+            # a leaf at the maximum depth can hold more bodies than the
+            # target itself, they act as a point mass without the target
+            shared = contains & leaf & (self.count[pair_node] > 1)
+            if shared.any():
+                rest = node_mass[shared] - mass[bodies[shared]]
+                rest_moment = self.com[pair_node[shared]] * \
+                    node_mass[shared, np.newaxis] - \
+                    pos[bodies[shared]] * mass[bodies[shared], np.newaxis]
+                safe = np.where(rest > 0, rest, 1)
+                r_vec[shared] = rest_moment / safe[:, np.newaxis] - \
+                    pos[bodies[shared]]
+                r_sq[shared] = np.einsum('ij,ij->i', r_vec[shared],
+                                         r_vec[shared])
+                node_mass = node_mass.copy()
+                node_mass[shared] = rest
+                accept |= shared & (rest > 0)
+
+            weights = G * node_mass[accept] * \
+                (r_sq[accept] + softening ** 2) ** -1.5
+            contribution = weights[:, np.newaxis] * r_vec[accept]
+            for axis in range(3):
+                acc[:, axis] += np.bincount(pair_target[accept],
+                                            weights=contribution[:, axis],
+                                            minlength=len(targets))
+
+            # every other pair with children is replaced by its children
+            opened = ~accept & ~leaf
+            nchildren = self.child_count[pair_node[opened]]
+            pair_target = np.repeat(pair_target[opened], nchildren)
+            offsets = np.arange(nchildren.sum()) - \
+                np.repeat(np.cumsum(nchildren) - nchildren, nchildren)
+            pair_node = np.repeat(self.child_start[pair_node[opened]],
+                                  nchildren) + offsets
+        return acc
+
+
+def tree_accelerations(pos, mass, G, targets=None, theta=THETA,
+                       softening=0.0):
+    """
+        Calculates the gravitational acceleration of the target bodies
+        with a Barnes-Hut octree rebuilt from the current positions
+
+        Returns:
+        (len(targets), 3) array with the acceleration of each target,
+        every body is a target if targets is None
+    """
+
+    if targets is None:
+        targets = np.arange(len(mass))
+    if len(mass) == 0:
+        return np.zeros((len(targets), 3))
+    tree = Octree(pos, mass)
+    return tree.accelerations(pos, mass, G, theta, targets, softening)
+
+
+def force_error(pos, mass, G, theta=THETA, sample=None, seed=0,
+                softening=0.0):
+    """
+        Compares the tree accelerations with the direct sum.
+        For large systems a random sample of bodies can be checked
+
+        Returns:
+        dictionary with the mean, rms, 99th percentile and maximum
+        relative error of the acceleration
+    """
+
+    targets = np.arange(len(mass))
+    if sample is not None and sample < len(mass):
+        rng = np.random.default_rng(seed)
+        targets = np.sort(rng.choice(len(mass), sample, replace=False))
+    tree = tree_accelerations(pos, mass, G, targets, theta, softening)
+    direct = forces.direct_accelerations(pos, mass, G, targets, softening)
+    direct_mag = np.linalg.norm(direct, axis=1)
+    error = np.linalg.norm(tree - direct, axis=1) / \
+        np.where(direct_mag > 0, direct_mag, 1)
+    return {'mean': error.mean(),
+            'rms': np.sqrt((error ** 2).mean()),
+            'p99': np.percentile(error, 99),
+            'max': error.max()}
@@ -0,0 +1,453 @@
+import argparse
+import itertools
+import json
+import math
+import os
+import platform
+import time
+import tracemalloc
+import numpy as np
+import engine
+import forces
+import generators
+import integrators
+import particle_mesh
+
+# time steps tried for every integrator
+TIMESTEPS = [3.2, 1.6, 0.8, 0.4, 0.2, 0.1, 0.05, 0.025]
+SIM_TIME = 100  # simulated time of each run
+ENERGY_SAMPLES = 50  # times the energy is checked during a run
+
+# scaling benchmark
+SIZES = [10, 100, 1000, 10000]  # bodies in the generated systems
+SEED = 0  # seed of the generated systems, the same for every run
+MIN_STEPS = 10  # steps timed for every run at least
+MIN_WALL = 1.0  # seconds timed for every run at least
+REFERENCE_MAX_N = 1000  # largest system run with the python loop
+REGRESSION = 0.2  # fraction of the baseline steps/s that may be lost
+
+# particle-mesh comparison
+MESH_SIZES = [1000, 10000, 100000]  # bodies in the generated disks
+MESH_GRIDS = [32, 64, 128]  # cells per side tried at every size
+ERROR_SAMPLE = 1000  # bodies whose force is checked against the direct sum
+
+
+def default_system(nplanets, integrator, dt):
+    """
+        Builds the system that the ADD PLANET button makes: the sun
+        and planets on circular orbits one sun radius apart
+
+        Returns:
+        engine with the bodies added
+    """
+
+    system = engine.PhysicsEngine(dt=dt, integrator=integrator)
+    sunradius = system.SUN['RADIUS']
+    sunmass = system.SUN['MASS']
+    system.add_body([0, 0, 0], [0, 0, 0], sunmass, sunradius)
+    for index in range(1, nplanets + 1):
+        xpos = sunradius * (index + 1)
+        zvelocity = np.sqrt((system.G * sunmass) / xpos)
+        system.add_body([xpos, 0, 0], [0, 0, zvelocity], 0.01, 1)
+    return system
+
+
+def run_integrator(name, dt, nplanets=3, sim_time=SIM_TIME):
+    """
+        Runs one integrator for sim_time, timing only the steps
+
+        Returns:
+        dictionary with the wall time and the maximum relative energy error
+    """
+
+    system = default_system(nplanets, name, dt)
+    energy0 = system.energy()
+    nsteps = int(round(sim_time / dt))
+    check = max(1, nsteps // ENERGY_SAMPLES)
+    wall = 0.0
+    error = 0.0
+    done = 0
+    while done < nsteps:
+        block = min(check, nsteps - done)
+        start = time.perf_counter()
+        for _ in range(block):
+            system.step()
+        wall += time.perf_counter() - start
+        done += block
+        error = max(error, abs((system.energy() - energy0) / energy0))
+    return {'integrator': name, 'dt': dt, 'steps': nsteps,
+            'wall': wall, 'energy_error': error}
+
+
+def integrator_benchmark(nplanets=3, sim_time=SIM_TIME, timesteps=TIMESTEPS):
+    """
+        Runs every integrator at every time step
+
+        Returns:
+        list of result dictionaries
+    """
+
+    results = []
+    for name in integrators.INTEGRATORS:
+        for dt in timesteps:
+            results.append(run_integrator(name, dt, nplanets, sim_time))
+    return results
+
+
+def cheapest(results, tolerance):
+    """
+        Finds the run with the least wall time whose
+        energy error stays below the tolerance
+
+        Returns:
+        result dictionary, or None if no run is accurate enough
+    """
+
+    accurate = [r for r in results if r['energy_error'] <= tolerance]
+    if not accurate:
+        return None
+    return min(accurate, key=lambda r: r['wall'])
+
+
+def reference_step(pos, mom, mass, G, dt):
+    """
+        One step of the original loop of SolarSystem.run with
+        calculate_gforce, in plain python on lists of [x, y, z].
+        Bodies are updated one after the other, each seeing the new
+        positions of the bodies before it, as in the original
+
+        Returns:
+        None, pos and mom are changed in place
+    """
+
+    n = len(mass)
+    for i in range(n):
+        fx = fy = fz = 0.0
+        for j in range(n):
+            if i != j:
+                # force exerted on i by j, as in calculate_gforce
+                rx = pos[i][0] - pos[j][0]
+                ry = pos[i][1] - pos[j][1]
+                rz = pos[i][2] - pos[j][2]
+                r_mag = math.sqrt(rx * rx + ry * ry + rz * rz)
+                force_mag = G * mass[i] * mass[j] / r_mag ** 2
+                fx -= force_mag * rx / r_mag
+                fy -= force_mag * ry / r_mag
+                fz -= force_mag * rz / r_mag
+        mom[i][0] += fx * dt
+        mom[i][1] += fy * dt
+        mom[i][2] += fz * dt
+        pos[i][0] += mom[i][0] * dt / mass[i]
+        pos[i][1] += mom[i][1] * dt / mass[i]
+        pos[i][2] += mom[i][2] * dt / mass[i]
+
+
+class ReferenceSystem:
+    """
+        Runs reference_step on a copy of the state of an engine,
+        with the step and energy methods the benchmark uses
+    """
+
+    def __init__(self, system):
+        self.system = system
+        self.pos = system.pos.tolist()
+        self.mom = system.mom.tolist()
+        self.mass = system.mass.tolist()
+
+    def step(self):
+        reference_step(self.pos, self.mom, self.mass,
+                       self.system.G, self.system.DELTA_TIME)
+
+    def energy(self):
+        self.system.set_state(np.array(self.pos), np.array(self.mom))
+        return self.system.energy()
+
+
+def backends(workers=None):
+    """
+        Force backends of the scaling benchmark: the python reference,
+        every solver of the engine and the threaded direct sum
+
+        Returns:
+        list of (name, solver, workers), solver None for the reference
+    """
+
+    workers = workers or os.cpu_count() or 1
+    names = [('reference', None, 1)]
+    names += [(solver, solver, 1) for solver in engine.PhysicsEngine.SOLVERS]
+    if workers > 1:
+        names.append(('direct-threaded', 'direct', workers))
+    return names
+
+
+def run_scaling(n, backend, integrator, precision='float64'):
+    """
+        Times one generated system of n bodies for at least MIN_STEPS
+        steps and MIN_WALL seconds, with the energy drift over the
+        first MIN_STEPS steps, then measures the peak memory of one
+        more step with tracemalloc
+
+        Returns:
+        result dictionary with steps_per_s, peak_mb, bytes_per_body
+        of the state arrays and energy_drift
+    """
+
+    name, solver, workers = backend
+    system = generators.generate_system('disk', n - 1, seed=SEED,
+                                        solver=solver or 'direct',
+                                        integrator=integrator,
+                                        workers=workers,
+                                        precision=precision)
+    runner = system if solver is not None else ReferenceSystem(system)
+    energy0 = runner.energy()
+    start = time.perf_counter()
+    for _ in range(MIN_STEPS):
+        runner.step()
+    wall = time.perf_counter() - start
+    # the drift is always taken after MIN_STEPS so runs can be compared
+    drift = abs((runner.energy() - energy0) / energy0)
+    steps = MIN_STEPS
+    start = time.perf_counter()
+    while wall + time.perf_counter() - start < MIN_WALL:
+        runner.step()
+        steps += 1
+    wall += time.perf_counter() - start
+
+    tracemalloc.start()
+    runner.step()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    if system.kernel_pool is not None:
+        system.kernel_pool.shutdown()
+    return {'n': n, 'backend': name, 'integrator': integrator,
+            'precision': precision, 'steps': steps, 'wall': wall,
+            'steps_per_s': steps / wall, 'peak_mb': peak / 2 ** 20,
+            'bytes_per_body': system.state_bytes() / len(system),
+            'energy_drift': drift}
+
+
+def scaling_benchmark(sizes=SIZES, backend_names=None, integrator_names=None,
+                      workers=None, precisions=('float64',)):
+    """
+        Runs every backend with every integrator at every size and in
+        every precision. The reference loop only runs with euler-cromer,
+        the integrator it implements, in float64 and up to
+        REFERENCE_MAX_N bodies
+
+        Returns:
+        list of result dictionaries
+    """
+
+    results = []
+    for n in sizes:
+        for backend in backends(workers):
+            if backend_names and backend[0] not in backend_names:
+                continue
+            for integrator, precision in itertools.product(
+                    integrator_names or integrators.INTEGRATORS, precisions):
+                if backend[1] is None and (integrator != 'euler-cromer' or
+                                           precision != 'float64' or
+                                           n > REFERENCE_MAX_N):
+                    continue
+                result = run_scaling(n, backend, integrator, precision)
+                print('{n:>7} {backend:<16}{integrator:<16}{precision:<8}'
+                      '{steps_per_s:>12.2f} steps/s {peak_mb:>9.2f} MB '
+                      '{bytes_per_body:>5.0f} B/body '
+                      '{energy_drift:>11.3e}'.format(**result))
+                results.append(result)
+    return results
+
+
+def save_scaling(path, results):
+    """Writes the results with the machine they were measured on"""
+
+    with open(path, 'w') as f:
+        json.dump({'machine': {'python': platform.python_version(),
+                               'numpy': np.__version__,
+                               'platform': platform.platform(),
+                               'cpus': os.cpu_count()},
+                   'results': results}, f, indent=1)
+
+
+def compare_baseline(results, path, tolerance=REGRESSION):
+    """
+        Compares steps/s with a results file saved earlier,
+        matching the runs by size, backend, integrator and precision
+
+        Returns:
+        list of (result, baseline steps/s) for the runs that
+        lost more than the tolerance
+    """
+
+    with open(path) as f:
+        baseline = {(r['n'], r['backend'], r['integrator'],
+                     r.get('precision', 'float64')): r['steps_per_s']
+                    for r in json.load(f)['results']}
+    regressions = []
+    for r in results:
+        before = baseline.get((r['n'], r['backend'], r['integrator'],
+                               r['precision']))
+        if before is None:
+            continue
+        print('{n:>7} {backend:<16}{integrator:<16}{precision:<8}'
+              .format(**r) +
+              '{:>8.2f}x baseline'.format(r['steps_per_s'] / before))
+        if r['steps_per_s'] < (1 - tolerance) * before:
+            regressions.append((r, before))
+    return regressions
+
+
+def timed(function, *args, **kwargs):
+    """
+        Returns:
+        seconds the call took, at least MIN_WALL in total over repeats
+    """
+
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        function(*args, **kwargs)
+        calls += 1
+        wall = time.perf_counter() - start
+        if wall >= MIN_WALL:
+            return wall / calls
+
+
+def mesh_benchmark(sizes=MESH_SIZES, grids=MESH_GRIDS):
+    """
+        Force error and time of one force evaluation of the particle-mesh
+        on generated disks, with and without the short range sum, against
+        the direct sum. The direct sum is timed on ERROR_SAMPLE targets
+        and scaled to every body, it takes too long on the large disks
+
+        Returns:
+        list of result dictionaries
+    """
+
+    results = []
+    for n in sizes:
+        system = generators.generate_system('disk', n - 1, seed=SEED)
+        pos, mass, G = system.pos, system.mass, system.G
+        sample = np.arange(0, n, max(1, n // ERROR_SAMPLE))
+        direct = timed(forces.direct_accelerations, pos, mass, G, sample) * \
+            n / len(sample)
+        for grid in grids:
+            for short_range in (False, True):
+                try:
+                    error = particle_mesh.force_error(
+                        pos, mass, G, grid, ERROR_SAMPLE, SEED,
+                        short_range=short_range)
+                except ValueError:
+                    # the mesh is too coarse for the near pairs
+                    continue
+                wall = timed(particle_mesh.mesh_accelerations, pos, mass, G,
+                             grid=grid, short_range=short_range)
+                result = {'n': n, 'grid': grid, 'short_range': short_range,
+                          'mesh_s': wall, 'direct_s': direct,
+                          'speedup': direct / wall,
+                          'rms_error': error['rms'], 'max_error': error['max']}
+                print('{n:>7} {grid:>5} {short_range!s:<6}{mesh_s:>10.4f} s '
+                      '{speedup:>9.1f}x direct {rms_error:>11.3e} rms '
+                      '{max_error:>11.3e} max'.format(**result))
+                results.append(result)
+    return results
+
+
+def print_results(results):
+    """Prints the results as a table"""
+
+    print('{:<14}{:>8}{:>8}{:>11}{:>14}{:>16}'.format(
+        'integrator', 'dt', 'steps', 'wall [s]', 'energy error',
+        'error * wall'))
+    for r in results:
+        print('{:<14}{:>8}{:>8}{:>11.4f}{:>14.3e}{:>16.3e}'.format(
+            r['integrator'], r['dt'], r['steps'], r['wall'],
+            r['energy_error'], r['energy_error'] * r['wall']))
+
+
+def main_scaling(args):
+    results = scaling_benchmark(args.sizes, args.backends, args.integrators,
+                                args.workers, args.precisions)
+    save_scaling(args.output, results)
+    print(len(results), 'runs written to', args.output)
+    if args.baseline:
+        if not os.path.exists(args.baseline):
+            save_scaling(args.baseline, results)
+            print('Baseline saved to', args.baseline)
+            return
+        regressions = compare_baseline(results, args.baseline,
+                                       args.regression)
+        for r, before in regressions:
+            print('REGRESSION {n} {backend} {integrator} {precision}: '
+                  '{steps_per_s:.2f}'
+                  .format(**r), 'steps/s, baseline {:.2f}'.format(before))
+        if regressions:
+            raise SystemExit(1)
+
+
+def main_mesh(args):
+    results = mesh_benchmark(args.sizes, args.grids)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=1)
+    print(len(results), 'runs written to', args.output)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Energy error against wall time for every integrator, '
+                    'or steps/s against the number of bodies with the '
+                    'scaling command')
+    parser.add_argument('--planets', type=int, default=3)
+    parser.add_argument('--time', type=float, default=SIM_TIME,
+                        help='simulated time of each run')
+    parser.add_argument('--tolerance', type=float, default=1e-4,
+                        help='maximum relative energy error')
+    commands = parser.add_subparsers(dest='command')
+    scaling = commands.add_parser(
+        'scaling', help='steps/s, peak memory and energy drift of '
+                        'generated systems for every backend and integrator')
+    scaling.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    scaling.add_argument('--backends', nargs='+',
+                         help='backends to run, all by default')
+    scaling.add_argument('--integrators', nargs='+',
+                         choices=list(integrators.INTEGRATORS))
+    scaling.add_argument('--precisions', nargs='+', default=['float64'],
+                         choices=list(engine.PhysicsEngine.PRECISIONS),
+                         help='floating point types of the state arrays')
+    scaling.add_argument('--workers', type=int,
+                         help='threads of the threaded backend, '
+                              'all the cores by default')
+    scaling.add_argument('--output', default='benchmark.json')
+    scaling.add_argument('--baseline',
+                         help='results to compare with, saved there '
+                              'if the file does not exist yet')
+    scaling.add_argument('--regression', type=float, default=REGRESSION,
+                         help='fraction of the baseline steps/s that may '
+                              'be lost before the run fails')
+    mesh = commands.add_parser(
+        'mesh', help='force error and time of the particle-mesh solver '
+                     'against the direct sum')
+    mesh.add_argument('--sizes', type=int, nargs='+', default=MESH_SIZES)
+    mesh.add_argument('--grids', type=int, nargs='+', default=MESH_GRIDS)
+    mesh.add_argument('--output', default='mesh_benchmark.json')
+    args = parser.parse_args()
+    if args.command == 'scaling':
+        main_scaling(args)
+        return
+    if args.command == 'mesh':
+        main_mesh(args)
+        return
+
+    results = integrator_benchmark(args.planets, args.time)
+    print_results(results)
+    best = cheapest(results, args.tolerance)
+    if best is None:
+        print('No integrator reaches a relative energy error of',
+              args.tolerance)
+    else:
+        print('Cheapest below {}: {} with dt {}'.format(
+            args.tolerance, best['integrator'], best['dt']))
+
+
+if __name__ == '__main__':
+    main()
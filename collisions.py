@@ -0,0 +1,328 @@
+import numpy as np
+import forces
+
+# bodies this many times larger than the median radius are checked
+# against every body, so one big sun does not make the cells huge
+BIG_FACTOR = 4
+# the 13 neighbouring cells in one half of the space, the other half
+# is covered by the same pairs seen from the other cell
+HALF_NEIGHBOURS = np.array([(dx, dy, dz)
+                            for dx in (-1, 0, 1)
+                            for dy in (-1, 0, 1)
+                            for dz in (-1, 0, 1)
+                            if (dx, dy, dz) > (0, 0, 0)])
+# all 27 cells around a cell, for the bodies that are not in the hash
+NEIGHBOURS = np.array([(dx, dy, dz)
+                       for dx in (-1, 0, 1)
+                       for dy in (-1, 0, 1)
+                       for dz in (-1, 0, 1)])
+# primes of the spatial hash, Teschner et al. 2003
+PRIMES = np.array([73856093, 19349663, 83492791], dtype=np.int64)
+
+
+def cell_hash(cells):
+    """
+        Hash of integer cell coordinates, different cells may share
+        a hash, which only adds candidates that the exact test removes
+
+        Returns:
+        array of int64 keys
+    """
+
+    keys = cells * PRIMES
+    return keys[..., 0] ^ keys[..., 1] ^ keys[..., 2]
+
+
+def candidate_pairs(pos, radius):
+    """
+        Pairs of bodies that may overlap: small bodies in the same or
+        neighbouring cells of a spatial hash with cells one small body
+        diameter wide, and every big body with every other body.
+        Bodies without a radius are left out of the hash, as they never
+        touch each other, and only look up the cells around them
+
+        Returns:
+        tuple of index arrays (i, j) with i < j, hash collisions and
+        big bodies can give a pair more than once
+    """
+
+    n = len(radius)
+    sized = radius > 0
+    if n < 2 or not sized.any():
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+    big = radius > BIG_FACTOR * np.median(radius[sized])
+    hashed = np.flatnonzero(~big & sized)
+    points = np.flatnonzero(~sized)
+    firsts = []
+    seconds = []
+
+    if len(hashed):
+        cell_size = 2 * radius[hashed].max()
+        cells = np.floor(pos[hashed] / cell_size).astype(np.int64)
+        keys = cell_hash(cells)
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        bodies = hashed[order]
+        # bodies of the same cell against each other
+        ends = np.searchsorted(sorted_keys, sorted_keys, side='right')
+        rank = np.arange(len(bodies))
+        i, j = expand(rank + 1, ends)
+        firsts.append(bodies[i])
+        seconds.append(bodies[j])
+        # and against the bodies of the neighbouring cells
+        for offset in HALF_NEIGHBOURS:
+            neighbour = cell_hash(cells[order] + offset)
+            i, j = expand(np.searchsorted(sorted_keys, neighbour, 'left'),
+                          np.searchsorted(sorted_keys, neighbour, 'right'))
+            firsts.append(bodies[i])
+            seconds.append(bodies[j])
+        # bodies without a radius against the hashed bodies around them
+        point_cells = np.floor(pos[points] / cell_size).astype(np.int64)
+        for offset in NEIGHBOURS:
+            neighbour = cell_hash(point_cells + offset)
+            i, j = expand(np.searchsorted(sorted_keys, neighbour, 'left'),
+                          np.searchsorted(sorted_keys, neighbour, 'right'))
+            firsts.append(points[i])
+            seconds.append(bodies[j])
+
+    for index in np.flatnonzero(big):
+        others = np.arange(n)
+        others = others[others != index]
+        firsts.append(np.full(len(others), index))
+        seconds.append(others)
+
+    i = np.concatenate(firsts)
+    j = np.concatenate(seconds)
+    keep = i != j
+    return np.minimum(i, j)[keep], np.maximum(i, j)[keep]
+
+
+def expand(starts, ends):
+    """
+        Pairs of every row with each position in its range [start, end)
+        of the sorted bodies, without a python loop over the rows
+
+        Returns:
+        tuple of arrays (row, position)
+    """
+
+    counts = np.maximum(ends - starts, 0)
+    rows = np.repeat(np.arange(len(starts)), counts)
+    first = np.cumsum(counts) - counts
+    positions = np.arange(counts.sum()) - np.repeat(first, counts) + \
+        np.repeat(starts, counts)
+    return rows, positions
+
+
+def overlapping_pairs(pos, radius):
+    """
+        Returns:
+        tuple of index arrays (i, j) of the bodies that touch, each once
+    """
+
+    i, j = candidate_pairs(pos, radius)
+    distance = np.linalg.norm(pos[i] - pos[j], axis=1)
+    touching = distance < radius[i] + radius[j]
+    # only the few touching pairs are made unique
+    n = len(radius)
+    codes = np.unique(i[touching] * n + j[touching])
+    return codes // n, codes % n
+
+
+def group_labels(n, i, j):
+    """
+        Joins the bodies of touching pairs into groups, so a chain of
+        touching bodies becomes one group
+
+        Returns:
+        array with the lowest index of the group of every body
+    """
+
+    labels = np.arange(n)
+    while True:
+        lowest = np.minimum(labels[i], labels[j])
+        new = labels.copy()
+        np.minimum.at(new, i, lowest)
+        np.minimum.at(new, j, lowest)
+        # follow the labels to their roots
+        new = new[new]
+        if np.array_equal(new, labels):
+            return labels
+        labels = new
+
+
+def touching_groups(system):
+    """
+        Returns:
+        array with the lowest index of the group of touching bodies of
+        every body, or None if nothing touched
+    """
+
+    i, j = overlapping_pairs(system.pos, system.radius)
+    if len(i) == 0:
+        return None
+    return group_labels(len(system), i, j)
+
+
+def merged_state(system, labels):
+    """
+        Mass, centre of mass and momentum every group becomes, in
+        float64, at the index of the body the group is merged into
+
+        Returns:
+        tuple of (N,) masses and (N, 3) positions and momenta,
+        the bodies merged into another are left as zeros
+    """
+
+    n = len(system)
+    mass = np.bincount(labels, system.mass, minlength=n)
+    pos = np.stack([np.bincount(labels, system.mass * system.pos[:, axis],
+                                minlength=n) for axis in range(3)], axis=1)
+    mom = np.stack([np.bincount(labels, system.mom[:, axis], minlength=n)
+                    for axis in range(3)], axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pos = np.where(mass[:, np.newaxis] > 0, pos / mass[:, np.newaxis], 0)
+    return mass, pos, mom
+
+
+def pair_potential(pos, mass, members, G, softening):
+    """
+        Potential energy of the pairs with at least one of the members,
+        only the members against every body, not every pair
+
+        Returns:
+        potential energy as a float
+    """
+
+    potential = np.zeros(len(mass))
+    forces.direct_accelerations(pos, mass, G, members, softening, potential)
+    # the pairs of two members are in the potential of both
+    return float(np.dot(mass[members], potential[members]) -
+                 forces.potential_energy(pos[members], mass[members], G,
+                                         softening))
+
+
+def merge_changes(system, labels):
+    """
+        What merging the groups does to the conserved quantities of the
+        system. Momentum is kept, but the kinetic energy of the motion
+        within a group, the potential energy of its pairs and its
+        angular momentum about its own centre of mass are lost, and the
+        potential against the other bodies changes as the members move
+        to their centre of mass
+
+        Returns:
+        tuple of the change of the total energy and of the (3,) angular
+        momentum, both floats
+    """
+
+    n = len(system)
+    grouped = labels != np.arange(n)
+    members = np.unique(np.concatenate([np.flatnonzero(grouped),
+                                        labels[grouped]]))
+    groups = np.unique(labels[members])
+    pos = system.pos.astype(float)
+    mom = system.mom.astype(float)
+    mass = system.mass.astype(float)
+    new_mass, new_pos, new_mom = merged_state(system, labels)
+
+    kinetic = np.sum(np.einsum('ij,ij->i', new_mom[groups], new_mom[groups]) /
+                     (2 * new_mass[groups])) - \
+        np.sum(np.einsum('ij,ij->i', mom[members], mom[members]) /
+               (2 * mass[members]))
+    before = pair_potential(pos, mass, members, system.G, system.softening)
+    after_pos, after_mass = pos.copy(), mass.copy()
+    after_pos[groups] = new_pos[groups]
+    after_mass[groups] = new_mass[groups]
+    keep = ~grouped
+    after = pair_potential(after_pos[keep], after_mass[keep],
+                           (np.cumsum(keep) - 1)[groups], system.G,
+                           system.softening)
+    # the origin adds the same to both, only the motion about the
+    # centres of mass of the groups is lost
+    angular = np.cross(new_pos[groups], new_mom[groups]).sum(axis=0) - \
+        np.cross(pos[members], mom[members]).sum(axis=0)
+    return float(kinetic + after - before), angular
+
+
+def merge_groups(system, labels):
+    """
+        Merges every group of touching bodies into the body with the
+        lowest index. Mass and momentum are added, the position is the
+        centre of mass and the volume is kept
+
+        Returns:
+        array with the new index of every old body, -1 for the bodies
+        merged into another
+    """
+
+    n = len(system)
+    mass, pos, mom = merged_state(system, labels)
+    volume = np.bincount(labels, system.radius ** 3, minlength=n)
+
+    survivors = labels == np.arange(n)
+    system.pos[survivors] = pos[survivors]
+    system.mom[survivors] = mom[survivors]
+    system.mass[survivors] = mass[survivors]
+    system.radius[survivors] = np.cbrt(volume[survivors])
+    return system.remove_bodies(np.flatnonzero(~survivors))
+
+
+def merge_overlaps(system):
+    """
+        Merges every group of touching bodies into the body with the
+        lowest index, so the sun always survives
+
+        Returns:
+        array with the new index of every old body, -1 for the bodies
+        merged into another, or None if nothing touched
+    """
+
+    labels = touching_groups(system)
+    if labels is None:
+        return None
+    return merge_groups(system, labels)
+
+
+class Collisions:
+    """
+        Merges touching bodies after every step. Add it to
+        engine.observers to enable it. index_map follows the bodies
+        through all the merges since it was last taken. With
+        track_energy set the energy and angular momentum the merges
+        take out of the system are added up, for the diagnostics
+    """
+
+    def __init__(self):
+        self.merged = 0  # bodies merged into others
+        self.index_map = None
+        self.track_energy = False
+        self.energy_change = 0.0  # total change of the energy by merges
+        self.angular_momentum_change = np.zeros(3)
+
+    def after_step(self, system):
+        labels = touching_groups(system)
+        if labels is None:
+            return
+        if self.track_energy:
+            energy, angular = merge_changes(system, labels)
+            self.energy_change += energy
+            self.angular_momentum_change = \
+                self.angular_momentum_change + angular
+        new_index = merge_groups(system, labels)
+        self.merged += np.count_nonzero(new_index < 0)
+        if self.index_map is None:
+            self.index_map = new_index
+        else:
+            self.index_map = np.where(self.index_map >= 0,
+                                      new_index[self.index_map], -1)
+
+    def take_index_map(self):
+        """
+            Returns:
+            the new index of every body before the merges since the last
+            call, -1 for merged bodies, or None if there were no merges
+        """
+
+        index_map, self.index_map = self.index_map, None
+        return index_map
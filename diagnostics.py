@@ -0,0 +1,135 @@
+import numpy as np
+
+INTERVAL = 10  # steps between samples
+THRESHOLD = 1e-3  # relative energy drift that counts as a bad run
+# conserved quantities whose drift is followed
+QUANTITIES = ['energy', 'momentum', 'angular_momentum']
+
+
+def conserved_quantities(system):
+    """
+        Total energy, linear momentum and angular momentum about the
+        origin of the system, from its state arrays. The potential
+        energy comes from the force pass if the engine tracks it
+
+        Returns:
+        dictionary with the quantities and the scales their drift is
+        measured against
+    """
+
+    kinetic = system.kinetic_energy()
+    potential = system.potential_energy()
+    angular = np.cross(system.world_pos, system.mom)
+    return {'time': system.time,
+            'kinetic': kinetic,
+            'potential': potential,
+            'energy': kinetic + potential,
+            'momentum': system.mom.sum(axis=0),
+            'angular_momentum': angular.sum(axis=0),
+            # a total of zero is common, so the vectors are measured
+            # against the sum of the magnitudes of their terms
+            'momentum_scale': np.linalg.norm(system.mom, axis=1).sum(),
+            'angular_momentum_scale': np.linalg.norm(angular, axis=1).sum()}
+
+
+def relative_drift(quantities, reference):
+    """
+        Returns:
+        dictionary with the relative change of every conserved quantity
+        since the reference, 0 for a quantity whose scale is 0
+    """
+
+    drift = {}
+    for name in QUANTITIES:
+        change = np.linalg.norm(quantities[name] - reference[name])
+        scale = abs(reference[name]) if name == 'energy' else \
+            reference[name + '_scale']
+        drift[name] = change / scale if scale > 0 else 0.0
+    return drift
+
+
+class Diagnostics:
+    """
+        Samples the conserved quantities every interval steps and their
+        drift since the start of the run. Add it to engine.observers to
+        enable it. The engine is asked for the potential only around the
+        sampled steps, where it comes with the forces at no extra pass.
+        A new reference is taken when G or the softening change. Merges
+        keep the reference: given the Collisions observer, the energy
+        and angular momentum they take out are booked against it
+    """
+
+    def __init__(self, interval=INTERVAL, threshold=THRESHOLD,
+                 collisions=None):
+        self.interval = interval
+        self.threshold = threshold  # energy drift that trips, None for off
+        self.collisions = collisions
+        if collisions is not None:
+            collisions.track_energy = True
+        self.samples = []  # (time, drift) of the samples not taken yet
+        self.tripped = False  # the energy drift crossed the threshold
+        self.reset()
+
+    def reset(self):
+        """Measures the drift from the next sample on"""
+
+        self.steps = 0
+        self.reference = None
+        self.settings = None
+        self.merges = None  # changes booked by merges at the reference
+        self.tripped = False
+
+    def merge_changes(self):
+        """
+            Returns:
+            tuple of the energy and angular momentum the merges have
+            changed so far
+        """
+
+        if self.collisions is None:
+            return 0.0, np.zeros(3)
+        return self.collisions.energy_change, \
+            self.collisions.angular_momentum_change
+
+    def after_step(self, system):
+        self.steps += 1
+        if self.steps % self.interval == 0:
+            self.sample(system)
+        # the forces of the step before a sample also find the potential
+        system.track_potential = (self.steps + 1) % self.interval == 0
+
+    def sample(self, system):
+        """
+            Measures the drift of the system now
+
+            Returns:
+            dictionary with the drift of every conserved quantity
+        """
+
+        quantities = conserved_quantities(system)
+        merges = self.merge_changes()
+        settings = (system.G, system.softening)
+        if self.reference is None or settings != self.settings:
+            self.reference = quantities
+            self.settings = settings
+            self.merges = merges
+        # what the merges took out since the reference is not drift
+        quantities['energy'] -= merges[0] - self.merges[0]
+        quantities['angular_momentum'] = quantities['angular_momentum'] - \
+            (merges[1] - self.merges[1])
+        drift = relative_drift(quantities, self.reference)
+        self.samples.append((system.time, drift))
+        if self.threshold is not None and not self.tripped and \
+                drift['energy'] > self.threshold:
+            self.tripped = True
+            drift['tripped'] = True
+        return drift
+
+    def take_samples(self):
+        """
+            Returns:
+            list of (time, drift) samples since the last call
+        """
+
+        samples, self.samples = self.samples, []
+        return samples
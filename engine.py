@@ -0,0 +1,478 @@
+import time
+import numpy as np
+import barnes_hut
+import forces
+import integrators
+import parallel
+import particle_mesh
+
+
+class PhysicsEngine:
+    """
+        Headless state of the simulation. Positions, momenta and masses
+        of all the bodies live in contiguous NumPy arrays, index 0 is the sun
+    """
+
+    DELTA_TIME = 1.0E-1
+    G = 0.1  # newtons gravitational constant, 6.67e-11 to use real-world value
+    # default sun in the centre of the system
+    SUN = {}
+    SUN['RADIUS'] = 10
+    SUN['MASS'] = 10000
+    # available methods to calculate the gravitational forces
+    SOLVERS = ['direct', 'barnes-hut', 'particle-mesh']
+    INTEGRATOR = 'euler-cromer'
+    SOFTENING = 0.0  # length that keeps the forces finite in close encounters
+    WORKERS = 1  # threads that share the force calculation
+    GRID = particle_mesh.GRID  # cells along each side of the mesh
+    SHORT_RANGE = False  # whether the mesh adds the direct sum of near pairs
+    # floating point types the state arrays can be stored in
+    PRECISIONS = {'float64': np.float64, 'float32': np.float32}
+    PRECISION = 'float64'
+    # steps between moves of the origin of float32 positions
+    RECENTRE_EVERY = 100
+
+    def __init__(self, G=None, dt=None, solver='direct', theta=barnes_hut.THETA,
+                 integrator=None, softening=None, workers=None, grid=None,
+                 short_range=None, precision=None):
+        if G is not None:
+            self.G = G
+        if dt is not None:
+            self.DELTA_TIME = dt
+        self.solver = solver
+        self.theta = theta  # opening angle of the barnes-hut tree
+        self.grid = self.GRID if grid is None else grid
+        self.short_range = self.SHORT_RANGE if short_range is None \
+            else short_range
+        if softening is not None:
+            self.SOFTENING = softening
+        self.softening = self.SOFTENING
+        # objects whose after_step(engine) is called after every step
+        self.observers = []
+        self.kernel_pool = None
+        # object with add(stage, seconds) that is told the time spent
+        # on forces, e.g. a profiler.FrameProfiler, None to not time them
+        self.timings = None
+        # whether the direct sum also finds the potential of every body
+        # from the distances of the force pass, see potential_energy
+        self.track_potential = False
+        self.set_workers(self.WORKERS if workers is None else workers)
+        self.set_integrator(self.INTEGRATOR if integrator is None
+                            else integrator)
+        # accelerations at the current positions and the
+        # settings they were calculated with
+        self._acc = None
+        self._acc_settings = None
+        self._potential = None  # potentials that came with _acc, or None
+        self.time = 0
+        self.precision = self.PRECISION if precision is None else precision
+        self.dtype = self.PRECISIONS[self.precision]
+        # pos holds the offsets of the bodies from a float64 origin, which
+        # follows the centre of mass in float32 so the offsets stay small
+        self.origin = np.zeros(3)
+        self.since_recentre = 0  # steps since the origin was last moved
+        self.pos = np.zeros((0, 3), self.dtype)
+        self.mom = np.zeros((0, 3), self.dtype)
+        self.mass = np.zeros(0, self.dtype)
+        self.radius = np.zeros(0, self.dtype)
+        self.force = np.zeros((0, 3), self.dtype)
+        # rounding error of the float32 drifts, added back on the next
+        # drift (Kahan summation), None in float64
+        self._carry = None if self.dtype == np.float64 else \
+            np.zeros((0, 3), self.dtype)
+
+    def __len__(self):
+        return len(self.mass)
+
+    @property
+    def world_pos(self):
+        """
+            Positions of the bodies in the scene, the origin plus
+            the offsets in pos. Forces only need the offsets
+        """
+
+        if not self.origin.any():
+            return self.pos
+        return self.origin + self.pos
+
+    def state_bytes(self):
+        """
+            Returns:
+            bytes taken by the state arrays of the bodies
+        """
+
+        arrays = [self.pos, self.mom, self.mass, self.radius, self.force]
+        if self._carry is not None:
+            arrays.append(self._carry)
+        return sum(array.nbytes for array in arrays)
+
+    @property
+    def vel(self):
+        """Velocities of the bodies, derived from the momenta"""
+
+        return self.mom / self.mass[:, np.newaxis]
+
+    def add_body(self, position, velocity, mass, radius):
+        """
+            Appends a body to the state arrays
+
+            Returns:
+            index of the new body
+        """
+
+        return self.add_bodies([position], [velocity], [mass], [radius])[0]
+
+    def add_bodies(self, positions, velocities, masses, radii):
+        """
+            Appends many bodies to the state arrays at once,
+            each array is grown only once however many bodies are added
+
+            Returns:
+            range of the indices of the new bodies
+        """
+
+        positions = np.asarray(positions, dtype=float).reshape(-1, 3)
+        velocities = np.asarray(velocities, dtype=float).reshape(-1, 3)
+        masses = np.asarray(masses, dtype=float).reshape(-1)
+        radii = np.asarray(radii, dtype=float).reshape(-1)
+        start = len(self.mass)
+        self.pos = np.concatenate([self.pos, positions - self.origin]) \
+            .astype(self.dtype, copy=False)
+        self.mom = np.concatenate([self.mom,
+                                   masses[:, np.newaxis] * velocities]) \
+            .astype(self.dtype, copy=False)
+        self.mass = np.concatenate([self.mass, masses]) \
+            .astype(self.dtype, copy=False)
+        self.radius = np.concatenate([self.radius, radii]) \
+            .astype(self.dtype, copy=False)
+        self.force = np.concatenate([self.force,
+                                     np.zeros((len(masses), 3), self.dtype)])
+        if self._carry is not None:
+            self._carry = np.concatenate([self._carry,
+                                          np.zeros((len(masses), 3),
+                                                   self.dtype)])
+        self._acc = None
+        return range(start, len(self.mass))
+
+    def remove_bodies(self, indices):
+        """
+            Deletes bodies from the state arrays, the rest keep their order
+
+            Returns:
+            array with the new index of every old body, -1 if removed
+        """
+
+        keep = np.ones(len(self.mass), dtype=bool)
+        keep[indices] = False
+        self.pos = self.pos[keep]
+        self.mom = self.mom[keep]
+        self.mass = self.mass[keep]
+        self.radius = self.radius[keep]
+        self.force = self.force[keep]
+        if self._carry is not None:
+            self._carry = self._carry[keep]
+        self._acc = None
+        return np.where(keep, np.cumsum(keep) - 1, -1)
+
+    def set_body(self, index, position, velocity, mass, radius):
+        """Overwrites the state of the body at index"""
+
+        self.pos[index] = np.asarray(position, dtype=float) - self.origin
+        self.mom[index] = mass * np.asarray(velocity, dtype=float)
+        self.mass[index] = mass
+        self.radius[index] = radius
+        self.force[index] = 0
+        self._acc = None
+
+    def set_state(self, pos, mom):
+        """
+            Replaces the positions, as offsets from the origin,
+            and momenta of all the bodies
+        """
+
+        self.pos = np.asarray(pos, self.dtype)
+        self.mom = np.asarray(mom, self.dtype)
+        if self._carry is not None:
+            self._carry = np.zeros_like(self.pos)
+        self._acc = None
+
+    def copy(self):
+        """
+            Returns:
+            new engine with the same bodies, time and settings,
+            without the observers, that runs in the calling thread
+        """
+
+        system = PhysicsEngine(G=self.G, dt=self.DELTA_TIME,
+                               solver=self.solver, theta=self.theta,
+                               integrator=self.integrator.NAME,
+                               softening=self.softening, grid=self.grid,
+                               short_range=self.short_range,
+                               precision=self.precision)
+        system.origin = self.origin.copy()
+        system.add_bodies(self.world_pos, self.vel, self.mass, self.radius)
+        system.pos = self.pos.copy()
+        system.mom = self.mom.copy()
+        system.time = self.time
+        return system
+
+    def set_workers(self, workers):
+        """
+            Sets the number of threads for the force calculation,
+            1 runs it serially in the calling thread
+        """
+
+        if self.kernel_pool is not None:
+            self.kernel_pool.shutdown()
+            self.kernel_pool = None
+        self.workers = workers
+        if workers > 1:
+            self.kernel_pool = parallel.ThreadedKernel(workers)
+
+    def set_integrator(self, name):
+        """Selects the integrator used by step by its name"""
+
+        self.integrator = integrators.INTEGRATORS[name]()
+
+    def set_precision(self, precision, origin=None):
+        """
+            Converts the state arrays to the float type of a precision,
+            the bodies keep their positions in the scene. In float32 the
+            offsets start from the given origin, or else from the centre
+            of mass, found in float64
+        """
+
+        world = np.asarray(self.world_pos, float)
+        self.precision = precision
+        self.dtype = self.PRECISIONS[precision]
+        self.origin = np.zeros(3)
+        total_mass = np.sum(self.mass, dtype=float)
+        if self.dtype != np.float64 and origin is not None:
+            self.origin = np.array(origin, dtype=float)
+        elif self.dtype != np.float64 and total_mass > 0:
+            self.origin = np.dot(self.mass.astype(float), world) / total_mass
+        self.pos = (world - self.origin).astype(self.dtype)
+        self.mom = self.mom.astype(self.dtype)
+        self.mass = self.mass.astype(self.dtype)
+        self.radius = self.radius.astype(self.dtype)
+        self.force = self.force.astype(self.dtype)
+        self._carry = None if self.dtype == np.float64 else \
+            np.zeros_like(self.pos)
+        self.since_recentre = 0
+        self._acc = None
+
+    def solve(self, pos, mass, targets=None, potential=None):
+        """
+            Calculates the gravitational acceleration of the targets
+            among the given bodies with the selected solver. The direct
+            sum also writes the potential of the targets to potential,
+            if it is an array with a value per body
+
+            Returns:
+            (len(targets), 3) array of acceleration vectors
+        """
+
+        if self.timings is not None:
+            start = time.perf_counter()
+        if targets is None:
+            targets = np.arange(len(mass))
+        if self.solver == 'barnes-hut':
+            if len(mass) == 0:
+                return np.zeros((len(targets), 3))
+            # one tree is shared by all the threads
+            tree = barnes_hut.Octree(pos, mass)
+
+            def kernel(chunk):
+                return tree.accelerations(pos, mass, self.G, self.theta,
+                                          chunk, self.softening)
+        elif self.solver == 'particle-mesh':
+            # the mesh is solved once for every body,
+            # the threads only gather the rows of their targets
+            mesh = particle_mesh.mesh_accelerations(pos, mass, self.G, None,
+                                                    self.grid, self.softening,
+                                                    self.short_range)
+
+            def kernel(chunk):
+                return mesh[chunk]
+        elif self.solver == 'direct':
+            def kernel(chunk):
+                return forces.direct_accelerations(pos, mass, self.G, chunk,
+                                                   self.softening, potential)
+        else:
+            raise ValueError('unknown solver ' + str(self.solver))
+
+        if self.kernel_pool is None:
+            acc = kernel(targets)
+        else:
+            acc = self.kernel_pool.map_targets(kernel, targets)
+        if self.timings is not None:
+            self.timings.add('forces', time.perf_counter() - start)
+        return acc
+
+    def accelerations(self, targets=None):
+        """
+            Calculates the gravitational acceleration of the targets
+            due to all the bodies in the system
+
+            Returns:
+            (len(targets), 3) array of acceleration vectors
+        """
+
+        return self.solve(self.pos, self.mass, targets)
+
+    def solver_error(self, sample=1000):
+        """
+            Relative error of the barnes-hut or mesh forces
+            against the direct sum for the current state
+
+            Returns:
+            dictionary with the error statistics
+        """
+
+        if self.solver == 'particle-mesh':
+            return particle_mesh.force_error(self.pos, self.mass, self.G,
+                                             self.grid, sample,
+                                             softening=self.softening,
+                                             short_range=self.short_range)
+        return barnes_hut.force_error(self.pos, self.mass, self.G,
+                                      self.theta, sample,
+                                      softening=self.softening)
+
+    def acceleration(self, pos=None):
+        """
+            Accelerations of all the bodies at the given positions.
+            For the current positions the result is cached until
+            the bodies move or the solver settings change
+
+            Returns:
+            (N, 3) array of acceleration vectors
+        """
+
+        if pos is not None:
+            current = self.pos
+            self.pos = np.asarray(pos, self.dtype)
+            try:
+                return self.accelerations()
+            finally:
+                self.pos = current
+        settings = (self.G, self.solver, self.theta, self.softening,
+                    self.grid, self.short_range)
+        if self._acc is None or self._acc_settings != settings:
+            potential = None
+            if self.track_potential and self.solver == 'direct':
+                potential = np.zeros(len(self.mass))
+            self._acc = self.solve(self.pos, self.mass, potential=potential) \
+                .astype(self.dtype, copy=False)
+            self._acc_settings = settings
+            self._potential = potential
+        return self._acc
+
+    def compute_forces(self):
+        """
+            Calculates the total gravitational force on every body
+
+            Returns:
+            (N, 3) array of force vectors
+        """
+
+        self.force = self.mass[:, np.newaxis] * self.acceleration()
+        return self.force
+
+    def kick(self, dt):
+        """Updates the momenta with the forces at the current positions"""
+
+        self.compute_forces()
+        self.mom += self.force * dt
+
+    def drift(self, dt):
+        """Moves the bodies with their current momenta"""
+
+        self.move((self.mom * dt) / self.mass[:, np.newaxis])
+
+    def move(self, displacement, mom=None):
+        """
+            Moves the bodies by a displacement and replaces their
+            momenta if given. In float32 the sum is
+            compensated: the part of every move that float32 rounds away
+            is kept and added to the next one, so integrators that find
+            the new state themselves keep the accuracy of the drift
+        """
+
+        step = np.asarray(displacement).astype(self.dtype, copy=False)
+        if self._carry is None:
+            self.pos = self.pos + step
+        else:
+            step = step - self._carry
+            pos = self.pos + step
+            self._carry = (pos - self.pos) - step
+            self.pos = pos
+        if mom is not None:
+            self.mom = np.asarray(mom, self.dtype)
+        self._acc = None
+
+    def recentre(self):
+        """
+            Moves the origin to the centre of mass, so the float32
+            offsets stay small however far the system moves
+        """
+
+        total_mass = np.sum(self.mass)
+        if not total_mass > 0:
+            # no centre of mass to follow
+            self.since_recentre = 0
+            return
+        centre = np.dot(self.mass, self.pos) / total_mass
+        self.origin = self.origin + centre.astype(float)
+        # forces do not change with the origin, the cache stays valid
+        self.pos = self.pos - centre
+        self.since_recentre = 0
+
+    def kinetic_energy(self):
+        """
+            Returns:
+            total kinetic energy of the bodies as a float
+        """
+
+        return float(0.5 * np.sum(self.mom ** 2 / self.mass[:, np.newaxis]))
+
+    def potential_energy(self):
+        """
+            Total gravitational potential energy of the system. With the
+            direct solver and track_potential set, it comes with the
+            cached forces from the same pass over the pairs, otherwise
+            it takes a pass of its own
+
+            Returns:
+            potential energy as a float
+        """
+
+        if self.track_potential and self.solver == 'direct':
+            self.acceleration()
+            if self._potential is not None:
+                # every pair is in the potential of both its bodies
+                return float(0.5 * np.dot(self.mass, self._potential))
+        return float(forces.potential_energy(self.pos, self.mass, self.G,
+                                             self.softening))
+
+    def energy(self):
+        """
+            Total kinetic plus potential energy of the system
+
+            Returns:
+            energy as a float
+        """
+
+        return self.kinetic_energy() + self.potential_energy()
+
+    def step(self):
+        """Advances the system by DELTA_TIME with the selected integrator"""
+
+        dt = self.DELTA_TIME
+        self.integrator.step(self, dt)
+        self.time += dt
+        if self._carry is not None and len(self.mass):
+            self.since_recentre += 1
+            if self.since_recentre >= self.RECENTRE_EVERY:
+                self.recentre()
+        for observer in self.observers:
+            observer.after_step(self)
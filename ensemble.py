@@ -0,0 +1,201 @@
+import argparse
+import csv
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import numpy as np
+import forces
+import kepler
+import system_io
+
+# parameters a member of the ensemble can change
+PARAMETERS = ['G', 'sun_mass', 'dt', 'integrator', 'solver', 'theta',
+              'softening', 'grid', 'short_range', 'planet_velocity']
+CHECK_EVERY = 10  # steps between the separation and ejection checks
+
+
+def parameter_grid(**values):
+    """
+        Every combination of the given parameter values,
+        e.g. parameter_grid(G=[0.05, 0.1], sun_mass=[5000, 10000])
+
+        Returns:
+        list of parameter dictionaries
+    """
+
+    names = list(values)
+    return [dict(zip(names, combination))
+            for combination in itertools.product(*values.values())]
+
+
+def build_member(params, system_file):
+    """
+        Loads the system file with the parameters of one member.
+        planet_velocity maps a planet number to its new velocity
+
+        Returns:
+        PhysicsEngine ready to run
+    """
+
+    unknown = set(params) - set(PARAMETERS)
+    if unknown:
+        raise ValueError('unknown parameters ' + ', '.join(sorted(unknown)))
+    settings = {name: params[name] for name in
+                ('G', 'dt', 'integrator', 'solver', 'theta', 'softening',
+                 'grid', 'short_range')
+                if name in params}
+    system = system_io.engine_from_csv(system_file,
+                                       sun_mass=params.get('sun_mass'),
+                                       **settings)
+    for number, velocity in params.get('planet_velocity', {}).items():
+        index = int(number)
+        system.mom[index] = system.mass[index] * np.asarray(velocity, float)
+    return system
+
+
+def run_member(task):
+    """
+        Runs one member of the ensemble headless
+
+        Returns:
+        summary dictionary with the final orbital elements of every planet,
+        the minimum separation and whether a planet was ejected
+    """
+
+    params, system_file, steps = task
+    system = build_member(params, system_file)
+    min_separation = np.inf
+    ejected = False
+    for step in range(1, steps + 1):
+        system.step()
+        if step % CHECK_EVERY == 0 or step == steps:
+            min_separation = min(min_separation,
+                                 forces.min_separation(system.pos))
+            e = planet_elements(system)[1]
+            ejected = ejected or bool(np.any(e >= 1))
+            if not np.all(np.isfinite(system.pos)):
+                ejected = True
+                break
+
+    summary = {'params': json.dumps(params, sort_keys=True),
+               'time': system.time,
+               'min_separation': min_separation,
+               'ejected': ejected}
+    a, e, inc = planet_elements(system)
+    for number in range(len(a)):
+        summary['a_' + str(number + 1)] = a[number]
+        summary['e_' + str(number + 1)] = e[number]
+        summary['inc_' + str(number + 1)] = inc[number]
+    return summary
+
+
+def planet_elements(system):
+    """
+        Orbital elements of the planets relative to the sun (body 0)
+
+        Returns:
+        tuple of arrays (a, e, inclination)
+    """
+
+    return kepler.orbital_elements(system.pos[1:] - system.pos[0],
+                                   system.vel[1:] - system.vel[0],
+                                   system.G * system.mass[0])
+
+
+def cache_key(task):
+    """
+        Hash of everything that decides the result of a member:
+        the parameters, the number of steps and the system file contents
+
+        Returns:
+        hex string
+    """
+
+    params, system_file, steps = task
+    with open(system_file, 'rb') as f:
+        contents = f.read()
+    text = json.dumps({'params': params, 'steps': steps}, sort_keys=True)
+    return hashlib.sha256(text.encode() + contents).hexdigest()
+
+
+def run_ensemble(param_sets, system_file='solar_system.csv', steps=1000,
+                 processes=None, cache_dir=None):
+    """
+        Runs every parameter set in a process pool across all the cores.
+        With a cache directory, members that were already run with
+        the same configuration are read back instead of being run again
+
+        Returns:
+        list of summary dictionaries in the order of param_sets
+    """
+
+    tasks = [(params, system_file, steps) for params in param_sets]
+    results = [None] * len(tasks)
+    missing = []
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        for index, task in enumerate(tasks):
+            path = os.path.join(cache_dir, cache_key(task) + '.json')
+            if os.path.exists(path):
+                with open(path) as f:
+                    results[index] = json.load(f)
+            else:
+                missing.append(index)
+    else:
+        missing = list(range(len(tasks)))
+
+    if missing:
+        with multiprocessing.Pool(processes) as pool:
+            computed = pool.map(run_member, [tasks[i] for i in missing])
+        for index, summary in zip(missing, computed):
+            results[index] = summary
+            if cache_dir is not None:
+                path = os.path.join(cache_dir, cache_key(tasks[index]) + '.json')
+                with open(path, 'w') as f:
+                    json.dump(summary, f)
+    return results
+
+
+def write_summary(path, results):
+    """Writes the summaries of the members as one csv table"""
+
+    columns = []
+    for summary in results:
+        for column in summary:
+            if column not in columns:
+                columns.append(column)
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Runs a grid of simulations headless on all the cores')
+    parser.add_argument('--system', default='solar_system.csv')
+    parser.add_argument('--steps', type=int, default=1000)
+    parser.add_argument('--G', type=float, nargs='+')
+    parser.add_argument('--sun-mass', type=float, nargs='+')
+    parser.add_argument('--dt', type=float, nargs='+')
+    parser.add_argument('--integrator', nargs='+')
+    parser.add_argument('--processes', type=int,
+                        help='worker processes, all the cores by default')
+    parser.add_argument('--cache', help='directory to cache the results in')
+    parser.add_argument('--output', default='ensemble.csv')
+    args = parser.parse_args()
+
+    values = {}
+    for name in ('G', 'sun_mass', 'dt', 'integrator'):
+        if getattr(args, name) is not None:
+            values[name] = getattr(args, name)
+    results = run_ensemble(parameter_grid(**values), args.system,
+                           args.steps, args.processes, args.cache)
+    write_summary(args.output, results)
+    print(len(results), 'runs written to', args.output)
+
+
+if __name__ == '__main__':
+    main()
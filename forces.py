@@ -0,0 +1,111 @@
+import numpy as np
+
+# number of target bodies handled at once by the direct sum,
+# keeps the pairwise arrays at BLOCK_SIZE * N elements
+BLOCK_SIZE = 256
+
+
+def direct_accelerations(pos, mass, G, targets=None, softening=0.0,
+                         potential=None):
+    """
+        Calculates the gravitational acceleration of the target bodies
+        due to all the other bodies, in batched blocks of targets.
+        A softening length keeps the force finite as r goes to 0.
+        If potential is an array with a value per body, the potential
+        of every target is written to it from the same distances
+        Based on https://www.youtube.com/watch?v=4ycpvtIio-o
+        and https://www.glowscript.org/#/user/wlane/folder/Let'sCodePhysics/program/Solar-System-1/edit
+
+        Returns:
+        (len(targets), 3) array with the acceleration of each target,
+        every body is a target if targets is None
+    """
+
+    if targets is None:
+        targets = np.arange(len(mass))
+    # each coordinate contiguous, so the pairwise arrays below are three
+    # contiguous planes and their einsums several times faster
+    pos = np.asfortranarray(pos)
+    acc = np.zeros((len(targets), 3))
+    for start in range(0, len(targets), BLOCK_SIZE):
+        block = targets[start:start + BLOCK_SIZE]
+        # distance vectors from each target i to every body j
+        r_vec = pos[np.newaxis, :, :] - pos[block, np.newaxis, :]
+        # squared magnitude of the softened distance vectors
+        r_sq = np.einsum('ijk,ijk->ij', r_vec, r_vec) + softening ** 2
+        # a body exerts no force on itself, 1 / inf ** 1.5 gives 0
+        r_sq[np.arange(len(block)), block] = np.inf
+        # G * m_j / r^3 for every pair
+        weights = G * mass[np.newaxis, :] * r_sq ** -1.5
+        acc[start:start + BLOCK_SIZE] = np.einsum('ij,ijk->ik', weights, r_vec)
+        if potential is not None:
+            # -G * m_j / r, 1 / sqrt(inf) gives 0 for the body itself
+            potential[block] = -G * (r_sq ** -0.5) @ mass
+    return acc
+
+
+def direct_jerks(pos, vel, mass, G, targets=None, softening=0.0):
+    """
+        Calculates the time derivative of the acceleration
+        of the target bodies with the direct sum
+
+        Returns:
+        (len(targets), 3) array with the jerk of each target
+    """
+
+    if targets is None:
+        targets = np.arange(len(mass))
+    pos, vel = np.asfortranarray(pos), np.asfortranarray(vel)
+    jerk = np.zeros((len(targets), 3))
+    for start in range(0, len(targets), BLOCK_SIZE):
+        block = targets[start:start + BLOCK_SIZE]
+        r_vec = pos[np.newaxis, :, :] - pos[block, np.newaxis, :]
+        v_vec = vel[np.newaxis, :, :] - vel[block, np.newaxis, :]
+        r_sq = np.einsum('ijk,ijk->ij', r_vec, r_vec) + softening ** 2
+        r_sq[np.arange(len(block)), block] = np.inf
+        rv = np.einsum('ijk,ijk->ij', r_vec, v_vec)
+        weights = G * mass[np.newaxis, :] * r_sq ** -1.5
+        jerk[start:start + BLOCK_SIZE] = \
+            np.einsum('ij,ijk->ik', weights, v_vec) - \
+            np.einsum('ij,ijk->ik', 3 * weights * rv / r_sq, r_vec)
+    return jerk
+
+
+def potential_energy(pos, mass, G, softening=0.0):
+    """
+        Total gravitational potential energy of the bodies,
+        summed over blocks of bodies like the direct accelerations
+
+        Returns:
+        potential energy as a float
+    """
+
+    energy = 0.0
+    for start in range(0, len(mass), BLOCK_SIZE):
+        block = np.arange(start, min(start + BLOCK_SIZE, len(mass)))
+        r_vec = pos[np.newaxis, :, :] - pos[block, np.newaxis, :]
+        r_mag = np.sqrt(np.einsum('ijk,ijk->ij', r_vec, r_vec) +
+                        softening ** 2)
+        r_mag[np.arange(len(block)), block] = np.inf
+        # every pair is counted twice, once from each body
+        energy -= 0.5 * G * np.sum(mass[block, np.newaxis] *
+                                   mass[np.newaxis, :] / r_mag)
+    return energy
+
+
+def min_separation(pos):
+    """
+        Smallest distance between any two bodies
+
+        Returns:
+        distance as a float, inf for fewer than two bodies
+    """
+
+    smallest = np.inf
+    for start in range(0, len(pos), BLOCK_SIZE):
+        block = np.arange(start, min(start + BLOCK_SIZE, len(pos)))
+        r_vec = pos[np.newaxis, :, :] - pos[block, np.newaxis, :]
+        r_sq = np.einsum('ijk,ijk->ij', r_vec, r_vec)
+        r_sq[np.arange(len(block)), block] = np.inf
+        smallest = min(smallest, r_sq.min())
+    return np.sqrt(smallest)
@@ -0,0 +1,171 @@
+import numpy as np
+import engine
+import kepler
+
+# default shapes of the generated systems, on the scale of the sun
+# and planets of the scene
+DISK = {'R_MIN': 20, 'R_MAX': 200, 'E_MAX': 0.2, 'INC_MAX': 10,
+        'MASS': 0.01, 'RADIUS': 1}
+BELT = {'R_MIN': 60, 'R_MAX': 90, 'E_MAX': 0.05, 'INC_MAX': 3,
+        'MASS': 1e-4, 'RADIUS': 0.2}
+PLUMMER = {'SCALE': 20, 'MAX_RADIUS': 10, 'RADIUS': 0.5}
+# stars smaller than the sun, so they are well apart at periapsis
+BINARY = {'SEPARATION': 20, 'ECCENTRICITY': 0.0, 'RADIUS': 4}
+
+
+def keplerian_disk(n, central_mass, G, r_min=DISK['R_MIN'],
+                   r_max=DISK['R_MAX'], e_max=DISK['E_MAX'],
+                   inc_max=DISK['INC_MAX'], mass=DISK['MASS'],
+                   radius=DISK['RADIUS'], seed=None):
+    """
+        Bodies on Keplerian orbits around a central mass at the origin,
+        spread evenly over the area of the disk, with random eccentricity
+        up to e_max and inclination up to inc_max degrees. The mass of
+        the bodies is left out of their orbits
+
+        Returns:
+        tuple of (positions, velocities, masses, radii) arrays
+    """
+
+    rng = np.random.default_rng(seed)
+    a = np.sqrt(rng.uniform(r_min ** 2, r_max ** 2, n))
+    e = rng.uniform(0, e_max, n)
+    inclination = rng.uniform(0, inc_max, n)
+    node, periapsis, mean_anomaly = rng.uniform(0, 360, (3, n))
+    pos, vel = kepler.state_vectors(a, e, inclination, node, periapsis,
+                                    mean_anomaly, G * central_mass)
+    return pos, vel, np.full(n, mass, dtype=float), \
+        np.full(n, radius, dtype=float)
+
+
+def asteroid_belt(n, central_mass, G, r_min=BELT['R_MIN'],
+                  r_max=BELT['R_MAX'], e_max=BELT['E_MAX'],
+                  inc_max=BELT['INC_MAX'], mass=BELT['MASS'],
+                  radius=BELT['RADIUS'], seed=None):
+    """
+        Narrow ring of light bodies on nearly circular, nearly flat orbits
+
+        Returns:
+        tuple of (positions, velocities, masses, radii) arrays
+    """
+
+    return keplerian_disk(n, central_mass, G, r_min, r_max, e_max, inc_max,
+                          mass, radius, seed)
+
+
+def random_directions(rng, n):
+    """
+        Returns:
+        (n, 3) array of isotropic unit vectors
+    """
+
+    directions = rng.normal(size=(n, 3))
+    return directions / np.linalg.norm(directions, axis=1)[:, np.newaxis]
+
+
+def plummer_sphere(n, total_mass, G, scale=PLUMMER['SCALE'],
+                   radius=PLUMMER['RADIUS'], seed=None):
+    """
+        Self-gravitating cluster in equilibrium with the Plummer density
+        profile, sampled as in Aarseth, Henon and Wielen (1974). Radii
+        beyond MAX_RADIUS scale lengths are drawn again. The cluster is
+        centred on the origin and at rest
+
+        Returns:
+        tuple of (positions, velocities, masses, radii) arrays
+    """
+
+    rng = np.random.default_rng(seed)
+    r = np.empty(n)
+    todo = np.arange(n)
+    while len(todo):
+        x = rng.uniform(0, 1, len(todo))
+        with np.errstate(divide='ignore'):
+            sample = scale / np.sqrt(x ** (-2 / 3) - 1)
+        kept = sample <= PLUMMER['MAX_RADIUS'] * scale
+        r[todo[kept]] = sample[kept]
+        todo = todo[~kept]
+
+    # speeds as a fraction q of the escape speed, with the
+    # distribution g(q) = q^2 (1 - q^2)^(7/2) sampled by rejection
+    q = np.empty(n)
+    todo = np.arange(n)
+    while len(todo):
+        x = rng.uniform(0, 1, len(todo))
+        y = rng.uniform(0, 0.1, len(todo))
+        kept = y < x ** 2 * (1 - x ** 2) ** 3.5
+        q[todo[kept]] = x[kept]
+        todo = todo[~kept]
+    escape = np.sqrt(2 * G * total_mass / np.sqrt(r ** 2 + scale ** 2))
+
+    pos = r[:, np.newaxis] * random_directions(rng, n)
+    vel = (q * escape)[:, np.newaxis] * random_directions(rng, n)
+    pos -= pos.mean(axis=0)
+    vel -= vel.mean(axis=0)
+    return pos, vel, np.full(n, total_mass / n), np.full(n, radius, float)
+
+
+def binary_star(mass1, mass2, G, separation=BINARY['SEPARATION'],
+                eccentricity=BINARY['ECCENTRICITY'], radius1=None,
+                radius2=None):
+    """
+        Two stars at the periapsis of their orbit, with the centre of mass
+        at rest at the origin. separation is the semi-major axis.
+        Raises ValueError if the stars would touch at periapsis
+
+        Returns:
+        tuple of (positions, velocities, masses, radii) arrays
+    """
+
+    total = mass1 + mass2
+    radii = [BINARY['RADIUS'] if radius1 is None else radius1,
+             BINARY['RADIUS'] if radius2 is None else radius2]
+    # relative position and velocity at periapsis
+    distance = separation * (1 - eccentricity)
+    if distance <= sum(radii):
+        raise ValueError('the stars touch at periapsis, use a larger '
+                         'separation or smaller radii')
+    speed = np.sqrt(G * total * (1 + eccentricity) / distance)
+    relative_pos = np.array([distance, 0, 0])
+    relative_vel = np.array([0, 0, speed])
+    weights = np.array([[-mass2 / total], [mass1 / total]])
+    return weights * relative_pos, weights * relative_vel, \
+        np.array([mass1, mass2], dtype=float), np.array(radii, dtype=float)
+
+
+# generators of bodies orbiting the sun, called as f(n, sun_mass, G, seed=)
+PLANET_GENERATORS = {'disk': keplerian_disk, 'belt': asteroid_belt}
+SYSTEMS = ['disk', 'belt', 'plummer', 'binary']
+
+
+def generate_system(name, n, sun_mass=None, seed=None, **settings):
+    """
+        Builds a whole system in a few array operations: a disk or belt
+        of n bodies around the sun, a Plummer cluster of n bodies with the
+        mass of the sun, or two stars sharing the mass of the sun with a
+        disk of n bodies around them. The same seed gives the same system
+
+        Returns:
+        PhysicsEngine with the bodies added
+    """
+
+    system = engine.PhysicsEngine(**settings)
+    if sun_mass is None:
+        sun_mass = system.SUN['MASS']
+    if name in PLANET_GENERATORS:
+        system.add_body([0, 0, 0], [0, 0, 0], sun_mass, system.SUN['RADIUS'])
+        system.add_bodies(*PLANET_GENERATORS[name](n, sun_mass, system.G,
+                                                   seed=seed))
+    elif name == 'plummer':
+        system.add_bodies(*plummer_sphere(n, sun_mass, system.G, seed=seed))
+    elif name == 'binary':
+        system.add_bodies(*binary_star(sun_mass / 2, sun_mass / 2, system.G))
+        # circumbinary orbits are only stable a few separations out
+        r_min = 3 * BINARY['SEPARATION']
+        system.add_bodies(*keplerian_disk(n, sun_mass, system.G, r_min=r_min,
+                                          r_max=r_min + DISK['R_MAX'],
+                                          seed=seed))
+    else:
+        raise ValueError('unknown system ' + name + ', choose from ' +
+                         ', '.join(SYSTEMS))
+    return system
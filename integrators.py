@@ -0,0 +1,262 @@
+import numpy as np
+import forces
+import kepler
+
+
+class Integrator:
+    """
+        Base class for the methods that advance the engine by one step.
+        Subclasses implement step(engine, dt)
+    """
+
+    NAME = ''
+    FORCE_EVALUATIONS = 1  # force evaluations per step
+
+    def step(self, engine, dt):
+        raise NotImplementedError
+
+
+class EulerCromer(Integrator):
+    """
+        Semi-implicit euler: the momentum is updated first
+        and the new momentum moves the body. First order
+    """
+
+    NAME = 'euler-cromer'
+
+    def step(self, engine, dt):
+        engine.kick(dt)
+        engine.drift(dt)
+
+
+class Leapfrog(Integrator):
+    """
+        Kick-drift-kick leapfrog, symplectic and second order.
+        The force at the end of a step is reused at the start of the next
+    """
+
+    NAME = 'leapfrog'
+
+    def step(self, engine, dt):
+        engine.kick(dt / 2)
+        engine.drift(dt)
+        engine.kick(dt / 2)
+
+
+class Yoshida(Integrator):
+    """
+        Fourth order symplectic integrator made of three
+        leapfrog steps with the weights of Yoshida (1990)
+    """
+
+    NAME = 'yoshida'
+    FORCE_EVALUATIONS = 3
+    W1 = 1 / (2 - 2 ** (1 / 3))
+    W0 = -2 ** (1 / 3) / (2 - 2 ** (1 / 3))
+
+    def step(self, engine, dt):
+        for weight in (self.W1, self.W0, self.W1):
+            engine.kick(weight * dt / 2)
+            engine.drift(weight * dt)
+            engine.kick(weight * dt / 2)
+
+
+class RungeKutta4(Integrator):
+    """Classic fourth order runge-kutta, not symplectic"""
+
+    NAME = 'rk4'
+    FORCE_EVALUATIONS = 4
+
+    def step(self, engine, dt):
+        # the stages are summed in float64 and only the step is
+        # rounded to the precision of the state
+        pos = engine.pos.astype(float)
+        vel = engine.vel.astype(float)
+        k1_x = vel
+        k1_v = engine.acceleration()
+        k2_x = vel + k1_v * dt / 2
+        k2_v = engine.acceleration(pos + k1_x * dt / 2)
+        k3_x = vel + k2_v * dt / 2
+        k3_v = engine.acceleration(pos + k2_x * dt / 2)
+        k4_x = vel + k3_v * dt
+        k4_v = engine.acceleration(pos + k3_x * dt)
+        engine.force = engine.mass[:, np.newaxis] * k1_v
+        new_vel = vel + (k1_v + 2 * k2_v + 2 * k3_v + k4_v) * dt / 6
+        engine.move((k1_x + 2 * k2_x + 2 * k3_x + k4_x) * dt / 6,
+                    engine.mass[:, np.newaxis] * new_vel)
+
+
+class WisdomHolman(Integrator):
+    """
+        Wisdom-Holman map in democratic heliocentric coordinates.
+        Every planet moves on its exact kepler orbit around the sun (body 0)
+        and the planet-planet forces are applied as kicks, so the time step
+        only has to resolve the planet-planet interactions.
+        Based on Duncan, Levison and Lee (1998)
+    """
+
+    NAME = 'wisdom-holman'
+    FORCE_EVALUATIONS = 2
+
+    def kick(self, engine, helio, mom, dt):
+        """Applies the planet-planet forces to the barycentric momenta"""
+
+        acc = engine.solve(helio.astype(engine.dtype, copy=False),
+                           engine.mass[1:])
+        mom += engine.mass[1:, np.newaxis] * acc * dt
+        return acc
+
+    def jump(self, engine, helio, mom, dt):
+        """Moves the planets with the momentum of the sun"""
+
+        helio += np.sum(mom, axis=0) * dt / engine.mass[0]
+
+    def step(self, engine, dt):
+        # the coordinates and the kepler solver work in float64 whatever
+        # the precision of the state, float32 never meets its tolerance
+        start = engine.pos.astype(float)
+        mass = engine.mass.astype(float)
+        total_mass = mass.sum()
+        # centre of mass and its velocity
+        centre = np.sum(mass[:, np.newaxis] * start, axis=0) / total_mass
+        cm_vel = np.sum(engine.mom, axis=0, dtype=float) / total_mass
+        # heliocentric positions and barycentric momenta of the planets
+        helio = start[1:] - start[0]
+        mom = engine.mom[1:] - mass[1:, np.newaxis] * cm_vel
+
+        if len(mass) > 1:
+            self.kick(engine, helio, mom, dt / 2)
+            self.jump(engine, helio, mom, dt / 2)
+            helio, vel = kepler.drift(helio, mom / mass[1:, np.newaxis],
+                                      engine.G * mass[0], dt)
+            mom = mass[1:, np.newaxis] * vel
+            self.jump(engine, helio, mom, dt / 2)
+            acc = self.kick(engine, helio, mom, dt / 2)
+        centre = centre + cm_vel * dt
+
+        # back to the inertial positions and momenta
+        pos = np.empty_like(start)
+        pos[0] = centre - np.sum(mass[1:, np.newaxis] * helio,
+                                 axis=0) / total_mass
+        pos[1:] = helio + pos[0]
+        new_mom = np.empty_like(start)
+        new_mom[0] = mass[0] * cm_vel - np.sum(mom, axis=0)
+        new_mom[1:] = mom + mass[1:, np.newaxis] * cm_vel
+        engine.move(pos - start, new_mom)
+
+        # total forces for the views: the sun plus the last kick
+        force = np.zeros_like(start)
+        if len(mass) > 1:
+            r_mag = np.linalg.norm(helio, axis=1)
+            sun_force = -engine.G * mass[0] * mass[1:, np.newaxis] * \
+                helio / r_mag[:, np.newaxis] ** 3
+            force[1:] = sun_force + mass[1:, np.newaxis] * acc
+            force[0] = -np.sum(sun_force, axis=0)
+        engine.force = force.astype(engine.dtype, copy=False)
+
+
+class BlockTimesteps(Integrator):
+    """
+        Kick-drift-kick leapfrog where every body takes its own time step,
+        a power of two fraction of DELTA_TIME chosen from its acceleration
+        or jerk. All the bodies drift together but only the bodies at the
+        end of their own step get new forces and a new step, so only the
+        bodies in close encounters pay for the small steps
+    """
+
+    NAME = 'block-timesteps'
+    ETA = 0.02  # accuracy parameter of the time step criterion
+    MAX_LEVEL = 10  # smallest step is DELTA_TIME / 2 ** MAX_LEVEL
+    # or 'acceleration'. The jerk is an O(N^2) direct sum, so with the
+    # barnes-hut or particle-mesh solver, whose forces cost less than
+    # that, the acceleration criterion is used instead
+    CRITERION = 'jerk'
+
+    def __init__(self):
+        self.levels = None  # level of every body at the end of the last step
+
+    def timesteps(self, engine, acc, targets):
+        """
+            Time step wanted by the targets, eta * |a| / |jerk| for the jerk
+            criterion or sqrt(2 * eta * length / |a|) for the acceleration,
+            where the length is the softening or else the radius. The jerk
+            is only used with the direct solver
+
+            Returns:
+            array with the time step of each target
+        """
+
+        acc_mag = np.linalg.norm(acc, axis=1)
+        if self.CRITERION == 'jerk' and engine.solver == 'direct':
+            jerk = forces.direct_jerks(engine.pos, engine.vel, engine.mass,
+                                       engine.G, targets, engine.softening)
+            jerk_mag = np.linalg.norm(jerk, axis=1)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                return self.ETA * acc_mag / jerk_mag
+        if engine.softening > 0:
+            length = engine.softening
+        else:
+            length = engine.radius[targets]
+        with np.errstate(divide='ignore'):
+            return np.sqrt(2 * self.ETA * length / acc_mag)
+
+    def new_levels(self, dt, wanted, tick):
+        """
+            Smallest power of two division of dt below the wanted steps,
+            made deeper where needed so the step starts on its own grid
+
+            Returns:
+            array of levels
+        """
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            levels = np.ceil(np.log2(dt / wanted))
+        levels = np.clip(np.nan_to_num(levels, nan=0), 0,
+                         self.MAX_LEVEL).astype(int)
+        ticks = 2 ** (self.MAX_LEVEL - levels)
+        while np.any(tick % ticks):
+            misaligned = tick % ticks != 0
+            levels[misaligned] += 1
+            ticks[misaligned] //= 2
+        return levels
+
+    def step(self, engine, dt):
+        # time is counted in integer ticks of the smallest step
+        end = 2 ** self.MAX_LEVEL
+        tick_dt = dt / end
+        everyone = np.arange(len(engine))
+
+        acc = engine.acceleration()
+        levels = self.new_levels(dt, self.timesteps(engine, acc, everyone), 0)
+        body_dt = dt / 2 ** levels
+        next_tick = 2 ** (self.MAX_LEVEL - levels)
+        engine.mom += engine.mass[:, np.newaxis] * acc * \
+            body_dt[:, np.newaxis] / 2
+        tick = 0
+        while tick < end:
+            now = next_tick.min()
+            engine.drift((now - tick) * tick_dt)
+            tick = now
+            if tick == end:
+                break
+            active = np.flatnonzero(next_tick == tick)
+            active_acc = engine.accelerations(active)
+            # closing half kick of the finished step
+            engine.mom[active] += engine.mass[active, np.newaxis] * \
+                active_acc * body_dt[active, np.newaxis] / 2
+            wanted = self.timesteps(engine, active_acc, active)
+            levels[active] = self.new_levels(dt, wanted, tick)
+            body_dt[active] = dt / 2 ** levels[active]
+            next_tick[active] = tick + 2 ** (self.MAX_LEVEL - levels[active])
+            # opening half kick of the next step
+            engine.mom[active] += engine.mass[active, np.newaxis] * \
+                active_acc * body_dt[active, np.newaxis] / 2
+        # every body finishes its last step at the end of dt
+        engine.kick(body_dt[:, np.newaxis] / 2)
+        self.levels = levels
+
+
+# integrators that can be selected by name
+INTEGRATORS = {integrator.NAME: integrator for integrator in
+               (EulerCromer, Leapfrog, Yoshida, RungeKutta4, WisdomHolman,
+                BlockTimesteps)}
@@ -0,0 +1,160 @@
+import numpy as np
+
+MAX_ITERATIONS = 50
+TOLERANCE = 1e-13
+
+
+def stumpff(z):
+    """
+        Stumpff functions C(z) and S(z) of the universal variable
+        formulation, with a series near z = 0
+
+        Returns:
+        tuple of arrays (C, S)
+    """
+
+    c = np.empty_like(z)
+    s = np.empty_like(z)
+    small = np.abs(z) < 1e-4
+    ellipse = (z > 0) & ~small
+    hyperbola = (z < 0) & ~small
+
+    root = np.sqrt(z[ellipse])
+    c[ellipse] = (1 - np.cos(root)) / z[ellipse]
+    s[ellipse] = (root - np.sin(root)) / root ** 3
+
+    root = np.sqrt(-z[hyperbola])
+    c[hyperbola] = (np.cosh(root) - 1) / -z[hyperbola]
+    s[hyperbola] = (np.sinh(root) - root) / root ** 3
+
+    zs = z[small]
+    c[small] = 1 / 2 - zs / 24 + zs ** 2 / 720
+    s[small] = 1 / 6 - zs / 120 + zs ** 2 / 5040
+    return c, s
+
+
+def drift(pos, vel, mu, dt):
+    """
+        Moves bodies along their two body orbits around a fixed centre
+        for a time dt, with universal variables and f and g functions.
+        Based on Curtis, Orbital Mechanics for Engineering Students, ch. 3,
+        solved with the Laguerre-Conway iteration
+
+        Returns:
+        tuple of (N, 3) arrays with the new positions and velocities
+    """
+
+    sqrt_mu = np.sqrt(mu)
+    r0 = np.linalg.norm(pos, axis=1)
+    rv0 = np.einsum('ij,ij->i', pos, vel) / sqrt_mu
+    # reciprocal of the semi-major axis, negative for hyperbolas
+    alpha = 2 / r0 - np.einsum('ij,ij->i', vel, vel) / mu
+
+    chi = sqrt_mu * np.abs(alpha) * dt
+    # parabolic and hyperbolic orbits start from the circular guess
+    chi = np.where(alpha > 0, chi, sqrt_mu * dt / r0)
+    n = 5  # order of the laguerre iteration
+    # a tolerance below the rounding of the arrays is never met
+    tolerance = max(TOLERANCE, 4 * np.finfo(chi.dtype).eps)
+    for _ in range(MAX_ITERATIONS):
+        z = alpha * chi ** 2
+        c, s = stumpff(z)
+        f = rv0 * chi ** 2 * c + (1 - alpha * r0) * chi ** 3 * s + \
+            r0 * chi - sqrt_mu * dt
+        df = rv0 * chi * (1 - z * s) + (1 - alpha * r0) * chi ** 2 * c + r0
+        ddf = rv0 * (1 - z * c) + (1 - alpha * r0) * chi * (1 - z * s)
+        root = np.sqrt(np.abs((n - 1) ** 2 * df ** 2 - n * (n - 1) * f * ddf))
+        delta = n * f / (df + np.sign(df) * root)
+        chi = chi - delta
+        if np.all(np.abs(delta) <= tolerance * np.maximum(np.abs(chi), 1)):
+            break
+
+    z = alpha * chi ** 2
+    c, s = stumpff(z)
+    f = 1 - chi ** 2 / r0 * c
+    g = dt - chi ** 3 / sqrt_mu * s
+    new_pos = f[:, np.newaxis] * pos + g[:, np.newaxis] * vel
+    r = np.linalg.norm(new_pos, axis=1)
+    fdot = sqrt_mu / (r * r0) * (alpha * chi ** 3 * s - chi)
+    gdot = 1 - chi ** 2 / r * c
+    new_vel = fdot[:, np.newaxis] * pos + gdot[:, np.newaxis] * vel
+    return new_pos, new_vel
+
+
+def orbital_elements(pos, vel, mu):
+    """
+        Semi-major axis, eccentricity and inclination of bodies
+        relative to a central mass. The inclination is measured from
+        the x-z plane the planets are added in
+
+        Returns:
+        tuple of arrays (a, e, inclination in degrees),
+        a is negative for unbound orbits
+    """
+
+    r = np.linalg.norm(pos, axis=1)
+    h = np.cross(pos, vel)
+    h_mag = np.linalg.norm(h, axis=1)
+    e_vec = np.cross(vel, h) / mu - pos / r[:, np.newaxis]
+    energy = np.einsum('ij,ij->i', vel, vel) / 2 - mu / r
+    with np.errstate(divide='ignore'):
+        a = -mu / (2 * energy)
+    # the planets orbit with angular momentum along -y
+    cos_inc = np.where(h_mag > 0, -h[:, 1] / np.where(h_mag > 0, h_mag, 1), 1)
+    inclination = np.degrees(np.arccos(np.clip(cos_inc, -1, 1)))
+    return a, np.linalg.norm(e_vec, axis=1), inclination
+
+
+def eccentric_anomaly(mean_anomaly, e):
+    """
+        Solves Kepler's equation M = E - e sin E with Newton's method
+
+        Returns:
+        array of eccentric anomalies in radians
+    """
+
+    E = np.where(e < 0.8, mean_anomaly, np.pi)
+    for _ in range(MAX_ITERATIONS):
+        delta = (E - e * np.sin(E) - mean_anomaly) / (1 - e * np.cos(E))
+        E = E - delta
+        if np.all(np.abs(delta) <= TOLERANCE):
+            break
+    return E
+
+
+def state_vectors(a, e, inclination, node, periapsis, mean_anomaly, mu):
+    """
+        Positions and velocities of bodies on elliptical orbits around
+        a central mass at the origin, the inverse of orbital_elements.
+        Angles are in degrees, an inclination of 0 is an orbit in the
+        x-z plane with the angular momentum along -y like the planets
+
+        Returns:
+        tuple of (N, 3) arrays (positions, velocities)
+    """
+
+    a, e = np.asarray(a, float), np.asarray(e, float)
+    inc, node, peri, mean = np.radians([inclination, node,
+                                        periapsis, mean_anomaly])
+    E = eccentric_anomaly(np.mod(mean, 2 * np.pi), e)
+    root = np.sqrt(1 - e ** 2)
+    r = a * (1 - e * np.cos(E))
+    # position and velocity in the plane of the orbit
+    x, y = a * (np.cos(E) - e), a * root * np.sin(E)
+    speed = np.sqrt(mu * a) / r
+    vx, vy = -speed * np.sin(E), speed * root * np.cos(E)
+
+    # rotate by the argument of periapsis, inclination and node
+    cos_o, sin_o = np.cos(node), np.sin(node)
+    cos_w, sin_w = np.cos(peri), np.sin(peri)
+    cos_i, sin_i = np.cos(inc), np.sin(inc)
+    p = np.stack([cos_o * cos_w - sin_o * sin_w * cos_i,
+                  sin_o * cos_w + cos_o * sin_w * cos_i,
+                  sin_w * sin_i], axis=-1)
+    q = np.stack([-cos_o * sin_w - sin_o * cos_w * cos_i,
+                  -sin_o * sin_w + cos_o * cos_w * cos_i,
+                  cos_w * sin_i], axis=-1)
+    pos = x[:, np.newaxis] * p + y[:, np.newaxis] * q
+    vel = vx[:, np.newaxis] * p + vy[:, np.newaxis] * q
+    # the reference plane x-y with z up becomes x-z with -y up
+    return pos[:, [0, 2, 1]] * [1, -1, 1], vel[:, [0, 2, 1]] * [1, -1, 1]
@@ -1,4 +1,4 @@
 import run_simulation
 
 if __name__ == '__main__':
-    run_simulation()
+    run_simulation.main()
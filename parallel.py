@@ -0,0 +1,57 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import forces
+
+
+class ThreadedKernel:
+    """
+        Splits the target bodies of a force kernel across a thread pool.
+        The threads share the position and mass arrays of the engine, so
+        nothing is copied, and NumPy releases the GIL inside the kernels.
+        Chunks are whole blocks of the direct sum, so every target is
+        calculated exactly as in the serial path and the results are
+        bit-identical
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = ThreadPoolExecutor(self.workers)
+
+    def chunks(self, targets):
+        """
+            Splits the targets into contiguous chunks of whole blocks,
+            a few per worker so a slow chunk does not hold up the rest
+
+            Returns:
+            list of slices into targets
+        """
+
+        nblocks = -(-len(targets) // forces.BLOCK_SIZE)
+        per_chunk = max(1, -(-nblocks // (4 * self.workers)))
+        size = per_chunk * forces.BLOCK_SIZE
+        return [slice(start, start + size)
+                for start in range(0, len(targets), size)]
+
+    def map_targets(self, kernel, targets):
+        """
+            Runs kernel(chunk_of_targets) on the pool and gathers
+            the rows of every chunk in order
+
+            Returns:
+            (len(targets), 3) array
+        """
+
+        out = np.empty((len(targets), 3))
+
+        def run(chunk):
+            out[chunk] = kernel(targets[chunk])
+
+        # list() waits for every chunk and raises their errors
+        list(self.executor.map(run, self.chunks(targets)))
+        return out
+
+    def shutdown(self):
+        """Stops the worker threads"""
+
+        self.executor.shutdown()
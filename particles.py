@@ -1,42 +1,88 @@
 import vpython as vp
+import numpy as np
 
 
 class Particle:
-    def __init__(self, position, radius, mass,
-                 velocity, color, texture, emissive):
+    def __init__(self, engine, position, radius, mass,
+                 velocity, color, texture, emissive, model=True, index=None):
 
+        self.engine = engine
         self.radius = radius
         self.mass = mass
         self.velocity0 = velocity
         self.position0 = position
         self.momentum0 = mass * self.velocity0
         self.color = color
+        self.texture = texture
+        self.emissive = emissive
         self.retain = 100
-        self.particle_model = vp.sphere(pos=self.position0,
+        # the state lives in the engine arrays,
+        # the sphere is only a view of it. Bodies loaded in bulk
+        # are already in the engine and only pass their index
+        if index is None:
+            index = engine.add_body(self.position0.value,
+                                    self.velocity0.value,
+                                    self.mass, self.radius)
+        self.index = index
+        # in large systems only the bodies near the camera
+        # have a sphere and arrows, the rest are drawn as points
+        self.particle_model = None
+        self.force_arrow = None
+        self.velocity_arrow = None
+        if model:
+            self.build_model(self.position0.value, self.momentum0.value)
+
+    def build_model(self, position, momentum, make_trail=True, forces=True,
+                    velocities=True, interval=1):
+        """
+            Creates the sphere and the force and velocity arrows at the
+            given position and momentum of the particle, taken from a
+            snapshot while the engine runs on the worker. The trail
+            gets a point every interval frames
+        """
+
+        position = vp.vector(*position)
+        momentum = vp.vector(*momentum)
+        self.particle_model = vp.sphere(pos=position,
                                         radius=self.radius,
                                         mass=self.mass,
-                                        momentum=self.momentum0,
+                                        momentum=momentum,
                                         color=self.color,
-                                        texture={'file': texture},
-                                        emissive=emissive,
+                                        texture={'file': self.texture},
+                                        emissive=self.emissive,
                                         shininess=0,
-                                        make_trail=True,
+                                        make_trail=make_trail,
+                                        interval=interval,
                                         retain=self.retain,
                                         )
 
-        self.force_arrow = vp.cone(pos=self.particle_model.pos,
-                                   radius=radius / 5,
+        self.force_arrow = vp.cone(pos=position,
+                                   radius=self.radius / 5,
                                    color=vp.color.red,
                                    axis=vp.vector(0, 0, 0),
                                    emissive=True,
-                                   shininess=0)
+                                   shininess=0,
+                                   visible=forces)
 
-        self.velocity_arrow = vp.cone(pos=self.particle_model.pos,
-                                      radius=radius / 5,
+        self.velocity_arrow = vp.cone(pos=position,
+                                      radius=self.radius / 5,
                                       color=vp.color.green,
                                       axis=vp.vector(0, 0, 0),
                                       emissive=True,
-                                      shininess=0)
+                                      shininess=0,
+                                      visible=velocities)
+
+    def remove_model(self):
+        """Deletes the sphere and the arrows from the scene"""
+
+        for model in (self.particle_model, self.force_arrow,
+                      self.velocity_arrow):
+            if model is not None:
+                model.visible = False
+                model.delete()
+        self.particle_model = None
+        self.force_arrow = None
+        self.velocity_arrow = None
 
     def get_vals(self):
         """
@@ -58,13 +104,35 @@ class Particle:
                 ]
         return vals
 
+    def sync_model(self):
+        """
+            Copies the position and momentum of the particle from
+            the engine to the sphere, only while the worker is paused
+        """
+
+        self.show(self.engine.origin + self.engine.pos[self.index],
+                  self.engine.mom[self.index])
+
+    def show(self, position, momentum):
+        """Sets the position and momentum shown by the sphere"""
+
+        if self.particle_model is None:
+            return
+        self.particle_model.pos = vp.vector(*position)
+        self.particle_model.momentum = vp.vector(*momentum)
+
     def reset_model(self):
         """
             Reset the values of the position, momentum,
             radius and mass for the particle
         """
 
+        self.engine.set_body(self.index, self.position0.value,
+                             self.velocity0.value,
+                             self.mass, self.radius)
         self.momentum0 = self.mass * self.velocity0
+        if self.particle_model is None:
+            return
         self.particle_model.radius = self.radius
         self.particle_model.mass = self.mass
         self.particle_model.pos = self.position0
@@ -72,20 +140,56 @@ class Particle:
         self.particle_model.clear_trail()
 
 
+def force_axes(force, radius):
+    """
+        Axes of the force arrows of many bodies in one pass,
+        100 times the force plus the radius so they start at the surface
+
+        Returns:
+        (N, 3) array, zero for bodies without a force
+    """
+
+    magnitude = np.linalg.norm(force, axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scale = np.where(magnitude > 0,
+                         (100 * magnitude + radius) / magnitude, 0)
+    return scale[:, np.newaxis] * force
+
+
+def velocity_axes(momentum, mass, radius):
+    """
+        Axes of the velocity arrows of many bodies in one pass,
+        the log of the speed plus the radius along the momentum
+
+        Returns:
+        (N, 3) array, zero for bodies at rest
+    """
+
+    magnitude = np.linalg.norm(momentum, axis=1)
+    moving = (magnitude > 0) & (mass > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scale = np.where(moving, (np.log10(magnitude / mass) + radius) /
+                         magnitude, 0)
+    return scale[:, np.newaxis] * momentum
+
+
 class Sun(Particle):
-    def __init__(self, position, radius, mass, velocity, color, texture):
-        super().__init__(position, radius, mass,
+    def __init__(self, engine, position, radius, mass,
+                 velocity, color, texture):
+        super().__init__(engine, position, radius, mass,
                          velocity, color, texture, True)
         print('Created sun')
 
 
 class Planet(Particle):
-    def __init__(self, position, radius, mass,
-                 velocity, color, texture, name):
+    def __init__(self, engine, position, radius, mass,
+                 velocity, color, texture, name, number,
+                 model=True, index=None):
         self.name = name
-        super().__init__(position, radius, mass,
-                         velocity, color, texture, False)
-        print('Created', self.name)
+        # stable number of the planet, kept when other planets are removed
+        self.number = number
+        super().__init__(engine, position, radius, mass,
+                         velocity, color, texture, False, model, index)
 
     def get_valstext(self):
         """
@@ -105,3 +209,28 @@ class Planet(Particle):
                    'radius: ' + str(self.radius) + ', ' + \
                    'mass: ' + str(self.mass)
         return valstext
+
+
+class PointCloud:
+    """
+        Draws every body of a large system as one vp.points object
+        that is refilled from the position array in one call per frame
+    """
+
+    POINT_RADIUS = 2  # pixels
+
+    def __init__(self, color=vp.color.white):
+        self.points = vp.points(pos=[], radius=self.POINT_RADIUS,
+                                color=color)
+
+    def update(self, pos):
+        """Replaces the points with the given (N, 3) positions"""
+
+        self.points.clear()
+        self.points.append([vp.vector(*p) for p in pos.tolist()])
+
+    def delete(self):
+        """Removes the points from the scene"""
+
+        self.points.visible = False
+        self.points.delete()
@@ -0,0 +1,192 @@
+import collections
+import hashlib
+import json
+import threading
+import numpy as np
+import kepler
+
+ORBITS = 3  # orbits of the edited planet that are looked ahead
+MAX_STEPS = 20000  # steps of the longest look-ahead, for unbound orbits
+POINTS = 300  # points kept of every predicted path
+PUBLISH_EVERY = 20  # points between the partial paths shown while predicting
+
+
+def state_key(system, steps):
+    """
+        Hash of everything that decides the predicted paths: the state
+        arrays, the settings of the engine and the number of steps
+
+        Returns:
+        hex string
+    """
+
+    settings = json.dumps({'G': system.G, 'dt': system.DELTA_TIME,
+                           'solver': system.solver, 'theta': system.theta,
+                           'softening': system.softening,
+                           'grid': system.grid,
+                           'short_range': system.short_range,
+                           'integrator': system.integrator.NAME,
+                           'precision': system.precision,
+                           'origin': system.origin.tolist(),
+                           'steps': steps}, sort_keys=True)
+    digest = hashlib.sha256(settings.encode())
+    for array in (system.pos, system.mom, system.mass, system.radius):
+        digest.update(np.ascontiguousarray(array).tobytes())
+    return digest.hexdigest()
+
+
+def look_ahead_steps(system, index, orbits=ORBITS, max_steps=MAX_STEPS):
+    """
+        Steps that take the body at index around the sun a few times,
+        from its two body orbit
+
+        Returns:
+        number of steps, max_steps for an unbound orbit
+    """
+
+    if index == 0 or len(system) < 2:
+        return max_steps
+    mu = system.G * (system.mass[0] + system.mass[index])
+    vel = system.vel
+    a = kepler.orbital_elements((system.pos[index] - system.pos[0])[np.newaxis],
+                                (vel[index] - vel[0])[np.newaxis], mu)[0][0]
+    if not a > 0:
+        return max_steps
+    period = 2 * np.pi * np.sqrt(a ** 3 / mu)
+    return int(min(max(np.ceil(orbits * period / system.DELTA_TIME), 1),
+                   max_steps))
+
+
+def look_ahead(system, steps, points=POINTS):
+    """
+        Advances the system by steps, keeping its positions at about
+        points evenly spaced times. A generator, so the caller can show
+        the paths as they grow and stop between any two points
+
+        Yields:
+        (points so far, N, 3) array of the positions of every body
+    """
+
+    every = max(1, steps // points)
+    npoints = steps // every + 1
+    paths = np.empty((npoints, len(system), 3))
+    paths[0] = system.world_pos
+    for point in range(1, npoints):
+        for _ in range(every):
+            system.step()
+        paths[point] = system.world_pos
+        yield paths[:point + 1]
+
+
+class OrbitPreview:
+    """
+        Predicts the paths of the bodies on a background thread from a
+        copy of the system. The finished paths are cached by the state
+        they start from, so predicting a state again, e.g. after undoing
+        an edit, is instant. A new prediction cancels the one in
+        progress at its next point
+    """
+
+    CACHE_SIZE = 16  # predictions kept
+
+    def __init__(self, cache_size=None):
+        self.cache_size = cache_size or self.CACHE_SIZE
+        self.cache = collections.OrderedDict()
+        self.condition = threading.Condition()
+        self.request = None  # (key, system, steps) waiting to be predicted
+        self.generation = 0  # changes to cancel the prediction in progress
+        self.paths = None  # (paths, complete) not taken yet
+        self.error = None  # message of the error that stopped a prediction
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def predict(self, system, index):
+        """
+            Starts predicting the paths of a copy of the system a few
+            orbits of the body at index ahead
+
+            Returns:
+            the paths if this state was predicted before, otherwise None
+            and the paths come from take_paths as they grow
+        """
+
+        steps = look_ahead_steps(system, index)
+        key = state_key(system, steps)
+        with self.condition:
+            self.generation += 1
+            self.paths = None
+            if key in self.cache:
+                self.request = None
+                self.cache.move_to_end(key)
+                return self.cache[key]
+            self.request = (key, system.copy(), steps)
+            self.condition.notify_all()
+        return None
+
+    def cancel(self):
+        """Stops the prediction in progress and drops its paths"""
+
+        with self.condition:
+            self.generation += 1
+            self.request = None
+            self.paths = None
+            self.error = None
+
+    def take_paths(self):
+        """
+            Returns:
+            tuple (paths, complete) of the latest paths of the
+            prediction, or None if there are no new ones
+        """
+
+        with self.condition:
+            paths, self.paths = self.paths, None
+        return paths
+
+    def take_error(self):
+        """
+            Returns:
+            message of the error that stopped the last prediction, or None
+        """
+
+        with self.condition:
+            error, self.error = self.error, None
+        return error
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while self.request is None:
+                    self.condition.wait()
+                (key, system, steps), self.request = self.request, None
+                generation = self.generation
+            try:
+                for point, paths in enumerate(look_ahead(system, steps)):
+                    if self.generation != generation:
+                        break
+                    if point % PUBLISH_EVERY == 0:
+                        self._publish(generation, paths.copy(), False)
+                else:
+                    self._finish(key, generation, paths)
+            except ValueError as error:
+                # e.g. a solver that cannot handle the system, the
+                # thread lives on for the next prediction
+                with self.condition:
+                    if self.generation == generation:
+                        self.error = str(error)
+
+    def _finish(self, key, generation, paths):
+        """Caches the finished paths and hands them to take_paths"""
+
+        with self.condition:
+            self.cache[key] = paths
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        self._publish(generation, paths, True)
+
+    def _publish(self, generation, paths, complete):
+        """Hands the paths to take_paths, unless they were cancelled"""
+
+        with self.condition:
+            if self.generation == generation:
+                self.paths = (paths, complete)
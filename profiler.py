@@ -0,0 +1,98 @@
+import collections
+import csv
+import json
+import time
+
+# stages of a frame, forces are timed inside the engine and integration
+# is the rest of the physics, both run on the physics worker
+STAGES = ['forces', 'integration', 'sync', 'graphs', 'wait']
+# stages of the render loop, which make up the wall time of a frame
+RENDER_STAGES = ['sync', 'graphs', 'wait']
+
+
+class FrameProfiler:
+    """
+        Times the stages of every rendered frame. While it is disabled
+        every call returns straight away, so it can stay in the loop
+        at no cost. The physics runs on the worker alongside the render
+        loop, its time is added with the snapshots of the frame
+    """
+
+    HISTORY = 10000  # frames kept for the dump
+    SUMMARY = 24  # frames averaged in the summary
+
+    def __init__(self):
+        self.enabled = False
+        self.frames = collections.deque(maxlen=self.HISTORY)
+        self.current = None
+        self.last = 0.0
+
+    def start_frame(self):
+        """Starts timing a frame"""
+
+        if not self.enabled:
+            return
+        self.current = dict.fromkeys(STAGES, 0.0)
+        self.current['physics'] = 0.0
+        self.last = time.perf_counter()
+
+    def lap(self, stage):
+        """Adds the time since the last lap to a stage"""
+
+        if self.current is None:
+            return
+        now = time.perf_counter()
+        self.current[stage] += now - self.last
+        self.last = now
+
+    def add(self, stage, seconds):
+        """Adds time that was measured elsewhere, e.g. by the engine"""
+
+        if self.current is not None:
+            self.current[stage] += seconds
+
+    def end_frame(self, steps):
+        """Stores the timings of the frame with the physics steps it ran"""
+
+        if self.current is None:
+            return
+        frame = self.current
+        frame['integration'] = max(frame.pop('physics') - frame['forces'], 0)
+        frame['frame'] = sum(frame[stage] for stage in RENDER_STAGES)
+        frame['steps'] = steps
+        self.frames.append(frame)
+        self.current = None
+
+    def summary(self):
+        """
+            Average milliseconds of each stage over the last SUMMARY
+            frames and the physics steps per second of wall time
+
+            Returns:
+            dictionary with a value for each stage, frame and steps_per_s
+        """
+
+        recent = list(self.frames)[-self.SUMMARY:]
+        if not recent:
+            return {}
+        averages = {stage: 1000 * sum(f[stage] for f in recent) / len(recent)
+                    for stage in STAGES + ['frame']}
+        wall = sum(f['frame'] for f in recent)
+        averages['steps_per_s'] = \
+            sum(f['steps'] for f in recent) / wall if wall > 0 else 0.0
+        return averages
+
+    def dump(self, path):
+        """Writes the timings of every kept frame to a json or csv file"""
+
+        columns = ['frame', 'steps'] + STAGES
+        if path.endswith('.json'):
+            with open(path, 'w') as f:
+                json.dump([{c: frame[c] for c in columns}
+                           for frame in self.frames], f, indent=1)
+        else:
+            with open(path, 'w', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=columns,
+                                        extrasaction='ignore')
+                writer.writeheader()
+                writer.writerows(self.frames)
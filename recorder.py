@@ -0,0 +1,210 @@
+import queue
+import struct
+import threading
+import numpy as np
+
+MAGIC = b'SSTR'
+VERSION = 1
+# magic, version, number of bodies, dtype, dt, G, steps between frames
+HEADER_FORMAT = '<4sIQ8sddQ'
+HEADER_SIZE = 64
+CHUNK_FRAMES = 256  # frames handed to the writer thread at once
+
+
+def frame_dtype(nbodies, dtype):
+    """
+        Record of one frame: the time and the positions
+        and velocities of all the bodies
+
+        Returns:
+        numpy structured dtype
+    """
+
+    return np.dtype([('time', '<f8'),
+                     ('pos', dtype, (nbodies, 3)),
+                     ('vel', dtype, (nbodies, 3))])
+
+
+class TrajectoryRecorder:
+    """
+        Streams the positions and velocities of all the bodies every
+        few steps to an append-only binary file. Frames are collected in
+        large chunks and written by a background thread, so the step loop
+        never waits for the disk. Add it to engine.observers to record
+    """
+
+    def __init__(self, path, nbodies, dt, G, every=1, dtype='<f8'):
+        self.path = path
+        self.nbodies = nbodies
+        self.every = every
+        self.dtype = frame_dtype(nbodies, dtype)
+        self.file = open(path, 'wb')
+        header = struct.pack(HEADER_FORMAT, MAGIC, VERSION, nbodies,
+                             np.dtype(dtype).str.encode(), dt, G, every)
+        self.file.write(header.ljust(HEADER_SIZE, b'\0'))
+        self.buffer = np.empty(CHUNK_FRAMES, dtype=self.dtype)
+        self.count = 0  # frames in the buffer
+        self.steps = 0  # steps seen since recording started
+        self.frames = 0  # frames recorded
+        # set when bodies merged, the file has room for nbodies only
+        self.ended = False
+        self.chunks = queue.Queue()
+        self.writer = threading.Thread(target=self._write_chunks, daemon=True)
+        self.writer.start()
+
+    def after_step(self, engine):
+        """
+            Records a frame every self.every steps, recording ends
+            when the number of bodies changes
+        """
+
+        if self.ended or len(engine) != self.nbodies:
+            self.ended = True
+            return
+        self.steps += 1
+        if self.steps % self.every == 0:
+            self.record(engine)
+
+    def record(self, engine):
+        """Copies the current state of the engine into the buffer"""
+
+        if len(engine) != self.nbodies:
+            raise ValueError('the recorder was opened for {} bodies, the '
+                             'engine has {}'.format(self.nbodies, len(engine)))
+        frame = self.buffer[self.count]
+        frame['time'] = engine.time
+        frame['pos'] = engine.world_pos
+        frame['vel'] = engine.vel
+        self.count += 1
+        self.frames += 1
+        if self.count == CHUNK_FRAMES:
+            self.flush()
+
+    def flush(self):
+        """Hands the buffered frames to the writer thread"""
+
+        if self.count:
+            self.chunks.put(self.buffer[:self.count])
+            self.buffer = np.empty(CHUNK_FRAMES, dtype=self.dtype)
+            self.count = 0
+
+    def close(self):
+        """Writes the remaining frames and closes the file"""
+
+        self.flush()
+        self.chunks.put(None)
+        self.writer.join()
+        self.file.close()
+
+    def _write_chunks(self):
+        """Writes chunks from the queue until close is called"""
+
+        while True:
+            chunk = self.chunks.get()
+            if chunk is None:
+                break
+            self.file.write(chunk.tobytes())
+        self.file.flush()
+
+
+def read_header(path):
+    """
+        Reads the header of a trajectory file
+
+        Returns:
+        dictionary with the number of bodies, dtype, dt, G and every
+    """
+
+    with open(path, 'rb') as f:
+        header = f.read(HEADER_SIZE)
+    magic, version, nbodies, dtype, dt, G, every = \
+        struct.unpack_from(HEADER_FORMAT, header)
+    if magic != MAGIC:
+        raise ValueError(path + ' is not a trajectory file')
+    if version != VERSION:
+        raise ValueError('unsupported trajectory version ' + str(version))
+    return {'nbodies': nbodies, 'dtype': dtype.rstrip(b'\0').decode(),
+            'dt': dt, 'G': G, 'every': every}
+
+
+def load_trajectory(path):
+    """
+        Memory maps the frames of a trajectory file without reading them.
+        A frame that was only partly written is left out
+
+        Returns:
+        tuple of (header dictionary, memmap of frames with the fields
+        time, pos and vel)
+    """
+
+    header = read_header(path)
+    dtype = frame_dtype(header['nbodies'], header['dtype'])
+    with open(path, 'rb') as f:
+        f.seek(0, 2)
+        nframes = (f.tell() - HEADER_SIZE) // dtype.itemsize
+    if nframes == 0:
+        return header, np.zeros(0, dtype=dtype)
+    frames = np.memmap(path, dtype=dtype, mode='r',
+                       offset=HEADER_SIZE, shape=(nframes,))
+    return header, frames
+
+
+class TrajectoryPlayer:
+    """
+        Plays back a trajectory file at any speed, reverse included.
+        The frames stay memory mapped and the state between two frames
+        is interpolated, so playback costs no physics
+    """
+
+    def __init__(self, path, speed=1.0):
+        self.header, self.frames = load_trajectory(path)
+        if len(self.frames) == 0:
+            raise ValueError(path + ' has no frames')
+        self.times = self.frames['time']
+        self.time = self.start
+        self.speed = speed  # simulated time per second of playback
+
+    @property
+    def start(self):
+        return float(self.times[0])
+
+    @property
+    def end(self):
+        return float(self.times[-1])
+
+    def seek(self, time):
+        """Moves playback to a time inside the recording"""
+
+        self.time = min(max(time, self.start), self.end)
+
+    def advance(self, wall_dt):
+        """
+            Moves playback on by wall_dt seconds at the current speed
+
+            Returns:
+            True if playback reached either end of the recording
+        """
+
+        self.seek(self.time + self.speed * wall_dt)
+        return self.time in (self.start, self.end)
+
+    def state(self):
+        """
+            Positions and velocities at the current time,
+            interpolated between the two nearest frames
+
+            Returns:
+            tuple of (N, 3) arrays (positions, velocities)
+        """
+
+        index = int(np.searchsorted(self.times, self.time, side='right')) - 1
+        index = min(max(index, 0), len(self.frames) - 1)
+        before = self.frames[index]
+        if index + 1 == len(self.frames):
+            return before['pos'].astype(float), before['vel'].astype(float)
+        after = self.frames[index + 1]
+        weight = (self.time - before['time']) / \
+            (after['time'] - before['time'])
+        pos = (1 - weight) * before['pos'] + weight * after['pos']
+        vel = (1 - weight) * before['vel'] + weight * after['vel']
+        return pos, vel
@@ -1,5 +1,195 @@
-import simulations
+import argparse
+import time
+import barnes_hut
+import collisions
+import diagnostics
+import engine
+import generators
+import integrators
+import recorder
+import system_io
 
-my_simulation = simulations.SolarSystem()
 
-my_simulation.run()
+def run_interactive():
+    """Opens the vpython scene and runs the simulation in it"""
+
+    # vpython is only imported when there is a scene to draw
+    import simulations
+
+    my_simulation = simulations.SolarSystem()
+    my_simulation.run()
+
+
+def run_batch(args):
+    """
+        Loads a system, advances it without drawing anything
+        and writes the final state of every body
+    """
+
+    if args.resume:
+        # the checkpoint brings its own time, G and settings
+        system = system_io.load_checkpoint(args.resume)
+        system.set_workers(args.workers)
+    elif args.generate:
+        system = generators.generate_system(args.generate, args.bodies,
+                                            sun_mass=args.sun_mass,
+                                            seed=args.seed,
+                                            G=args.G, dt=args.dt,
+                                            solver=args.solver,
+                                            theta=args.theta,
+                                            integrator=args.integrator,
+                                            softening=args.softening,
+                                            workers=args.workers,
+                                            grid=args.grid,
+                                            short_range=args.short_range,
+                                            precision=args.precision)
+    else:
+        system = system_io.engine_from_csv(args.system,
+                                           sun_mass=args.sun_mass,
+                                           G=args.G, dt=args.dt,
+                                           solver=args.solver,
+                                           theta=args.theta,
+                                           integrator=args.integrator,
+                                           softening=args.softening,
+                                           workers=args.workers,
+                                           grid=args.grid,
+                                           short_range=args.short_range,
+                                           precision=args.precision)
+    merger = None
+    if args.collisions:
+        # merges first, so the other observers see the merged bodies
+        merger = collisions.Collisions()
+        system.observers.append(merger)
+    if args.diagnostics:
+        checks = diagnostics.Diagnostics(args.diagnostics, args.max_drift,
+                                         merger)
+        # the drift is measured from the initial state
+        checks.sample(system)
+        system.observers.append(checks)
+    if args.checkpoint:
+        system.observers.append(
+            system_io.AutoCheckpoint(args.checkpoint, args.checkpoint_every))
+    if args.time is not None:
+        nsteps = int(round(args.time / system.DELTA_TIME))
+    else:
+        nsteps = args.steps
+
+    if args.record:
+        trajectory = recorder.TrajectoryRecorder(args.record, len(system),
+                                                 system.DELTA_TIME, system.G,
+                                                 args.record_every)
+        trajectory.record(system)
+        system.observers.append(trajectory)
+
+    energy0 = system.energy()
+    start = time.perf_counter()
+    for step in range(nsteps):
+        system.step()
+        if args.diagnostics and checks.tripped:
+            nsteps = step + 1
+            break
+    wall = time.perf_counter() - start
+    drift = abs((system.energy() - energy0) / energy0)
+
+    if args.output.endswith('.csv'):
+        system_io.save_state_csv(args.output, system)
+    else:
+        system_io.save_checkpoint(args.output, system)
+    print('{} bodies, {} steps to time {:g} in {:.3f} s ({:.0f} steps/s)'
+          .format(len(system), nsteps, system.time, wall,
+                  nsteps / wall if wall > 0 else float('inf')))
+    print('Relative energy error: {:.3e}'.format(drift))
+    print('{} state, {:.0f} bytes per body'.format(
+        system.precision, system.state_bytes() / len(system)))
+    print('Final state written to', args.output)
+    if args.diagnostics:
+        samples = checks.take_samples()
+        if samples:
+            print('Drift at time {:g}: energy {energy:.3e}, momentum '
+                  '{momentum:.3e}, angular momentum {angular_momentum:.3e}'
+                  .format(samples[-1][0], **samples[-1][1]))
+        if checks.tripped:
+            print('Stopped early, the energy drift went above',
+                  args.max_drift)
+    if args.collisions:
+        print(merger.merged, 'bodies merged,', len(system), 'left')
+    if args.record:
+        trajectory.close()
+        print(trajectory.frames, 'frames recorded to', args.record)
+        if trajectory.ended:
+            print('Recording ended early when bodies merged')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Solar system simulation')
+    parser.add_argument('--batch', action='store_true',
+                        help='run without the vpython scene')
+    parser.add_argument('--system', default='solar_system.csv',
+                        help='system file with the planets')
+    parser.add_argument('--generate', choices=generators.SYSTEMS,
+                        help='generate the system instead of loading --system')
+    parser.add_argument('--bodies', type=int, default=1000,
+                        help='number of bodies to generate')
+    parser.add_argument('--seed', type=int,
+                        help='seed of the generated system')
+    length = parser.add_mutually_exclusive_group()
+    length.add_argument('--steps', type=int, default=1000,
+                        help='number of steps to run')
+    length.add_argument('--time', type=float,
+                        help='simulated time to run, overrides --steps')
+    parser.add_argument('--resume',
+                        help='checkpoint to continue from instead of --system')
+    parser.add_argument('--output', default='final_state.csv',
+                        help='file for the final state of every body, '
+                             'a binary checkpoint unless it ends in .csv')
+    parser.add_argument('--checkpoint',
+                        help='checkpoint file saved during the run')
+    parser.add_argument('--checkpoint-every', type=int, default=1000,
+                        help='steps between the checkpoints')
+    parser.add_argument('--record',
+                        help='binary file to stream the trajectory to')
+    parser.add_argument('--record-every', type=int, default=1,
+                        help='steps between recorded frames')
+    parser.add_argument('--collisions', action='store_true',
+                        help='merge bodies that touch')
+    parser.add_argument('--diagnostics', type=int, metavar='STEPS',
+                        help='check the conserved quantities every STEPS')
+    parser.add_argument('--max-drift', type=float,
+                        help='stop when the energy drift of the checks '
+                             'goes above this')
+    parser.add_argument('--dt', type=float, default=engine.PhysicsEngine.DELTA_TIME)
+    parser.add_argument('--G', type=float, default=engine.PhysicsEngine.G)
+    parser.add_argument('--sun-mass', type=float,
+                        default=engine.PhysicsEngine.SUN['MASS'])
+    parser.add_argument('--integrator', default=engine.PhysicsEngine.INTEGRATOR,
+                        choices=list(integrators.INTEGRATORS))
+    parser.add_argument('--solver', default='direct',
+                        choices=engine.PhysicsEngine.SOLVERS)
+    parser.add_argument('--theta', type=float,
+                        default=barnes_hut.THETA)
+    parser.add_argument('--grid', type=int,
+                        default=engine.PhysicsEngine.GRID,
+                        help='cells along each side of the particle-mesh')
+    parser.add_argument('--short-range', action='store_true',
+                        help='add the direct sum of near pairs to the mesh, '
+                             'more accurate but slower than --solver direct '
+                             'for a few thousand bodies')
+    parser.add_argument('--precision', default=engine.PhysicsEngine.PRECISION,
+                        choices=list(engine.PhysicsEngine.PRECISIONS),
+                        help='floating point type of the state, float32 '
+                             'halves the memory with compensated drifts')
+    parser.add_argument('--softening', type=float,
+                        default=engine.PhysicsEngine.SOFTENING)
+    parser.add_argument('--workers', type=int,
+                        default=engine.PhysicsEngine.WORKERS,
+                        help='threads that share the force calculation')
+    args = parser.parse_args(argv)
+
+    if args.batch:
+        run_batch(args)
+    else:
+        run_interactive()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+import time
+
+
+class StepScheduler:
+    """
+        Fixed timestep scheduler that decides how many physics steps
+        are advanced for every rendered frame
+    """
+
+    SUBSTEPS = 1  # physics steps per rendered frame
+
+    def __init__(self, substeps=None, budget=None):
+        self.substeps = self.SUBSTEPS if substeps is None else substeps
+        # seconds of physics per frame, overrides substeps if set
+        self.budget = budget
+        self.last_steps = 0  # steps taken in the last frame
+
+    def run_frame(self, engine, step=None):
+        """
+            Advances the engine by the steps of one frame, either a fixed
+            number of substeps or as many as fit in the time budget.
+            At least one step is always taken. step replaces engine.step,
+            e.g. to let other threads change the engine between steps
+
+            Returns:
+            number of steps advanced
+        """
+
+        if step is None:
+            step = engine.step
+        steps = 0
+        if self.budget:
+            deadline = time.perf_counter() + self.budget
+            while True:
+                step()
+                steps += 1
+                if time.perf_counter() >= deadline:
+                    break
+        else:
+            for _ in range(self.substeps):
+                step()
+            steps = self.substeps
+        self.last_steps = steps
+        return steps
@@ -1,11 +1,36 @@
+import threading
+import types
 import vpython as vp
 import numpy as np
+import barnes_hut
+import collisions
+import diagnostics
+import engine
+import generators
+import integrators
 import particles
+import preview
+import profiler
+import recorder
+import scheduler
+import timeseries
+import system_io
+import worker
 
 class SolarSystem:
-    DELTA_TIME = 1.0E-1
-    G = 0.1  # newtons gravitational constant, 6.67e-11 to use real-world value
-    NUM_PLANETS = 10  # maximum number of planets
+    DELTA_TIME = engine.PhysicsEngine.DELTA_TIME
+    G = engine.PhysicsEngine.G
+    # above this many bodies they are drawn as points, with spheres
+    # only for the sun, the followed body and its nearest neighbours
+    LARGE_N = 200
+    NEIGHBOURS = 8
+    SOLVER = 'direct'  # method to calculate the gravitational forces
+    THETA = barnes_hut.THETA  # opening angle of the barnes-hut tree
+    FRAME_RATE = 24  # rendered frames per second
+    SUBSTEPS = scheduler.StepScheduler.SUBSTEPS  # physics steps per frame
+    INTEGRATOR = engine.PhysicsEngine.INTEGRATOR
+    # float64, or float32 for large systems with half the memory
+    PRECISION = engine.PhysicsEngine.PRECISION
     # skybox
     SKY = {}
     SKY['TEXTURE'] = 'https://images.unsplash.com/' \
@@ -20,9 +45,7 @@ class SolarSystem:
     SCENE['HEIGHT'] = 400
     SCENE['RANGE'] = 40
     # sun
-    SUN = {}
-    SUN['RADIUS'] = 10
-    SUN['MASS'] = 10000
+    SUN = engine.PhysicsEngine.SUN
     # symbols for the buttons
     SYMBOLS = {'START': '▶️', 'STOP': '⏸️'}
     # texts for the controls
@@ -33,16 +56,54 @@ class SolarSystem:
     TEXTS['VELOCITIES'] = 'HIDE VELOCITIES'
     TEXTS['SAVE'] = 'SAVE SYSTEM'
     TEXTS['LOAD'] = 'LOAD SYSTEM'
+    TEXTS['EXPORT'] = 'EXPORT CSV'
+    TEXTS['IMPORT'] = 'IMPORT CSV'
+    TEXTS['AUTOSAVE'] = 'AUTO SAVE'
+    TEXTS['COLLISIONS'] = 'MERGE COLLISIONS'
+    TEXTS['MERGED'] = ' Bodies merged: '
+    TEXTS['DIAGNOSTICS'] = 'CONSERVATION CHECKS'
+    TEXTS['DIAGNOSTICSEVERY'] = ' every n steps: '
+    TEXTS['AUTOPAUSE'] = 'PAUSE ON ENERGY DRIFT'
+    TEXTS['DRIFTLIMIT'] = ' above: '
+    TEXTS['DRIFTGRAPH'] = 'Relative drift: energy (red), momentum ' \
+                          '(green), angular momentum (blue)'
+    TEXTS['DRIFTPAUSED'] = ' Paused: energy drift {:.2e} above {:g}'
+    TEXTS['PROFILE'] = 'PROFILE'
+    TEXTS['DUMPPROFILE'] = 'DUMP PROFILE'
+    TEXTS['PROFILETEXT'] = ' frame {frame:.1f} ms: forces {forces:.1f}, ' \
+                           'integration {integration:.1f}, sync {sync:.1f}, ' \
+                           'graphs {graphs:.1f}, wait {wait:.1f}, ' \
+                           '{steps_per_s:.0f} steps/s'
     TEXTS['ADD'] = 'ADD PLANET'
+    TEXTS['GENERATE'] = 'GENERATE'
+    TEXTS['GENERATECOUNT'] = ' bodies: '
+    TEXTS['GENERATESEED'] = ' seed: '
     TEXTS['RESET'] = 'RESET SIMULATION'
     TEXTS['CLEAR'] = 'CLEAR SYSTEM'
     TEXTS['CONSTANT'] = '  Gravitational constant G: '
     TEXTS['CONSTANTREAL'] = ', real value: 6.67e-11 '
     TEXTS['SUN'] = ' Mass of the sun: '
     TEXTS['LIGHT'] = 'Ambient light'
-    TEXTS['CHOOSE'] = 'Choose what to edit for '
+    TEXTS['SOLVER'] = ' Force solver: '
+    TEXTS['THETA'] = ' Opening angle: '
+    TEXTS['SOLVERERROR'] = ' Force error: '
+    TEXTS['GRID'] = ' Mesh cells per side: '
+    TEXTS['SHORTRANGE'] = 'DIRECT NEAR PAIRS'
+    TEXTS['PREVIEWERROR'] = ' ERROR: no orbit preview, '
+    TEXTS['SUBSTEPS'] = ' Steps per frame: '
+    TEXTS['BUDGET'] = ' or physics ms per frame (0 = off): '
+    TEXTS['INTEGRATOR'] = ' Integrator: '
+    TEXTS['TIMESTEP'] = ' Time step: '
+    TEXTS['SOFTENING'] = ' Softening length: '
+    TEXTS['WORKERS'] = ' Force threads: '
+    TEXTS['EDIT'] = ' Edit planet number: '
+    TEXTS['PLOT'] = ' Plot planet number: '
+    TEXTS['REFRESH'] = ' Arrows and trails every n frames: '
+    TEXTS['FORCEGRAPH'] = ': force_mag'
+    TEXTS['DISTANCEGRAPH'] = ': distance from the sun'
+    TEXTS['CHOOSE'] = 'Choose what to edit'
     TEXTS['ERROREDIT'] = 'first choose the variable'
-    TEXTS['ERRORPLANET'] = 'Maximum number of planets in the system'
+    TEXTS['ERRORNUMBER'] = 'There is no planet with that number'
     TEXTS['NOERROR'] = ' Error: none'
     TEXTS["SYSTEMSAVED"] = ' System saved'
     TEXTS['PLANET'] = 'Planet '
@@ -57,25 +118,84 @@ class SolarSystem:
     TEXTS['ZVEL'] = 'zvel '
     TEXTS['RAD'] = 'rad  '
     TEXTS['MASS'] = 'mass  '
-    TEXTS['VAR_XPOS'] = 'xpos'
-    TEXTS['VAR_YPOS'] = 'ypos'
-    TEXTS['VAR_ZPOS'] = 'zpos'
-    TEXTS['VAR_XVEL'] = 'xvel'
-    TEXTS['VAR_YVEL'] = 'yvel'
-    TEXTS['VAR_ZVEL'] = 'zvel'
-    TEXTS['VAR_RAD'] = 'rad '
-    TEXTS['VAR_MASS'] = 'mass'
+    TEXTS['RECORD'] = 'RECORD RUN'
+    TEXTS['STOPRECORD'] = 'STOP RECORDING'
+    TEXTS['REPLAY'] = 'REPLAY RUN'
+    TEXTS['STOPREPLAY'] = 'BACK TO LIVE'
+    TEXTS['REPLAYSPEED'] = ' Replay speed (negative plays backwards): '
+    TEXTS['REPLAYTIME'] = ' Replay time '
+    COLLISIONS = True  # whether touching bodies merge
+    DIAGNOSTICS = True  # whether the conserved quantities are checked
+    DIAGNOSTICS_EVERY = diagnostics.INTERVAL  # steps between the checks
+    AUTO_PAUSE = True  # whether a large energy drift stops the run
+    DRIFT_LIMIT = diagnostics.THRESHOLD  # energy drift that stops the run
+    GRAPH_EVERY = 6  # frames between redraws of the graphs
+    REFRESH_EVERY = 2  # frames between new arrow directions and trail points
+    GENERATE_COUNT = 1000  # bodies added by the GENERATE button
+    # variables of a planet the editor can set, in the order of its menu
+    EDIT_VARIABLES = ['XPOS', 'YPOS', 'ZPOS', 'XVEL', 'YVEL', 'ZVEL',
+                      'RAD', 'MASS']
     # file to save/load the solar system
     SYSTEM_FILE = 'solar_system.csv'
+    # binary checkpoint with the full live state
+    CHECKPOINT_FILE = 'solar_system.ckpt'
+    AUTO_CHECKPOINT_STEPS = 1000  # steps between automatic checkpoints
+    # file the recorded run is written to and replayed from
+    TRAJECTORY_FILE = 'trajectory.bin'
+    # file the frame timings are dumped to, json if it ends in .json
+    PROFILE_FILE = 'profile.csv'
+    # simulated time per second of replay, the speed of the live run
+    REPLAY_SPEED = DELTA_TIME * FRAME_RATE
 
     def __init__(self):
-        self.time = 0
+        # headless state of the system, the particles are views of it
+        self.engine = engine.PhysicsEngine(G=self.G, dt=self.DELTA_TIME,
+                                           solver=self.SOLVER,
+                                           theta=self.THETA,
+                                           integrator=self.INTEGRATOR,
+                                           precision=self.PRECISION)
+        # merges touching bodies after every step
+        self.collisions = collisions.Collisions()
+        if self.COLLISIONS:
+            self.engine.observers.append(self.collisions)
+        # samples the drift of energy, momentum and angular momentum
+        self.diagnostics = diagnostics.Diagnostics(
+            self.DIAGNOSTICS_EVERY,
+            self.DRIFT_LIMIT if self.AUTO_PAUSE else None, self.collisions)
+        if self.DIAGNOSTICS:
+            self.engine.observers.append(self.diagnostics)
+        # decides how many physics steps are run for each rendered frame
+        self.scheduler = scheduler.StepScheduler(substeps=self.SUBSTEPS)
+        self.trajectory = None  # recorder of the live run
+        self.player = None  # plays back the recorded run in replay mode
+        self.replay_changed = False  # replay time moved while paused
 
         self.focus = 0  # index of the followed planet
+        # advances the engine on a background thread, the render loop
+        # only draws the snapshots it publishes
+        self.worker = worker.PhysicsWorker(self.engine, self.scheduler,
+                                           self.FRAME_RATE, self.collisions,
+                                           self.diagnostics)
+        self.snapshot = None  # latest snapshot drawn
+        # held by the render loop while it applies and draws a snapshot
+        # and by the widget callbacks, so the two never change the
+        # particles at once, whatever thread vpython calls back on
+        self.scene_lock = threading.RLock()
         self.running = False  # whether simulations runing or not
         self.particlelist = []  # list of bodies in the system
-        self.veditlist = []
-        self.valslist = []
+        self.cloud = None  # points for all the bodies of a large system
+        # whether trails and arrows are drawn, also for new spheres
+        self.show_trails = True
+        self.show_forces = True
+        self.show_velocities = True
+        self.arrow_frames = 0  # frames since the arrows were last pointed
+        self.planets = {}  # planets by their stable number
+        self.next_number = 1  # number given to the next planet
+        self.selected = None  # planet shown in the editor
+        # predicts the orbits a few periods ahead after every edit,
+        # drawn as a thin curve for every planet with a sphere
+        self.preview = preview.OrbitPreview()
+        self.preview_curves = {}  # curves by the number of their planet
 
         # assign the scene settings
         vp.scene.width = self.SCENE['WIDTH']
@@ -86,50 +206,65 @@ class SolarSystem:
         # add the sun to scene
         self.add_sun()
 
-        # create the graphs for the force and momentum of the first planet
-        graph_force = vp.graph(scroll=True, fast=True, xmin=0, xmax=40, ymin=0, align='left',
-                               width=self.SCENE['WIDTH']/2, height=self.SCENE['HEIGHT']/2,
-                               foreground=vp.vector(0.5, 0.5, 0.5), background=vp.color.white,
-                               xtitle='Time',
-                               title='Planet 1: force_mag')
-        graph_distance = vp.graph(scroll=True, fast=True, xmin=0, xmax=40, ymin=0, align='right',
-                                  width=self.SCENE['WIDTH']/2, height=self.SCENE['HEIGHT']/2,
-                                  foreground=vp.vector(0.5, 0.5, 0.5), background=vp.color.white,
-                                  xtitle='Time',
-                                  title='Planet 1: distance from the sun')
-        self.plot_force = vp.gcurve(graph=graph_force, color=vp.color.blue)
-        self.plot_distance = vp.gcurve(graph=graph_distance, color=vp.color.blue)
+        # create the graphs for the force and distance of the plotted
+        # planet, the whole run is shown from bounded series of points
+        self.graph_force = vp.graph(fast=True, ymin=0, align='left',
+                                    width=self.SCENE['WIDTH']/2, height=self.SCENE['HEIGHT']/2,
+                                    foreground=vp.vector(0.5, 0.5, 0.5), background=vp.color.white,
+                                    xtitle='Time')
+        self.graph_distance = vp.graph(fast=True, ymin=0, align='right',
+                                       width=self.SCENE['WIDTH']/2, height=self.SCENE['HEIGHT']/2,
+                                       foreground=vp.vector(0.5, 0.5, 0.5), background=vp.color.white,
+                                       xtitle='Time')
+        self.plot_force = vp.gcurve(graph=self.graph_force, color=vp.color.blue)
+        self.plot_distance = vp.gcurve(graph=self.graph_distance, color=vp.color.blue)
+        self.series_force = timeseries.TimeSeries()
+        self.series_distance = timeseries.TimeSeries()
+        # relative drift of the conserved quantities, sampled by the
+        # diagnostics every DIAGNOSTICS_EVERY steps
+        self.graph_drift = vp.graph(fast=True, ymin=0,
+                                    width=self.SCENE['WIDTH'], height=self.SCENE['HEIGHT']/2,
+                                    foreground=vp.vector(0.5, 0.5, 0.5), background=vp.color.white,
+                                    title=self.TEXTS['DRIFTGRAPH'], xtitle='Time')
+        self.plot_drift = {}
+        self.series_drift = {}
+        for quantity, color in zip(diagnostics.QUANTITIES,
+                                   (vp.color.red, vp.color.green, vp.color.blue)):
+            self.plot_drift[quantity] = vp.gcurve(graph=self.graph_drift, color=color)
+            self.series_drift[quantity] = timeseries.TimeSeries()
+        self.frames = 0  # frames since the graphs were last redrawn
+        self.set_plotted(1)
 
         vp.scene.append_to_caption(self.TEXTS['ONELINE'])
 
         # button to start/stop the simulation
-        self.b_startstop = vp.button(bind=self.button_startstop,
+        self.b_startstop = vp.button(bind=self.command(self.button_startstop),
                                      text=self.SYMBOLS['START'])
         vp.scene.append_to_caption(self.TEXTS['SPACES'])
 
         # button to cycle through the planet that the camera follows
-        self.b_camera = vp.button(bind=self.camera_follow,
+        self.b_camera = vp.button(bind=self.command(self.camera_follow),
                                   text=self.TEXTS['CAMERA'])
         vp.scene.append_to_caption(self.TEXTS['SPACES'])
 
         # button to toggle the visibility of the trails
-        self.b_trails = vp.button(bind=self.button_trails,
+        self.b_trails = vp.button(bind=self.command(self.button_trails),
                                   text=self.TEXTS['TRAILS'])
         vp.scene.append_to_caption(self.TEXTS['SPACES'])
 
         # button to toggle the drawing of gravitational force vectors
-        self.c_force = vp.checkbox(bind=self.checkbox_force_arrows,
+        self.c_force = vp.checkbox(bind=self.command(self.checkbox_force_arrows),
                                    text=self.TEXTS['FORCES'])
         vp.scene.append_to_caption('  ')
 
         # button to toggle the drawing of velocity vectors
-        self.c_velocity = vp.checkbox(bind=self.checkbox_velocity_arrows,
+        self.c_velocity = vp.checkbox(bind=self.command(self.checkbox_velocity_arrows),
                                       text=self.TEXTS['VELOCITIES'])
         vp.scene.append_to_caption(self.TEXTS['ONELINE'])
 
         # slider to set the level of ambient light
         vp.scene.append_to_caption(self.TEXTS['LIGHT'])
-        self.s_ambientlight = vp.slider(bind=self.slider_ambient_lights,
+        self.s_ambientlight = vp.slider(bind=self.command(self.slider_ambient_lights),
                                         min=0,
                                         max=1,
                                         left=0,
@@ -140,40 +275,202 @@ class SolarSystem:
         # text input to set the value of G
         self.w_big_g_text = vp.wtext(text=self.TEXTS['CONSTANT'] + str(self.G))
         vp.scene.append_to_caption(self.TEXTS['CONSTANTREAL'])
-        self.w_big_g_value = vp.winput(bind=self.winput_g,
+        self.w_big_g_value = vp.winput(bind=self.command(self.winput_g),
                                        text=self.G)
 
         #  display the mass of the sun
-        vp.scene.append_to_caption(self.TEXTS['SUN'] + str(self.particlelist[0].particle_model.mass))
+        vp.scene.append_to_caption(self.TEXTS['SUN'] + str(self.particlelist[0].mass))
 
         vp.scene.append_to_caption(self.TEXTS['ONELINE'])
 
+        # menu to choose the method that calculates the forces
+        vp.scene.append_to_caption(self.TEXTS['SOLVER'])
+        self.m_solver = vp.menu(choices=self.engine.SOLVERS,
+                                selected=self.engine.solver,
+                                bind=self.command(self.menu_solver))
+
+        # text input to set the opening angle of the barnes-hut tree
+        vp.scene.append_to_caption(self.TEXTS['THETA'])
+        self.w_theta = vp.winput(bind=self.command(self.winput_theta),
+                                 text=self.engine.theta)
+
+        # text input to set the resolution of the particle-mesh, and
+        # a checkbox to add the direct force of the near pairs to it
+        vp.scene.append_to_caption(self.TEXTS['GRID'])
+        self.w_grid = vp.winput(bind=self.command(self.winput_grid),
+                                text=self.engine.grid)
+        self.c_short_range = vp.checkbox(bind=self.command(self.checkbox_short_range),
+                                         text=self.TEXTS['SHORTRANGE'],
+                                         checked=self.engine.short_range)
+        self.t_solver_error = vp.wtext(text='')
+        vp.scene.append_to_caption(self.TEXTS['ONELINE'])
+
+        # text inputs to set the physics steps run for every frame
+        vp.scene.append_to_caption(self.TEXTS['SUBSTEPS'])
+        self.w_substeps = vp.winput(bind=self.command(self.winput_substeps),
+                                    text=self.scheduler.substeps)
+        vp.scene.append_to_caption(self.TEXTS['BUDGET'])
+        self.w_budget = vp.winput(bind=self.command(self.winput_budget), text=0)
+        vp.scene.append_to_caption(self.TEXTS['ONELINE'])
+
+        # menu to choose the method that advances the system
+        vp.scene.append_to_caption(self.TEXTS['INTEGRATOR'])
+        self.m_integrator = vp.menu(choices=list(integrators.INTEGRATORS),
+                                    selected=self.INTEGRATOR,
+                                    bind=self.command(self.menu_integrator))
+
+        # text input to set the time step of the integrator
+        vp.scene.append_to_caption(self.TEXTS['TIMESTEP'])
+        self.w_timestep = vp.winput(bind=self.command(self.winput_timestep),
+                                    text=self.engine.DELTA_TIME)
+
+        # text input to set the softening length of the forces
+        vp.scene.append_to_caption(self.TEXTS['SOFTENING'])
+        self.w_softening = vp.winput(bind=self.command(self.winput_softening),
+                                     text=self.engine.softening)
+
+        # text input to set the threads sharing the force calculation
+        vp.scene.append_to_caption(self.TEXTS['WORKERS'])
+        self.w_workers = vp.winput(bind=self.command(self.winput_workers),
+                                   text=self.engine.workers)
+        vp.scene.append_to_caption(self.TEXTS['ONELINE'])
+
         # button to reset the simulation
-        self.b_reset = vp.button(bind=self.button_reset,
+        self.b_reset = vp.button(bind=self.command(self.button_reset),
                                    text=self.TEXTS['RESET'])
 
         # button to save the solar system
-        self.b_save = vp.button(bind=self.button_save,
+        self.b_save = vp.button(bind=self.command(self.button_save),
                                 text=self.TEXTS['SAVE'])
 
         # button to load the solar system
-        self.b_load = vp.button(bind=self.button_load,
+        self.b_load = vp.button(bind=self.command(self.button_load),
                                 text=self.TEXTS['LOAD'])
 
+        # button to export the initial conditions of the planets to csv
+        self.b_export = vp.button(bind=self.command(self.button_export),
+                                  text=self.TEXTS['EXPORT'])
+
+        # button to import planets from csv
+        self.b_import = vp.button(bind=self.command(self.button_import),
+                                  text=self.TEXTS['IMPORT'])
+
+        # checkbox to save a checkpoint every AUTO_CHECKPOINT_STEPS
+        self.c_autosave = vp.checkbox(bind=self.command(self.checkbox_autosave),
+                                      text=self.TEXTS['AUTOSAVE'])
+        self.autosave = system_io.AutoCheckpoint(self.CHECKPOINT_FILE,
+                                                 self.AUTO_CHECKPOINT_STEPS)
+
         self.t_error = vp.wtext(text=self.TEXTS['NOERROR'])
         vp.scene.append_to_caption(self.TEXTS['ONELINE'])
 
+        # checkbox to merge bodies that touch
+        self.c_collisions = vp.checkbox(bind=self.command(self.checkbox_collisions),
+                                        text=self.TEXTS['COLLISIONS'],
+                                        checked=self.COLLISIONS)
+        vp.scene.append_to_caption(self.TEXTS['SPACES'])
+
+        # checkbox to time the stages of every frame, and a button
+        # to write the timings to the profile file
+        self.profiler = profiler.FrameProfiler()
+        self.c_profile = vp.checkbox(bind=self.command(self.checkbox_profile),
+                                     text=self.TEXTS['PROFILE'])
+        vp.scene.append_to_caption(self.TEXTS['SPACES'])
+        self.b_dump_profile = vp.button(bind=self.command(self.button_dump_profile),
+                                        text=self.TEXTS['DUMPPROFILE'])
+        self.t_profile = vp.wtext(text='')
+        vp.scene.append_to_caption(self.TEXTS['ONELINE'])
+
+        # checkbox to sample the drift of the conserved quantities, how
+        # often, and whether an energy drift above a limit stops the run
+        self.c_diagnostics = vp.checkbox(bind=self.command(self.checkbox_diagnostics),
+                                         text=self.TEXTS['DIAGNOSTICS'],
+                                         checked=self.DIAGNOSTICS)
+        vp.scene.append_to_caption(self.TEXTS['DIAGNOSTICSEVERY'])
+        self.w_diagnostics_every = vp.winput(bind=self.command(self.winput_diagnostics_every),
+                                             text=self.DIAGNOSTICS_EVERY)
+        vp.scene.append_to_caption(self.TEXTS['SPACES'])
+        self.c_autopause = vp.checkbox(bind=self.command(self.checkbox_autopause),
+                                       text=self.TEXTS['AUTOPAUSE'],
+                                       checked=self.AUTO_PAUSE)
+        vp.scene.append_to_caption(self.TEXTS['DRIFTLIMIT'])
+        self.w_drift_limit = vp.winput(bind=self.command(self.winput_drift_limit),
+                                       text=self.DRIFT_LIMIT)
+        vp.scene.append_to_caption(self.TEXTS['ONELINE'])
+
+        # button to record the run to the trajectory file
+        self.b_record = vp.button(bind=self.command(self.button_record),
+                                  text=self.TEXTS['RECORD'])
+
+        # button to switch between replaying the recorded run and live
+        self.b_replay = vp.button(bind=self.command(self.button_replay),
+                                  text=self.TEXTS['REPLAY'])
+
+        # text input to set the replay speed
+        vp.scene.append_to_caption(self.TEXTS['REPLAYSPEED'])
+        self.w_replay_speed = vp.winput(bind=self.command(self.winput_replay_speed),
+                                        text=self.REPLAY_SPEED)
+
+        # slider to scrub through the recorded run
+        vp.scene.append_to_caption(self.TEXTS['REPLAYTIME'])
+        self.s_replay = vp.slider(bind=self.command(self.slider_replay),
+                                  min=0,
+                                  max=1,
+                                  length=300,
+                                  value=0,
+                                  disabled=True)
+        vp.scene.append_to_caption(self.TEXTS['ONELINE'])
+
 
         #  button to add a planet
-        self.b_add = vp.button(bind=self.button_add,
+        self.b_add = vp.button(bind=self.command(self.button_add),
                                text=self.TEXTS['ADD'])
+        vp.scene.append_to_caption(self.TEXTS['SPACES'])
 
+        # button to add many planets at once from a generator,
+        # with the number of planets and the seed of the generator
+        self.b_generate = vp.button(bind=self.command(self.button_generate),
+                                    text=self.TEXTS['GENERATE'])
+        self.m_generator = vp.menu(choices=list(generators.PLANET_GENERATORS))
+        vp.scene.append_to_caption(self.TEXTS['GENERATECOUNT'])
+        self.w_generate_count = vp.winput(bind=self.command(self.winput_generate_count),
+                                          text=self.GENERATE_COUNT)
+        vp.scene.append_to_caption(self.TEXTS['GENERATESEED'])
+        self.w_generate_seed = vp.winput(bind=self.command(self.winput_generate_seed),
+                                         text='')
+        self.generate_seed = None
+        vp.scene.append_to_caption(self.TEXTS['ONELINE'])
+
+        # one editor for every planet: choose the planet by its number,
+        # then the variable, then type the new value
+        vp.scene.append_to_caption(self.TEXTS['EDIT'])
+        self.w_select = vp.winput(bind=self.command(self.winput_select), text='')
+        vp.scene.append_to_caption(self.TEXTS['SPACES'])
+        self.m_edit = vp.menu(choices=[self.TEXTS['CHOOSE']] +
+                              [self.TEXTS[var] for var in self.EDIT_VARIABLES],
+                              bind=self.command(self.menu_edit))
+        self.w_edit = vp.winput(bind=self.command(self.set_value),
+                                text=self.TEXTS['ERROREDIT'],
+                                disabled=True)
+        self.t_values = vp.wtext(text='')
+        vp.scene.append_to_caption(self.TEXTS['ONELINE'])
+
+        # text input to choose the planet shown in the graphs
+        vp.scene.append_to_caption(self.TEXTS['PLOT'])
+        self.w_plot = vp.winput(bind=self.command(self.winput_plot),
+                                text=self.plotted)
+
+        # text input to set how often arrows and trails are updated
+        vp.scene.append_to_caption(self.TEXTS['REFRESH'])
+        self.w_refresh = vp.winput(bind=self.command(self.winput_refresh),
+                                   text=self.REFRESH_EVERY)
         vp.scene.append_to_caption(self.TEXTS['ONELINE'])
 
     def add_sun(self):
         """Adds the sun to the solar system"""
 
-        sun = particles.Sun(position=vp.vector(0, 0, 0),
+        sun = particles.Sun(engine=self.engine,
+                            position=vp.vector(0, 0, 0),
                             radius=self.SUN['RADIUS'], mass=self.SUN['MASS'],
                             velocity=vp.vector(0, 0, 0),
                             color=vp.color.yellow,
@@ -181,6 +478,35 @@ class SolarSystem:
                             )
         self.particlelist.append(sun)
 
+    @property
+    def running(self):
+        return self._running
+
+    @running.setter
+    def running(self, running):
+        # in replay mode running plays the recording, not the physics
+        self._running = running
+        self.worker.set_running(running and self.player is None)
+
+    def command(self, callback):
+        """
+            Wraps a widget callback so it runs between two physics
+            steps and between two frames. Bodies merged since the last
+            frame are removed first, so the callback sees the particles
+            and the engine agree
+
+            Returns:
+            function to bind to the widget
+        """
+
+        def run(widget):
+            with self.scene_lock, self.worker.paused():
+                self.apply_snapshot(self.worker.current_snapshot())
+                callback(widget)
+                self.snapshot = self.worker.current_snapshot()
+
+        return run
+
     def button_startstop(self, b):
         """Callback for the button to start/stop the simulation"""
 
@@ -188,6 +514,7 @@ class SolarSystem:
             # toggles the running state
             self.running = not self.running
             if self.running:
+                self.clear_preview()
                 self.b_startstop.text = self.SYMBOLS['STOP']
             else:
                 self.b_startstop.text = self.SYMBOLS['START']
@@ -203,25 +530,134 @@ class SolarSystem:
         else:
             self.focus = 0
 
-    def update_velocity_arrow(self, particle):
-        """Function to update the velocity arrow"""
+    def modelled_particles(self):
+        """
+            Returns:
+            list of the particles that have a sphere and arrows
+        """
+
+        return [p for p in self.particlelist if p.particle_model is not None]
+
+    def large_system(self):
+        """
+            Returns:
+            whether the system is drawn as points
+        """
+
+        return len(self.particlelist) > self.LARGE_N
+
+    def update_render_mode(self, state=None):
+        """
+            Switches between spheres for every body and points
+            for every body when the system crosses LARGE_N.
+            state is a snapshot, or the engine while it is paused
+        """
 
-        if ((not particle.particle_model.mass == 0) and
-           (not vp.mag(particle.particle_model.momentum) == 0)):
-            mass = particle.particle_model.mass
-            radius = particle.particle_model.radius
-            momentum = particle.particle_model.momentum
-            momentum_mag = vp.mag(momentum)
-            velocity_log = vp.log(momentum_mag / mass, 10)
-            particle.velocity_arrow.axis = (velocity_log + radius) * \
-                                           (momentum / momentum_mag)
-        particle.velocity_arrow.pos = particle.particle_model.pos
+        if state is None:
+            pos, mom = self.engine.world_pos, self.engine.mom
+        else:
+            pos, mom = state.pos, state.mom
+        if self.large_system():
+            if self.cloud is None:
+                self.cloud = particles.PointCloud()
+            self.cloud.update(pos)
+            self.update_detail(pos, mom)
+        else:
+            if self.cloud is not None:
+                self.cloud.delete()
+                self.cloud = None
+            for p in self.particlelist:
+                if p.particle_model is None:
+                    self.build_model(p, pos, mom)
+
+    def update_detail(self, pos, mom):
+        """
+            Keeps spheres only for the sun, the followed body and
+            its nearest neighbours, the level of detail of a large system
+        """
+
+        distance = np.linalg.norm(pos - pos[self.focus], axis=1)
+        nearest = min(self.NEIGHBOURS + 1, len(distance))
+        near = set(np.argpartition(distance, nearest - 1)[:nearest].tolist())
+        near.add(0)
+        for index, p in enumerate(self.particlelist):
+            if index in near and p.particle_model is None:
+                self.build_model(p, pos, mom)
+            elif index not in near and p.particle_model is not None:
+                p.remove_model()
+
+    def build_model(self, particle, pos, mom):
+        """
+            Creates the sphere and arrows of a particle with the scene
+            settings, at its row of the pos and mom arrays of a snapshot
+            or of the paused engine
+        """
+
+        particle.build_model(pos[particle.index], mom[particle.index],
+                             self.show_trails, self.show_forces,
+                             self.show_velocities, self.REFRESH_EVERY)
+
+    def update_arrows(self, models, state, refresh=False):
+        """
+            Moves the visible arrows with their spheres. Their axes are
+            calculated for all the bodies at once and only every
+            REFRESH_EVERY frames, hidden arrows are not touched at all.
+            state has the pos, mom, force, mass and radius arrays
+        """
+
+        self.arrow_frames += 1
+        if not models or not (self.show_forces or self.show_velocities):
+            return
+        refresh = refresh or self.arrow_frames >= self.REFRESH_EVERY
+        index = np.array([p.index for p in models])
+        if refresh:
+            self.arrow_frames = 0
+            radius = state.radius[index]
+            if self.show_forces:
+                force_axes = particles.force_axes(state.force[index],
+                                                  radius).tolist()
+            if self.show_velocities:
+                velocity_axes = particles.velocity_axes(
+                    state.mom[index], state.mass[index], radius).tolist()
+        for k, p in enumerate(models):
+            position = p.particle_model.pos
+            if self.show_forces:
+                p.force_arrow.pos = position
+                if refresh:
+                    p.force_arrow.axis = vp.vector(*force_axes[k])
+            if self.show_velocities:
+                p.velocity_arrow.pos = position
+                if refresh:
+                    p.velocity_arrow.axis = vp.vector(*velocity_axes[k])
+
+    def refresh_arrows(self):
+        """Redraws the arrows of the live state straight away"""
+
+        if self.player is None:
+            self.update_arrows(self.modelled_particles(), self.engine, True)
+        else:
+            self.arrow_frames = self.REFRESH_EVERY
+
+    def winput_refresh(self, w):
+        """
+            Callback to the text input that sets the frames between
+            updates of the arrows and trails, only if a positive integer
+        """
+
+        if type(w.number) == int and w.number > 0:
+            self.REFRESH_EVERY = w.number
+            for p in self.modelled_particles():
+                p.particle_model.interval = w.number
+            self.t_error.text = self.TEXTS['NOERROR']
+        else:
+            self.t_error.text = 'The refresh has to be a positive integer'
 
     def button_trails(self, b):
         """Callback to the button that toggles the drawing of the trails"""
 
-        for p in self.particlelist:
-            p.particle_model.make_trail = not p.particle_model.make_trail
+        self.show_trails = not self.show_trails
+        for p in self.modelled_particles():
+            p.particle_model.make_trail = self.show_trails
             p.particle_model.clear_trail()
 
     def checkbox_force_arrows(self, b):
@@ -230,8 +666,10 @@ class SolarSystem:
             the drawing of the force vectors
         """
 
-        for p in self.particlelist:
-            p.force_arrow.visible = not p.force_arrow.visible
+        self.show_forces = not self.show_forces
+        for p in self.modelled_particles():
+            p.force_arrow.visible = self.show_forces
+        self.refresh_arrows()
 
     def checkbox_velocity_arrows(self, b):
         """
@@ -239,8 +677,10 @@ class SolarSystem:
             the drawing of the velocity vectors
         """
 
-        for p in self.particlelist:
-            p.velocity_arrow.visible = not p.velocity_arrow.visible
+        self.show_velocities = not self.show_velocities
+        for p in self.modelled_particles():
+            p.velocity_arrow.visible = self.show_velocities
+        self.refresh_arrows()
 
     def slider_ambient_lights(self, s):
         """
@@ -258,11 +698,139 @@ class SolarSystem:
 
         if (type(w.number) == int) or (type(w.number) == float):
             self.G = w.number
+            self.engine.G = self.G
             self.w_big_g_text.text = self.TEXTS['CONSTANT'] + str(self.G)
             self.t_error.text = self.TEXTS['NOERROR']
         else:
             self.t_error.text = 'G has to be integer or float'
 
+    def menu_solver(self, m):
+        """Callback to the menu that sets the force solver"""
+
+        self.engine.solver = m.selected
+        self.show_solver_error()
+
+    def winput_theta(self, w):
+        """
+            Callback to the text input that sets the opening
+            angle of the barnes-hut tree only if positive
+        """
+
+        if ((type(w.number) == int) or (type(w.number) == float)) and \
+           w.number >= 0:
+            self.engine.theta = w.number
+            self.t_error.text = self.TEXTS['NOERROR']
+            self.show_solver_error()
+        else:
+            self.t_error.text = 'The opening angle has to be a positive number'
+
+    def winput_grid(self, w):
+        """
+            Callback to the text input that sets the cells along each
+            side of the particle-mesh only if an integer of at least 8
+        """
+
+        if type(w.number) == int and w.number >= 8:
+            self.engine.grid = w.number
+            self.t_error.text = self.TEXTS['NOERROR']
+            self.show_solver_error()
+        else:
+            self.t_error.text = 'The mesh needs at least 8 cells per side'
+
+    def checkbox_short_range(self, c):
+        """
+            Callback to the checkbox that adds the direct force
+            of the near pairs to the particle-mesh
+        """
+
+        self.engine.short_range = c.checked
+        self.show_solver_error()
+
+    def winput_substeps(self, w):
+        """
+            Callback to the text input that sets the number
+            of physics steps per frame only if a positive integer
+        """
+
+        if type(w.number) == int and w.number > 0:
+            self.scheduler.substeps = w.number
+            self.t_error.text = self.TEXTS['NOERROR']
+        else:
+            self.t_error.text = 'Steps per frame has to be a positive integer'
+
+    def winput_budget(self, w):
+        """
+            Callback to the text input that sets the milliseconds
+            of physics per frame, 0 goes back to the steps per frame
+        """
+
+        if ((type(w.number) == int) or (type(w.number) == float)) and \
+           w.number >= 0:
+            self.scheduler.budget = w.number / 1000
+            self.t_error.text = self.TEXTS['NOERROR']
+        else:
+            self.t_error.text = 'The time per frame has to be a positive number'
+
+    def menu_integrator(self, m):
+        """Callback to the menu that sets the integrator"""
+
+        self.engine.set_integrator(m.selected)
+
+    def winput_timestep(self, w):
+        """
+            Callback to the text input that sets the
+            time step only if a positive number
+        """
+
+        if ((type(w.number) == int) or (type(w.number) == float)) and \
+           w.number > 0:
+            self.engine.DELTA_TIME = w.number
+            self.t_error.text = self.TEXTS['NOERROR']
+        else:
+            self.t_error.text = 'The time step has to be a positive number'
+
+    def winput_softening(self, w):
+        """
+            Callback to the text input that sets the
+            softening length only if a positive number or 0
+        """
+
+        if ((type(w.number) == int) or (type(w.number) == float)) and \
+           w.number >= 0:
+            self.engine.softening = w.number
+            self.t_error.text = self.TEXTS['NOERROR']
+        else:
+            self.t_error.text = 'The softening length has to be a positive number'
+
+    def winput_workers(self, w):
+        """
+            Callback to the text input that sets the number of
+            threads for the forces only if a positive integer
+        """
+
+        if type(w.number) == int and w.number > 0:
+            self.engine.set_workers(w.number)
+            self.t_error.text = self.TEXTS['NOERROR']
+        else:
+            self.t_error.text = 'The number of threads has to be a positive integer'
+
+    def show_solver_error(self):
+        """
+            Displays the error of the barnes-hut or mesh forces
+            against the direct sum for the current state
+        """
+
+        if self.engine.solver != 'direct' and len(self.engine) > 1:
+            try:
+                error = self.engine.solver_error()
+            except ValueError as message:
+                self.t_solver_error.text = ' ERROR: ' + str(message)
+                return
+            self.t_solver_error.text = self.TEXTS['SOLVERERROR'] + \
+                'mean {:.2e}, max {:.2e}'.format(error['mean'], error['max'])
+        else:
+            self.t_solver_error.text = ''
+
     def stop_simulation(self):
         """Callback to the button that stops the simulation"""
 
@@ -273,235 +841,733 @@ class SolarSystem:
         """Callback to the button to reset the simulation"""
 
         if len(self.particlelist) > 1:
+            # the recorded run ends where the reset starts
+            self.stop_recording()
             for p in self.particlelist:
                 p.reset_model()
-                p.particle_model.clear_trail()
-            self.plot_force.delete()
-            self.plot_distance.delete()
+            if self.cloud is not None:
+                self.cloud.update(self.engine.world_pos)
+            self.clear_graphs()
+            self.restart_diagnostics()
+            self.clear_preview()
             # toggles the running state
             self.running = False
             self.b_startstop.text = self.SYMBOLS['START']
 
+    def button_record(self, b):
+        """
+            Callback to the button that starts and stops
+            recording every step of the run to the trajectory file
+        """
+
+        if self.trajectory is None:
+            self.trajectory = recorder.TrajectoryRecorder(
+                self.TRAJECTORY_FILE, len(self.engine),
+                self.engine.DELTA_TIME, self.engine.G)
+            self.trajectory.record(self.engine)
+            self.engine.observers.append(self.trajectory)
+            self.b_record.text = self.TEXTS['STOPRECORD']
+        else:
+            self.stop_recording()
+
+    def stop_recording(self):
+        """Closes the trajectory file if a run is being recorded"""
+
+        if self.trajectory is not None:
+            self.engine.observers.remove(self.trajectory)
+            self.trajectory.close()
+            self.trajectory = None
+            self.b_record.text = self.TEXTS['RECORD']
+
+    def button_replay(self, b):
+        """
+            Callback to the button that switches between replaying
+            the trajectory file and the live simulation
+        """
+
+        if self.player is None:
+            self.stop_recording()
+            try:
+                player = recorder.TrajectoryPlayer(self.TRAJECTORY_FILE,
+                                                   self.REPLAY_SPEED)
+            except (OSError, ValueError):
+                self.t_error.text = ' ERROR: Could not replay ' + \
+                                    self.TRAJECTORY_FILE
+                return
+            if player.header['nbodies'] != len(self.particlelist):
+                self.t_error.text = ' ERROR: the recorded run has a ' \
+                                    'different number of bodies'
+                return
+            self.stop_simulation()
+            self.player = player
+            self.s_replay.min = player.start
+            self.s_replay.max = player.end
+            self.s_replay.value = player.start
+            self.s_replay.disabled = False
+            self.replay_changed = True
+            self.b_replay.text = self.TEXTS['STOPREPLAY']
+            self.t_error.text = self.TEXTS['NOERROR']
+        else:
+            # go back to the live state, which replay did not touch
+            self.stop_simulation()
+            self.player = None
+            self.s_replay.disabled = True
+            self.b_replay.text = self.TEXTS['REPLAY']
+            for p in self.modelled_particles():
+                p.sync_model()
+                p.particle_model.clear_trail()
+            if self.cloud is not None:
+                self.cloud.update(self.engine.world_pos)
+
+    def slider_replay(self, s):
+        """Callback to the slider that moves the replay to a time"""
+
+        if self.player is not None:
+            self.player.seek(s.value)
+            self.replay_changed = True
+
+    def winput_replay_speed(self, w):
+        """
+            Callback to the text input that sets the replay speed
+            only if integer or float
+        """
+
+        if (type(w.number) == int) or (type(w.number) == float):
+            self.REPLAY_SPEED = w.number
+            if self.player is not None:
+                self.player.speed = w.number
+            self.t_error.text = self.TEXTS['NOERROR']
+        else:
+            self.t_error.text = 'The replay speed has to be integer or float'
+
+    def show_replay_frame(self):
+        """
+            Moves the spheres and arrows to the recorded state at
+            the replay time, a jump in time starts new trails
+        """
+
+        pos, vel = self.player.state()
+        if self.cloud is not None:
+            self.cloud.update(pos)
+        models = self.modelled_particles()
+        mom = self.engine.mass[:, np.newaxis] * vel
+        for p in models:
+            if self.replay_changed:
+                p.particle_model.clear_trail()
+            p.show(pos[p.index], mom[p.index])
+        # forces are not recorded
+        state = types.SimpleNamespace(pos=pos, mom=mom,
+                                      force=np.zeros_like(pos),
+                                      mass=self.engine.mass,
+                                      radius=self.engine.radius)
+        self.update_arrows(models, state, self.replay_changed)
+        self.replay_changed = False
+
     def button_add(self, b):
+        """Callback to the button that adds a planet"""
+
+        self.button_reset(0)
+        self.b_load.delete()
+        self.b_import.delete()
+
+        # get the number of current, minus 1
+        # because the first particle is the sun
+        nplanets = len(self.particlelist) - 1
+        sunradius = self.particlelist[0].radius
+        sunmass = self.particlelist[0].mass
+        # initial x position one more star radius away
+        # from the star than previous planet
+        xpos = sunradius*(nplanets + 2)
+        position = vp.vector(xpos, 0, 0)
+        # initial y velocity
+        print(f"G:{self.G}")
+        zvelocity = np.sqrt((self.G * sunmass)/vp.mag(position))
+        velocity = vp.vector(0, 0, zvelocity)
+        radius = 1
+        mass = 0.01
+        planet = self.add_planet(position, velocity, radius, mass)
+        self.update_render_mode()
+        self.select_planet(planet)
+        self.t_error.text = self.TEXTS['NOERROR']
+
+    def button_generate(self, b):
         """
-            Callback to the button that adds
-            a planet up to a maximum of 9 planets
+            Callback to the button that adds GENERATE_COUNT planets
+            around the sun with the chosen generator
         """
 
-        if len(self.particlelist) < self.NUM_PLANETS:
+        self.button_reset(0)
+        self.b_load.delete()
+        self.b_import.delete()
+
+        sun = self.particlelist[0]
+        generator = generators.PLANET_GENERATORS[self.m_generator.selected]
+        pos, vel, mass, radius = generator(self.GENERATE_COUNT, sun.mass,
+                                           self.G, seed=self.generate_seed)
+        self.add_planets(np.column_stack([pos + sun.position0.value,
+                                          vel + sun.velocity0.value,
+                                          radius, mass]))
+        self.update_render_mode()
+        self.t_error.text = self.TEXTS['NOERROR']
+
+    def winput_generate_count(self, w):
+        """
+            Callback to the text input that sets the number of
+            planets generated, only if a positive integer
+        """
 
-            self.button_reset(0)
-            self.b_load.delete()
+        if type(w.number) == int and w.number > 0:
+            self.GENERATE_COUNT = w.number
+            self.t_error.text = self.TEXTS['NOERROR']
+        else:
+            self.t_error.text = 'The number of bodies has to be a ' \
+                                'positive integer'
+
+    def winput_generate_seed(self, w):
+        """
+            Callback to the text input that sets the seed of the
+            generator, an empty input gives a new system every time
+        """
 
-            # get the number of current, minus 1
-            # because the first particle is the sun
-            nplanets = len(self.particlelist) - 1
-            sunradius = self.particlelist[0].radius
-            sunmass = self.particlelist[0].mass
-            # initial x position one more star radius away
-            # from the star than previous planet
-            xpos = sunradius*(nplanets + 2)
-            position = vp.vector(xpos, 0, 0)
-            # initial y velocity
-            print(f"G:{self.G}")
-            zvelocity = np.sqrt((self.G * sunmass)/vp.mag(position))
-            velocity = vp.vector(0, 0, zvelocity)
-            # the name of the planet always has the
-            # last character the planet index
-            indexplanet = nplanets + 1
-            radius = 1
-            mass = 0.01
-            self.add_planet(indexplanet, position, velocity,
-                            radius, mass)
+        if type(w.number) == int:
+            self.generate_seed = w.number
+            self.t_error.text = self.TEXTS['NOERROR']
+        elif w.text.strip() == '':
+            self.generate_seed = None
             self.t_error.text = self.TEXTS['NOERROR']
         else:
-            # deletes button if there are 9 planets
-            # already in the system
-            self.t_error.text = self.TEXTS['ERRORPLANET']
-            b.delete()
+            self.t_error.text = 'The seed has to be an integer'
+
+    def add_planet(self, position, velocity, radius, mass):
+        """
+            Function that adds a planet to the system
 
-    def add_planet(self, index, position, velocity, radius, mass):
-        """Function that adds a planet to the system"""
+            Returns:
+            the new planet
+        """
 
-        # creates the planet object
-        name = self.TEXTS['PLANET'] + str(index)
-        planet = particles.Planet(position=position,
+        number = self.next_number
+        self.next_number += 1
+        planet = particles.Planet(engine=self.engine,
+                                  position=position,
                                   radius=radius, mass=mass,
                                   velocity=velocity,
                                   color=vp.color.white,
                                   texture=vp.textures.earth,
-                                  name=name)
-
+                                  name=self.TEXTS['PLANET'] + str(number),
+                                  number=number,
+                                  model=False)
+        if not self.large_system():
+            self.build_model(planet, self.engine.world_pos, self.engine.mom)
         self.particlelist.append(planet)
-        vp.scene.append_to_caption('\n' + name + ' ')
-        # sets the text for the edit values controls
-        # each choice has the first 4 characters
-        # the variable and the last character the planet index
-        self.m_edit = vp.menu(choices=[self.TEXTS['CHOOSE'] + name,
-                                       self.TEXTS['XPOS'] + name,
-                                       self.TEXTS['YPOS'] + name,
-                                       self.TEXTS['ZPOS'] + name,
-                                       self.TEXTS['XVEL'] + name,
-                                       self.TEXTS['YVEL'] + name,
-                                       self.TEXTS['ZVEL'] + name,
-                                       self.TEXTS['RAD'] + name,
-                                       self.TEXTS['MASS'] + name,
-                                       ],
-                              bind=self.menu_edit)
-        v_edit = vp.winput(bind=self.set_value,
-                           prompt='',
-                           text='first choose the variable',
-                           disabled=True, visible=False)
-        self.veditlist.append(v_edit)
-        valstext = self.particlelist[index].get_valstext()
-        v_text = vp.wtext(text=valstext)
-        self.valslist.append(v_text)
+        self.planets[number] = planet
+        print('Created', planet.name)
+        return planet
+
+    def add_planets(self, allvals):
+        """
+            Adds many planets at once from rows of position, velocity,
+            radius and mass. The engine arrays grow once and no sphere
+            or control is made, update_render_mode then draws them
+        """
+
+        allvals = np.asarray(allvals, dtype=float).reshape(-1, 8)
+        indices = self.engine.add_bodies(allvals[:, 0:3], allvals[:, 3:6],
+                                         allvals[:, 7], allvals[:, 6])
+        for index, vals in zip(indices, allvals.tolist()):
+            number = self.next_number
+            self.next_number += 1
+            planet = particles.Planet(engine=self.engine,
+                                      position=vp.vector(*vals[0:3]),
+                                      radius=vals[6], mass=vals[7],
+                                      velocity=vp.vector(*vals[3:6]),
+                                      color=vp.color.white,
+                                      texture=vp.textures.earth,
+                                      name=self.TEXTS['PLANET'] + str(number),
+                                      number=number,
+                                      model=False, index=index)
+            self.particlelist.append(planet)
+            self.planets[number] = planet
+        print('Created', len(allvals), 'planets')
+
+    def select_planet(self, planet):
+        """Shows a planet in the editor"""
+
+        self.selected = planet
+        self.w_select.text = planet.number
+        self.t_values.text = planet.get_valstext()
+        self.m_edit.index = 0
+        self.w_edit.text = self.TEXTS['ERROREDIT']
+        self.w_edit.disabled = True
+
+    def winput_select(self, w):
+        """Callback to the text input that chooses the planet to edit"""
+
+        if type(w.number) == int and w.number in self.planets:
+            self.select_planet(self.planets[w.number])
+            self.t_error.text = self.TEXTS['NOERROR']
+        else:
+            self.t_error.text = self.TEXTS['ERRORNUMBER']
 
     def set_value(self, i):
         """
-            Set the value of a planet feature from the text input
+            Set the value of a feature of the selected
+            planet from the text input
         """
 
+        planet = self.selected
         # only set value if integer or float
-        if (type(i.number) == int) or (type(i.number) == float):
-            # the variable to set is given by
-            # the first characters of the prompt
-            var = i.prompt[:4]
-            # the index of the planet is given by
-            # the last character of the prompt
-            index = int(i.prompt[-1])
+        if (planet is not None and self.m_edit.index > 0 and
+           ((type(i.number) == int) or (type(i.number) == float))):
+            # the variable to set is given by the menu
+            var = self.EDIT_VARIABLES[self.m_edit.index - 1]
             # determines which value to set
-            if var == self.TEXTS['VAR_XPOS']:
+            if var == 'XPOS':
                 pos = vp.vector(i.number,
-                       self.particlelist[index].position0.y,
-                       self.particlelist[index].position0.z)
+                       planet.position0.y,
+                       planet.position0.z)
                 if vp.mag(pos) > 0:
-                    self.particlelist[index].position0.x = i.number
-            elif var == self.TEXTS['VAR_YPOS']:
-                pos = vp.vector(self.particlelist[index].position0.x,
+                    planet.position0.x = i.number
+            elif var == 'YPOS':
+                pos = vp.vector(planet.position0.x,
                        i.number,
-                       self.particlelist[index].position0.z)
+                       planet.position0.z)
                 if vp.mag(pos) > 0:
-                    self.particlelist[index].position0.y = i.number
-            elif var == self.TEXTS['VAR_ZPOS']:
-                pos = vp.vector(self.particlelist[index].position0.x,
-                       self.particlelist[index].position0.y,
+                    planet.position0.y = i.number
+            elif var == 'ZPOS':
+                pos = vp.vector(planet.position0.x,
+                       planet.position0.y,
                        i.number)
                 if vp.mag(pos) > 0:
-                    self.particlelist[index].position0.z = i.number
-            if var == self.TEXTS['VAR_XVEL']:
-                self.particlelist[index].velocity0.x = i.number
-            elif var == self.TEXTS['VAR_YVEL']:
-                self.particlelist[index].velocity0.y = i.number
-            elif var == self.TEXTS['VAR_ZVEL']:
-                self.particlelist[index].velocity0.z = i.number
-            elif var == self.TEXTS['VAR_RAD']:
-                self.particlelist[index].radius = i.number
-            elif var == self.TEXTS['VAR_MASS']:
+                    planet.position0.z = i.number
+            if var == 'XVEL':
+                planet.velocity0.x = i.number
+            elif var == 'YVEL':
+                planet.velocity0.y = i.number
+            elif var == 'ZVEL':
+                planet.velocity0.z = i.number
+            elif var == 'RAD':
+                planet.radius = i.number
+            elif var == 'MASS':
                 if i.number > 0:
-                    self.particlelist[index].mass = i.number
+                    planet.mass = i.number
             # reset simulation
             self.button_reset(0)
+            self.show_preview(planet)
 
-            valstext = self.particlelist[index].get_valstext()
-            self.valslist[index - 1].text = valstext
+            self.t_values.text = planet.get_valstext()
+
+    def show_preview(self, planet):
+        """
+            Predicts the orbits a few periods of the edited planet
+            ahead, drawn at once if this state was predicted before
+        """
+
+        paths = self.preview.predict(self.engine, planet.index)
+        if paths is not None:
+            self.draw_preview(paths)
+
+    def draw_preview(self, paths):
+        """Draws the predicted path of every planet with a sphere"""
+
+        for p in self.modelled_particles()[1:]:
+            if p.index >= paths.shape[1]:
+                continue
+            curve = self.preview_curves.get(p.number)
+            if curve is None:
+                curve = vp.curve(color=p.color, radius=0)
+                self.preview_curves[p.number] = curve
+            curve.clear()
+            curve.append([vp.vector(*point) for point in paths[:, p.index]])
+
+    def clear_preview(self):
+        """Stops the prediction and removes the predicted paths"""
+
+        self.preview.cancel()
+        for curve in self.preview_curves.values():
+            curve.visible = False
+        self.preview_curves = {}
 
     def menu_edit(self, m):
         """Sets the variable to edit with the text input"""
 
-        # the index of the planet is given by
-        # the last character of the selection
-        index = int(m.selected[-1])
-        if m.index > 0:
-            # the variable to set is given by
-            # the first 4 characters of the selection
-            var = m.selected[:4]
-            # set the prompt for the corresponding vedit to the selection
-            # the prompt[:4] then gives the variable to set
-            # and prompt[-1] then gives the planet index
-            self.veditlist[index - 1].prompt = m.selected
-            particle = self.particlelist[index]
-            if var == self.TEXTS['VAR_XPOS']:
-                self.veditlist[index - 1].text = particle.position0.x
-            elif var == self.TEXTS['VAR_YPOS']:
-                self.veditlist[index - 1].text = particle.position0.y
-            elif var == self.TEXTS['VAR_ZPOS']:
-                self.veditlist[index - 1].text = particle.position0.z
-            elif var == self.TEXTS['VAR_XVEL']:
-                self.veditlist[index - 1].text = particle.velocity0.x
-            elif var == self.TEXTS['VAR_YVEL']:
-                self.veditlist[index - 1].text = particle.velocity0.y
-            elif var == self.TEXTS['VAR_ZVEL']:
-                self.veditlist[index - 1].text = particle.velocity0.z
-            elif var == self.TEXTS['VAR_RAD']:
-                self.veditlist[index - 1].text = particle.radius
-            elif var == self.TEXTS['VAR_MASS']:
-                self.veditlist[index - 1].text = particle.mass
-            self.veditlist[index - 1].visible = True
+        planet = self.selected
+        if m.index > 0 and planet is not None:
+            # the variable to set is given by the selection
+            var = self.EDIT_VARIABLES[m.index - 1]
+            if var == 'XPOS':
+                self.w_edit.text = planet.position0.x
+            elif var == 'YPOS':
+                self.w_edit.text = planet.position0.y
+            elif var == 'ZPOS':
+                self.w_edit.text = planet.position0.z
+            elif var == 'XVEL':
+                self.w_edit.text = planet.velocity0.x
+            elif var == 'YVEL':
+                self.w_edit.text = planet.velocity0.y
+            elif var == 'ZVEL':
+                self.w_edit.text = planet.velocity0.z
+            elif var == 'RAD':
+                self.w_edit.text = planet.radius
+            elif var == 'MASS':
+                self.w_edit.text = planet.mass
+            self.w_edit.disabled = False
         else:
-            self.veditlist[index - 1].text = self.TEXTS['ERROREDIT']
+            self.w_edit.text = self.TEXTS['ERROREDIT']
+            self.w_edit.disabled = True
 
     def button_save(self, b):
-        """Callback to the button to save the solar system"""
+        """
+            Callback to the button to save the full live state
+            of the solar system to a binary checkpoint
+        """
+
+        try:
+            system_io.save_checkpoint(self.CHECKPOINT_FILE, self.engine)
+            self.t_error.text = self.TEXTS['SYSTEMSAVED']
+        except (OSError, ValueError):
+            self.t_error.text = ' ERROR: could not save system to ' + \
+                                self.CHECKPOINT_FILE
+
+    def button_load(self, b):
+        """
+            Callback to the button to load the solar system from a
+            binary checkpoint, the run continues where it was saved
+        """
+
+        try:
+            loaded = system_io.load_checkpoint(self.CHECKPOINT_FILE)
+        except (OSError, ValueError, KeyError):
+            self.t_error.text = ' ERROR: Could not load system from ' + \
+                                self.CHECKPOINT_FILE
+
+        else:
+            # only load the system once
+            b.delete()
+            self.b_import.delete()
+            self.t_error.text = self.TEXTS['NOERROR']
+
+            self.G = loaded.G
+            self.engine.G = loaded.G
+            self.w_big_g_text.text = self.TEXTS['CONSTANT'] + str(self.G)
+            self.engine.DELTA_TIME = loaded.DELTA_TIME
+            self.engine.solver = loaded.solver
+            self.engine.theta = loaded.theta
+            self.engine.grid = loaded.grid
+            self.engine.short_range = loaded.short_range
+            self.engine.softening = loaded.softening
+            # the loaded integrator keeps its state, e.g. the time step
+            # levels of the block time steps
+            self.engine.integrator = loaded.integrator
+            self.w_timestep.text = loaded.DELTA_TIME
+            self.m_integrator.selected = loaded.integrator.NAME
+            self.w_softening.text = loaded.softening
+            self.m_solver.selected = loaded.solver
+            self.w_theta.text = loaded.theta
+            self.w_grid.text = loaded.grid
+            self.c_short_range.checked = loaded.short_range
+
+            # the saved state becomes the initial conditions
+            sun = self.particlelist[0]
+            sun.position0 = vp.vector(*loaded.world_pos[0])
+            sun.velocity0 = vp.vector(*loaded.vel[0])
+            sun.mass = loaded.mass[0]
+            sun.radius = loaded.radius[0]
+            sun.reset_model()
+            self.add_planets(np.column_stack([loaded.world_pos, loaded.vel,
+                                              loaded.radius,
+                                              loaded.mass])[1:])
+            # float32 offsets from the saved origin, with their carry
+            self.engine.set_precision(loaded.precision, loaded.origin)
+            self.engine.since_recentre = loaded.since_recentre
+            if loaded._carry is not None:
+                self.engine._carry = loaded._carry.copy()
+            self.engine.time = loaded.time
+            self.restart_diagnostics()
+            self.update_render_mode()
+            for p in self.modelled_particles():
+                p.sync_model()
+
+    def button_export(self, b):
+        """
+            Callback to the button to export the initial
+            conditions of the planets to the csv system file
+        """
 
         vals = []
         for p in self.particlelist[1:]:
             vals.append(p.get_vals())
 
         try:
-            np.savetxt(self.SYSTEM_FILE, vals, delimiter=',')
+            system_io.save_csv(self.SYSTEM_FILE, vals)
             self.t_error.text = self.TEXTS['SYSTEMSAVED']
-        except:
+        except OSError:
             self.t_error.text = ' ERROR: could not save system to ' + \
                                 self.SYSTEM_FILE
 
-    def button_load(self, b):
-        """Callback to the button to load the solar system"""
+    def button_import(self, b):
+        """Callback to the button to import planets from the csv system file"""
 
         try:
-            allvals = np.genfromtxt(self.SYSTEM_FILE, delimiter=',')
-        except:
+            allvals = system_io.load_csv(self.SYSTEM_FILE)
+        except (OSError, ValueError):
             self.t_error.text = ' ERROR: Could not load system from ' + \
                                 self.SYSTEM_FILE
 
         else:
             # only load the system once
             b.delete()
+            self.b_load.delete()
             # reset the text error if we had one
             self.t_error.text = self.TEXTS['NOERROR']
 
-            for index, vals in enumerate(allvals):
-                position = vp.vector(vals[0], vals[1], vals[2])
-                velocity = vp.vector(vals[3], vals[4], vals[5])
-                radius = vals[6]
-                mass = vals[7]
-                self.add_planet(index + 1, position,
-                                velocity, radius, mass)
+            self.add_planets(allvals)
+            self.update_render_mode()
+
+    def checkbox_collisions(self, c):
+        """Callback to the checkbox that merges bodies that touch"""
 
-    def calculate_gforce(self, p1, p2):
+        if c.checked:
+            # merges come first so the other observers see merged bodies
+            self.engine.observers.insert(0, self.collisions)
+        elif self.collisions in self.engine.observers:
+            self.engine.observers.remove(self.collisions)
+
+    def apply_snapshot(self, snapshot):
+        """
+            Brings the particles and the drift graph up to a snapshot,
+            before it is drawn or the engine is changed
         """
-            Function that calculates the gravitational force
-            exerted on p1 by p2.
-            Modelled using euler cromer method.
-            Based on https://www.youtube.com/watch?v=4ycpvtIio-o
-            and https://www.glowscript.org/#/user/wlane/folder/Let'sCodePhysics/program/Solar-System-1/edit
 
-            Returns:
-            force vector
-        """
-        # Calculate the distance vectors between the two objects
-        r_vec = p1.particle_model.pos - p2.particle_model.pos
-        # Calculate magnitude of distance vector.
-        r_mag = vp.mag(r_vec)
-        # Calculate unit vector of distance vector.
-        r_hat = r_vec / r_mag
-        # Calculate force magnitude.
-        p1_mass = p1.particle_model.mass
-        p2_mass = p2.particle_model.mass
-        force_mag = self.G * p1_mass * p2_mass / r_mag ** 2
-        # Calculate force vector.
-        force_vec = -force_mag * r_hat
-        return force_vec
+        self.remove_merged(snapshot)
+        self.add_drift_samples(snapshot.samples)
+
+    def remove_merged(self, snapshot):
+        """
+            Removes the particles merged into others up to a snapshot
+            and gives the survivors their new index, mass and radius
+        """
+
+        index_map = snapshot.index_map
+        if index_map is None:
+            return
+        survivors = []
+        for p in self.particlelist:
+            index = index_map[p.index]
+            if index < 0:
+                p.remove_model()
+                del self.planets[p.number]
+                if self.selected is p:
+                    self.selected = None
+                    self.t_values.text = ''
+                continue
+            p.index = int(index)
+            p.mass = snapshot.mass[index]
+            p.radius = snapshot.radius[index]
+            if p.particle_model is not None:
+                p.particle_model.mass = p.mass
+                p.particle_model.radius = p.radius
+            survivors.append(p)
+        self.particlelist = survivors
+        focus = index_map[self.focus]
+        self.focus = int(focus) if focus >= 0 else 0
+        self.update_render_mode(snapshot)
+        if self.trajectory is not None and self.trajectory.ended:
+            with self.worker.paused():
+                self.stop_recording()
+        self.t_error.text = self.TEXTS['MERGED'] + str(self.collisions.merged)
+
+    def checkbox_diagnostics(self, c):
+        """
+            Callback to the checkbox that samples the drift of
+            the conserved quantities while running
+        """
+
+        if c.checked:
+            self.engine.observers.append(self.diagnostics)
+            self.restart_diagnostics()
+        elif self.diagnostics in self.engine.observers:
+            self.engine.observers.remove(self.diagnostics)
+            self.engine.track_potential = False
+
+    def winput_diagnostics_every(self, w):
+        """
+            Callback to the text input that sets the steps between
+            samples of the drift, only if a positive integer
+        """
+
+        if type(w.number) == int and w.number > 0:
+            self.diagnostics.interval = w.number
+            self.diagnostics.steps = 0
+            self.t_error.text = self.TEXTS['NOERROR']
+        else:
+            self.t_error.text = 'The steps between checks have to be a ' \
+                                'positive integer'
+
+    def checkbox_autopause(self, c):
+        """
+            Callback to the checkbox that stops the run when the
+            energy drift goes above the limit
+        """
+
+        self.diagnostics.threshold = self.DRIFT_LIMIT if c.checked else None
+
+    def winput_drift_limit(self, w):
+        """
+            Callback to the text input that sets the energy drift
+            that stops the run, only if a positive number
+        """
+
+        if type(w.number) in (int, float) and w.number > 0:
+            self.DRIFT_LIMIT = w.number
+            if self.c_autopause.checked:
+                self.diagnostics.threshold = w.number
+            self.diagnostics.tripped = False
+            self.t_error.text = self.TEXTS['NOERROR']
+        else:
+            self.t_error.text = 'The drift limit has to be a positive number'
+
+    def restart_diagnostics(self):
+        """Measures the drift from the current state on"""
+
+        self.diagnostics.reset()
+        self.diagnostics.take_samples()
+        self.diagnostics.sample(self.engine)
+        for quantity in diagnostics.QUANTITIES:
+            self.series_drift[quantity].clear()
+            self.plot_drift[quantity].delete()
+
+    def add_drift_samples(self, samples):
+        """
+            Adds the drift samples of the diagnostics to their series
+            and stops the run when the energy drift crossed the limit
+        """
+
+        for time, drift in samples:
+            for quantity in diagnostics.QUANTITIES:
+                self.series_drift[quantity].append(time, drift[quantity])
+            if drift.get('tripped') and self.running:
+                self.stop_simulation()
+                self.t_error.text = self.TEXTS['DRIFTPAUSED'].format(
+                    drift['energy'], self.diagnostics.threshold)
+
+    def checkbox_profile(self, c):
+        """
+            Callback to the checkbox that times the stages of every
+            frame and shows their breakdown below the controls
+        """
+
+        self.profiler.enabled = c.checked
+        if c.checked:
+            # forces are timed on the worker and sent with the snapshots
+            self.engine.timings = self.worker
+            self.profiled_frames = 0
+        else:
+            self.engine.timings = None
+            self.t_profile.text = ''
+
+    def show_profile(self):
+        """Shows the average timings once every SUMMARY frames"""
+
+        self.profiled_frames += 1
+        if self.profiled_frames >= self.profiler.SUMMARY:
+            self.profiled_frames = 0
+            summary = self.profiler.summary()
+            if summary:
+                self.t_profile.text = self.TEXTS['PROFILETEXT'].format(
+                    **summary)
+
+    def button_dump_profile(self, b):
+        """Callback to the button that writes the frame timings to a file"""
+
+        try:
+            self.profiler.dump(self.PROFILE_FILE)
+            self.t_error.text = ' Timings written to ' + self.PROFILE_FILE
+        except OSError:
+            self.t_error.text = ' ERROR: could not write ' + \
+                                self.PROFILE_FILE
+
+    def checkbox_autosave(self, c):
+        """
+            Callback to the checkbox that saves a checkpoint
+            every AUTO_CHECKPOINT_STEPS steps while running
+        """
+
+        if c.checked:
+            self.engine.observers.append(self.autosave)
+        elif self.autosave in self.engine.observers:
+            self.engine.observers.remove(self.autosave)
+
+    def set_plotted(self, number):
+        """Sets the number of the planet shown in the graphs"""
+
+        self.plotted = number
+        name = self.TEXTS['PLANET'] + str(number)
+        self.graph_force.title = name + self.TEXTS['FORCEGRAPH']
+        self.graph_distance.title = name + self.TEXTS['DISTANCEGRAPH']
+        self.clear_graphs()
+
+    def winput_plot(self, w):
+        """Callback to the text input that chooses the planet to plot"""
+
+        if type(w.number) == int and w.number in self.planets:
+            self.set_plotted(w.number)
+            self.t_error.text = self.TEXTS['NOERROR']
+        else:
+            self.t_error.text = self.TEXTS['ERRORNUMBER']
+
+    def clear_graphs(self):
+        """Removes every point from the graphs"""
+
+        self.series_force.clear()
+        self.series_distance.clear()
+        self.plot_force.delete()
+        self.plot_distance.delete()
+
+    def update_graphs(self, state):
+        """
+            Adds the force and distance of the plotted planet to the
+            series and redraws the graphs, with the drift graph, every
+            GRAPH_EVERY frames. The series are bounded, so a redraw
+            costs the same however long the simulation has run
+        """
+
+        planet = self.planets.get(self.plotted)
+        if planet is not None:
+            index = planet.index
+            displacement = state.pos[index] - state.pos[0]
+            self.series_force.append(state.time,
+                                     np.linalg.norm(state.force[index]))
+            self.series_distance.append(state.time,
+                                        np.linalg.norm(displacement))
+        self.frames += 1
+        if self.frames >= self.GRAPH_EVERY:
+            self.frames = 0
+            curves = [(self.plot_force, self.series_force),
+                      (self.plot_distance, self.series_distance)]
+            curves += [(self.plot_drift[quantity], self.series_drift[quantity])
+                       for quantity in diagnostics.QUANTITIES]
+            for plot, series in curves:
+                times, values = series.data()
+                plot.data = np.column_stack([times, values]).tolist()
+
+    def sync_views(self, snapshot):
+        """
+            Copies a snapshot of the engine to the scene:
+            the points, the spheres and arrows, and the graphs
+        """
+
+        if self.cloud is not None:
+            self.cloud.update(snapshot.pos)
+            self.update_detail(snapshot.pos, snapshot.mom)
+        models = self.modelled_particles()
+        for p1 in models:
+            p1.show(snapshot.pos[p1.index], snapshot.mom[p1.index])
+        self.update_arrows(models, snapshot)
+        self.profiler.lap('sync')
+
+        self.update_graphs(snapshot)
+        self.profiler.lap('graphs')
 
     def run(self):
         """Function to run the simulation"""
@@ -517,41 +1583,57 @@ class SolarSystem:
                                 emissive=True,
                                 texture=self.SKY['TEXTURE'])
         vp.scene.camera.follow(self.skybox)
+        self.worker.start()
 
         # infinite loop
         while True:
-            # if there are particles in the system set the skybox
-            if len(self.particlelist) > 0:
-                p_model = self.particlelist[self.focus].particle_model
-                self.skybox.pos = p_model.pos
-            self.skybox.radius = vp.mag(vp.scene.camera.axis) * 8
-
-            if self.running:
-                if len(self.particlelist) == 0:
-                    pass
+            self.profiler.start_frame()
+            steps = 0
+            # a frame applies and draws its snapshot in one go, widget
+            # callbacks wait for it and it waits for them
+            with self.scene_lock:
+                # if there are particles in the system set the skybox
+                if len(self.particlelist) > 0 and self.snapshot is not None:
+                    focus = self.particlelist[self.focus].index
+                    self.skybox.pos = vp.vector(*self.snapshot.pos[focus])
+                self.skybox.radius = vp.mag(vp.scene.camera.axis) * 8
+                self.profiler.lap('sync')
+
+                if self.player is not None:
+                    # replay mode, start/stop plays and pauses the recording
+                    if self.running:
+                        if self.player.advance(1 / self.FRAME_RATE):
+                            self.stop_simulation()
+                        self.s_replay.value = self.player.time
+                        self.show_replay_frame()
+                    elif self.replay_changed:
+                        self.show_replay_frame()
+                    self.profiler.lap('sync')
                 else:
-                    for p1 in self.particlelist:
-                        p1.totforce = vp.vector(0, 0, 0)
-                        for p2 in self.particlelist:
-                            if p1 != p2:
-                                p1.totforce += self.calculate_gforce(p1, p2)
-
-                        p1.particle_model.momentum += p1.totforce * self.DELTA_TIME
-
-                        p1.particle_model.pos += (p1.particle_model.momentum * self.DELTA_TIME) / p1.particle_model.mass
-
-                        p1.force_arrow.axis = (100*vp.mag(p1.totforce) + p1.particle_model.radius) * \
-                                              (p1.totforce / vp.mag(p1.totforce))
-                        p1.force_arrow.pos = p1.particle_model.pos
-
-                        self.update_velocity_arrow(p1)
-
-                    displacement = self.particlelist[1].particle_model.pos - self.particlelist[0].particle_model.pos
-                    self.plot_force.plot(self.time,
-                                         vp.mag(self.particlelist[1].totforce))
-                    self.plot_distance.plot(self.time,
-                                            vp.mag(displacement))
-
-
-                self.time += self.DELTA_TIME
-            vp.rate(24)
+                    # the worker advances the engine, only the latest
+                    # state it published is drawn
+                    error = self.worker.take_error()
+                    if error is not None:
+                        self.stop_simulation()
+                        self.t_error.text = ' ERROR: ' + error
+                    snapshot = self.worker.take_snapshot()
+                    if snapshot is not None:
+                        self.snapshot = snapshot
+                        steps = snapshot.steps
+                        self.profiler.add('physics', snapshot.physics)
+                        self.profiler.add('forces', snapshot.forces)
+                        self.apply_snapshot(snapshot)
+                        self.sync_views(snapshot)
+                    # the predicted orbits grow while they are calculated
+                    preview_paths = self.preview.take_paths()
+                    if preview_paths is not None:
+                        self.draw_preview(preview_paths[0])
+                    preview_error = self.preview.take_error()
+                    if preview_error is not None:
+                        self.t_error.text = self.TEXTS['PREVIEWERROR'] + \
+                            preview_error
+            vp.rate(self.FRAME_RATE)
+            self.profiler.lap('wait')
+            self.profiler.end_frame(steps)
+            if self.profiler.enabled:
+                self.show_profile()
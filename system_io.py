@@ -0,0 +1,201 @@
+import json
+import os
+import struct
+import numpy as np
+import engine
+
+# columns of the system file, one row per planet
+CSV_COLUMNS = ['x', 'y', 'z', 'vx', 'vy', 'vz', 'radius', 'mass']
+
+
+def load_csv(path):
+    """
+        Reads the planets of a system file saved by the SAVE SYSTEM button
+
+        Returns:
+        (N, 8) array with the position, velocity, radius and mass of each
+        planet, still two dimensional for a single planet
+    """
+
+    return np.genfromtxt(path, delimiter=',', ndmin=2)
+
+
+def save_csv(path, vals):
+    """Writes rows of position, velocity, radius and mass to a system file"""
+
+    np.savetxt(path, vals, delimiter=',')
+
+
+def engine_from_csv(path, sun_mass=None, sun_radius=None, **settings):
+    """
+        Builds an engine with the default sun at the origin
+        and the planets of a system file
+
+        Returns:
+        PhysicsEngine with the bodies added
+    """
+
+    system = engine.PhysicsEngine(**settings)
+    if sun_mass is None:
+        sun_mass = system.SUN['MASS']
+    if sun_radius is None:
+        sun_radius = system.SUN['RADIUS']
+    system.add_body([0, 0, 0], [0, 0, 0], sun_mass, sun_radius)
+    vals = load_csv(path)
+    system.add_bodies(vals[:, 0:3], vals[:, 3:6], vals[:, 7], vals[:, 6])
+    return system
+
+
+def save_state_csv(path, system):
+    """
+        Writes the current state of every body, the sun included,
+        with the time and G in the header
+    """
+
+    vals = np.column_stack([system.world_pos, system.vel,
+                            system.radius, system.mass])
+    header = 'time={}, G={}\n'.format(system.time, system.G) + \
+        ','.join(CSV_COLUMNS)
+    np.savetxt(path, vals, delimiter=',', header=header)
+
+
+CHECKPOINT_MAGIC = b'SSCK'
+# version 2 adds the float32 origin, carry and recentre count and the
+# state of the integrator, version 1 files still load without them
+CHECKPOINT_VERSION = 2
+# magic, version, length of the json metadata
+CHECKPOINT_HEADER = '<4sII'
+# arrays stored after the metadata, in this order
+CHECKPOINT_ARRAYS = [('pos', 3), ('mom', 3), ('mass', 1), ('radius', 1)]
+
+
+def extra_arrays(system):
+    """
+        State beyond the bodies that a run needs to resume exactly:
+        the rounding carried by the float32 drifts and the time step
+        levels of the block time steps
+
+        Returns:
+        dictionary of arrays by name, only the ones the system has
+    """
+
+    extra = {}
+    if system._carry is not None:
+        extra['carry'] = system._carry
+    levels = getattr(system.integrator, 'levels', None)
+    if levels is not None:
+        extra['levels'] = levels
+    return extra
+
+
+def save_checkpoint(path, system):
+    """
+        Writes the full live state to a binary checkpoint: every body
+        including the sun, the current positions and momenta, G, the time,
+        the integrator settings and the state a float32 run or the
+        integrator carries from step to step. The file is written next
+        to the old one and then renamed over it, so a crash never leaves
+        half a file
+    """
+
+    extra = extra_arrays(system)
+    metadata = {'nbodies': len(system), 'dtype': '<f8',
+                'time': system.time, 'G': system.G,
+                'dt': system.DELTA_TIME,
+                'integrator': system.integrator.NAME,
+                'solver': system.solver, 'theta': system.theta,
+                'softening': system.softening, 'grid': system.grid,
+                'short_range': system.short_range,
+                'precision': system.precision,
+                'origin': system.origin.tolist(),
+                'since_recentre': system.since_recentre,
+                'extra': [[name, 3 if values.ndim == 2 else 1]
+                          for name, values in extra.items()]}
+    text = json.dumps(metadata).encode()
+    # arrays start on an 8 byte boundary
+    header_size = struct.calcsize(CHECKPOINT_HEADER)
+    text = text.ljust(-(-(header_size + len(text)) // 8) * 8 - header_size)
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(struct.pack(CHECKPOINT_HEADER, CHECKPOINT_MAGIC,
+                            CHECKPOINT_VERSION, len(text)))
+        f.write(text)
+        for name, _ in CHECKPOINT_ARRAYS:
+            # positions are saved in the scene, not from the origin
+            values = system.world_pos if name == 'pos' else \
+                getattr(system, name)
+            f.write(np.ascontiguousarray(values, dtype='<f8').tobytes())
+        for values in extra.values():
+            f.write(np.ascontiguousarray(values, dtype='<f8').tobytes())
+    os.replace(temporary, path)
+
+
+def load_checkpoint(path):
+    """
+        Reads a binary checkpoint in one bulk read
+
+        Returns:
+        PhysicsEngine with the saved bodies, time and settings
+    """
+
+    with open(path, 'rb') as f:
+        data = f.read()
+    header_size = struct.calcsize(CHECKPOINT_HEADER)
+    magic, version, length = struct.unpack_from(CHECKPOINT_HEADER, data)
+    if magic != CHECKPOINT_MAGIC:
+        raise ValueError(path + ' is not a checkpoint file')
+    if version not in (1, CHECKPOINT_VERSION):
+        raise ValueError('unsupported checkpoint version ' + str(version))
+    metadata = json.loads(data[header_size:header_size + length])
+
+    system = engine.PhysicsEngine(G=metadata['G'], dt=metadata['dt'],
+                                  solver=metadata['solver'],
+                                  theta=metadata['theta'],
+                                  integrator=metadata['integrator'],
+                                  softening=metadata['softening'],
+                                  grid=metadata.get('grid'),
+                                  short_range=metadata.get('short_range'),
+                                  precision='float64')
+    n = metadata['nbodies']
+    offset = header_size + length
+    arrays = {}
+    for name, width in CHECKPOINT_ARRAYS + metadata.get('extra', []):
+        count = n * width
+        values = np.frombuffer(data, dtype=metadata['dtype'], count=count,
+                               offset=offset)
+        arrays[name] = values.reshape((n, 3) if width == 3 else n).copy()
+        offset += values.nbytes
+    system.set_state(arrays['pos'], arrays['mom'])
+    system.mass = arrays['mass']
+    system.radius = arrays['radius']
+    system.force = np.zeros((n, 3))
+    system.time = metadata['time']
+    # the saved world positions are read in float64 and only then
+    # converted, float32 offsets start from the saved origin, or from
+    # the centre of mass for older files
+    system.set_precision(metadata.get('precision') or
+                         engine.PhysicsEngine.PRECISION,
+                         metadata.get('origin'))
+    system.since_recentre = metadata.get('since_recentre', 0)
+    if 'carry' in arrays and system._carry is not None:
+        system._carry = arrays['carry'].astype(system.dtype)
+    if 'levels' in arrays and hasattr(system.integrator, 'levels'):
+        system.integrator.levels = arrays['levels'].astype(int)
+    return system
+
+
+class AutoCheckpoint:
+    """
+        Saves a checkpoint every few steps so a long run can be resumed
+        where it stopped. Add it to engine.observers to enable it
+    """
+
+    def __init__(self, path, every):
+        self.path = path
+        self.every = every
+        self.steps = 0
+
+    def after_step(self, system):
+        self.steps += 1
+        if self.steps % self.every == 0:
+            save_checkpoint(self.path, system)
@@ -0,0 +1,93 @@
+import numpy as np
+
+
+def minmax_downsample(times, values, nbins):
+    """
+        Splits the points into nbins consecutive groups and keeps
+        the lowest and highest point of every group, so peaks survive
+        the downsampling
+
+        Returns:
+        tuple of arrays (times, values) in time order
+    """
+
+    n = len(times)
+    if n <= 2 * nbins:
+        return times, values
+    group = np.arange(n) * nbins // n
+    order = np.lexsort((values, group))
+    # first and last point of every group in the sorted order
+    ends = np.searchsorted(group[order], np.arange(nbins), side='right')
+    starts = np.concatenate([[0], ends[:-1]])
+    keep = np.unique(np.concatenate([order[starts], order[ends - 1]]))
+    return times[keep], values[keep]
+
+
+class TimeSeries:
+    """
+        Bounded series of (time, value) points for a graph. The most
+        recent points are kept at full resolution in a ring buffer,
+        older points are kept as the minimum and maximum of each bucket
+        and thinned again when there are too many, so a run of any
+        length never holds more than about RECENT + HISTORY points
+    """
+
+    RECENT = 1000  # points kept at full resolution
+    HISTORY = 1000  # downsampled points kept of the older history
+    BUCKET = 20  # recent points that become one min/max pair
+
+    def __init__(self, recent=None, history=None, bucket=None):
+        self.recent = recent or self.RECENT
+        self.history = history or self.HISTORY
+        self.bucket = bucket or self.BUCKET
+        self.clear()
+
+    def __len__(self):
+        return self.count + len(self.old_times)
+
+    def clear(self):
+        """Removes every point"""
+
+        self.times = np.empty(self.recent)
+        self.values = np.empty(self.recent)
+        self.start = 0  # position of the oldest recent point in the ring
+        self.count = 0  # recent points in the ring
+        self.old_times = np.empty(0)
+        self.old_values = np.empty(0)
+
+    def append(self, time, value):
+        """Adds a point, moving the oldest bucket to the history if full"""
+
+        if self.count == self.recent:
+            self._evict()
+        index = (self.start + self.count) % self.recent
+        self.times[index] = time
+        self.values[index] = value
+        self.count += 1
+
+    def _evict(self):
+        """Turns the oldest bucket of recent points into history"""
+
+        size = min(self.bucket, self.count)
+        oldest = (self.start + np.arange(size)) % self.recent
+        times, values = minmax_downsample(self.times[oldest],
+                                          self.values[oldest], 1)
+        self.old_times = np.concatenate([self.old_times, times])
+        self.old_values = np.concatenate([self.old_values, values])
+        self.start = (self.start + size) % self.recent
+        self.count -= size
+        if len(self.old_times) > self.history:
+            # halve the history, a constant cost that is paid
+            # once every HISTORY / 2 evictions
+            self.old_times, self.old_values = minmax_downsample(
+                self.old_times, self.old_values, self.history // 4)
+
+    def data(self):
+        """
+            Returns:
+            tuple of arrays (times, values) of every point in time order
+        """
+
+        recent = (self.start + np.arange(self.count)) % self.recent
+        return (np.concatenate([self.old_times, self.times[recent]]),
+                np.concatenate([self.old_values, self.values[recent]]))
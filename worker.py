@@ -0,0 +1,240 @@
+import contextlib
+import threading
+import time
+import numpy as np
+
+
+class Snapshot:
+    """
+        Read-only copy of the state of the engine, published by the
+        physics worker for the render loop. If the render loop misses
+        snapshots, the next one carries the steps, timings, merges and
+        diagnostics samples of the ones it replaced
+    """
+
+    def __init__(self, engine, steps, physics, forces, index_map,
+                 samples=()):
+        self.time = engine.time
+        self.pos = read_only(engine.world_pos)
+        self.mom = read_only(engine.mom)
+        self.force = read_only(engine.force)
+        self.mass = read_only(engine.mass)
+        self.radius = read_only(engine.radius)
+        self.steps = steps  # steps since the last snapshot taken
+        self.physics = physics  # seconds spent stepping for those steps
+        self.forces = forces  # seconds of it spent on forces
+        # new index of every body of the last snapshot taken,
+        # -1 if merged, None if no bodies merged
+        self.index_map = index_map
+        self.samples = list(samples)  # (time, drift) of the diagnostics
+
+    def absorb(self, old):
+        """Takes over the steps, timings and merges of an older snapshot"""
+
+        self.steps += old.steps
+        self.samples = old.samples + self.samples
+        self.physics += old.physics
+        self.forces += old.forces
+        if old.index_map is not None and self.index_map is not None:
+            self.index_map = np.where(old.index_map >= 0,
+                                      self.index_map[old.index_map], -1)
+        elif old.index_map is not None:
+            self.index_map = old.index_map
+
+
+def read_only(array):
+    """
+        Returns:
+        copy of the array that cannot be written to
+    """
+
+    array = array.copy()
+    array.flags.writeable = False
+    return array
+
+
+class PhysicsWorker:
+    """
+        Advances the engine on a background thread, a frame of steps
+        decided by the scheduler at a time, FRAME_RATE times a second,
+        and publishes a snapshot after each frame. Anything else that
+        changes the engine does it inside paused(), which waits for the
+        step in progress to end and holds the worker between two steps
+    """
+
+    def __init__(self, engine, scheduler, frame_rate, collisions=None,
+                 diagnostics=None):
+        self.engine = engine
+        self.scheduler = scheduler
+        self.frame_rate = frame_rate
+        self.collisions = collisions
+        self.diagnostics = diagnostics
+        self.condition = threading.Condition()
+        self.running = False
+        self.stopped = False
+        self.stepping = False  # a step is in progress
+        self.pauses = 0  # paused() blocks entered and not left
+        self.snapshot = None  # latest snapshot not taken yet
+        self.force_time = 0.0
+        self.error = None  # message of the error that stopped stepping
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        """Ends the thread after the step in progress"""
+
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        self.thread.join()
+
+    def set_running(self, running):
+        """Starts or stops stepping, without ending the thread"""
+
+        with self.condition:
+            self.running = running
+            self.condition.notify_all()
+
+    @contextlib.contextmanager
+    def paused(self):
+        """
+            Holds the worker between two steps while the block runs,
+            so the block can change the engine safely. Can be nested
+        """
+
+        with self.condition:
+            self.pauses += 1
+            while self.stepping:
+                self.condition.wait()
+        try:
+            yield self.engine
+        finally:
+            with self.condition:
+                self.pauses -= 1
+                self.condition.notify_all()
+
+    @contextlib.contextmanager
+    def _between_pauses(self):
+        """
+            Waits for every pause to end and marks the engine as in use.
+            Yields False without waiting further if the worker is
+            stopped, e.g. by stop() called inside a paused() block
+        """
+
+        with self.condition:
+            while self.pauses and not self.stopped:
+                self.condition.wait()
+            if self.stopped:
+                free = False
+            else:
+                free = self.stepping = True
+        try:
+            yield free
+        finally:
+            if free:
+                with self.condition:
+                    self.stepping = False
+                    self.condition.notify_all()
+
+    def step(self):
+        """One step of the engine, run between two pauses"""
+
+        with self._between_pauses() as free:
+            if free:
+                self.engine.step()
+
+    def add(self, stage, seconds):
+        """Time the engine spent on forces, see engine.timings"""
+
+        self.force_time += seconds
+
+    def take_error(self):
+        """
+            Returns:
+            message of the error that stopped stepping, or None
+        """
+
+        with self.condition:
+            error, self.error = self.error, None
+        return error
+
+    def take_snapshot(self):
+        """
+            Returns:
+            the latest snapshot, or None if there is no new one
+        """
+
+        with self.condition:
+            snapshot, self.snapshot = self.snapshot, None
+        return snapshot
+
+    def current_snapshot(self):
+        """
+            Snapshot of the engine as it is now, with everything of the
+            snapshot not taken yet. Only call it inside paused()
+
+            Returns:
+            Snapshot
+        """
+
+        return self._snapshot(0, 0.0)
+
+    def _snapshot(self, steps, physics):
+        """Copies the state into a new snapshot, merged with an old one"""
+
+        index_map = None
+        if self.collisions is not None:
+            index_map = self.collisions.take_index_map()
+        samples = ()
+        if self.diagnostics is not None:
+            samples = self.diagnostics.take_samples()
+        snapshot = Snapshot(self.engine, steps, physics, self.force_time,
+                            index_map, samples)
+        self.force_time = 0.0
+        with self.condition:
+            if self.snapshot is not None:
+                snapshot.absorb(self.snapshot)
+                self.snapshot = None
+        return snapshot
+
+    def _publish(self, steps, physics):
+        """Publishes a snapshot for the render loop"""
+
+        with self._between_pauses() as free:
+            if not free:
+                return
+            snapshot = self._snapshot(steps, physics)
+            with self.condition:
+                self.snapshot = snapshot
+
+    def _run(self):
+        interval = 1 / self.frame_rate
+        next_frame = time.perf_counter()
+        while True:
+            with self.condition:
+                while not self.stopped and not self.running:
+                    self.condition.wait()
+                    next_frame = time.perf_counter()
+                if self.stopped:
+                    return
+            start = time.perf_counter()
+            try:
+                steps = self.scheduler.run_frame(self.engine, self.step)
+            except ValueError as error:
+                # e.g. a solver that cannot handle the system,
+                # stepping stops until it is started again
+                with self.condition:
+                    self.running = False
+                    self.error = str(error)
+                continue
+            self._publish(steps, time.perf_counter() - start)
+
+            # keep to the frame rate, without catching up on lost frames
+            next_frame += interval
+            delay = next_frame - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_frame = time.perf_counter()